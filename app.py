@@ -1,40 +1,43 @@
 import os
+from app.startup import elapsed, ensure_nltk_data
 from dotenv import load_dotenv
-from app import create_app, db
-import nltk
+from app import create_app
+from app.storage import init_db
 
 # Load environment variables from .env file
 load_dotenv()
 
-# --- NLTK Data Path Configuration ---
-# Ensure NLTK can find its data by adding a custom path.
-# This path should point to where 'vader_lexicon' and 'stopwords' will be downloaded.
-nltk_data_path = os.path.join(os.getcwd(), 'nltk_data')
-# Add the custom NLTK data path if it's not already in the list
-if nltk_data_path not in nltk.data.path:
-    nltk.data.path.append(nltk_data_path)
-    print(f"Added NLTK data path: {nltk_data_path}")
 
-# --- NLTK Data Download ---
-# Directly attempt to download resources. NLTK's download function
-# is designed to handle checking if resources exist and downloading if not.
-# It will print its own messages for success or failure to the console.
-print("Attempting to download NLTK 'vader_lexicon'...")
-nltk.download('vader_lexicon', download_dir=nltk_data_path, quiet=False)
+def bootstrap():
+    """
+    Checks the NLTK data, creates the app and brings its database up to date.
 
-print("Attempting to download NLTK 'stopwords'...")
-nltk.download('stopwords', download_dir=nltk_data_path, quiet=False)
+    Kept out of module level: scoring workers are started with 'spawn' and
+    import this module again as __mp_main__, and must not create their own
+    app, log writer or schema migration.
 
-# --- End NLTK Data Download ---
+    Returns:
+        Flask: The app, ready to serve.
+    """
+    # --- NLTK Data Configuration ---
+    # Ensure NLTK can find its data by adding a custom path.
+    # The bundled 'vader_lexicon' and 'stopwords' are checked on disk; nothing is
+    # downloaded unless a resource is missing (and never with NLTK_OFFLINE=1).
+    nltk_data_path = os.path.join(os.getcwd(), 'nltk_data')
+    ensure_nltk_data(nltk_data_path)
 
+    app = create_app()
 
-app = create_app()
+    with app.app_context():
+        # Create database tables if they don't exist and add any new columns
+        init_db()
+
+    print(f"App ready in {elapsed():.2f}s.")
+    return app
 
-with app.app_context():
-    # Create database tables if they don't exist
-    db.create_all()
 
 if __name__ == '__main__':
+    app = bootstrap()
     # Get the port from environment variables or default to 5000
     port = int(os.environ.get('PORT', 5000))
     # Run the Flask application
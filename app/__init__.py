@@ -1,9 +1,12 @@
 import os
+import sqlite3
 from flask import Flask
 from flask_caching import Cache
 from flask_cors import CORS
 from flask_sqlalchemy import SQLAlchemy
 from sqlalchemy import create_engine # Import create_engine
+from sqlalchemy import event
+from sqlalchemy.engine import Engine, make_url
 from sqlalchemy.orm import sessionmaker # Import sessionmaker
 
 # Initialize SQLAlchemy database object
@@ -11,6 +14,62 @@ db = SQLAlchemy()
 # Initialize Flask-Caching object
 cache = Cache()
 
+# --- SQLite Tuning ---
+# Applied to every new SQLite connection. WAL lets readers run concurrently
+# with the single writer instead of blocking behind it.
+SQLITE_PRAGMAS = {
+    'journal_mode': 'WAL',
+    # Safe with WAL and avoids an fsync on every commit
+    'synchronous': 'NORMAL',
+    # Wait for a lock instead of failing immediately (milliseconds)
+    'busy_timeout': int(os.getenv('SQLITE_BUSY_TIMEOUT', 5000)),
+    # Page cache size; negative values are in KiB
+    'cache_size': int(os.getenv('SQLITE_CACHE_SIZE', -64000)),
+    'temp_store': 'MEMORY',
+    # Enforce foreign keys so term counts are removed with their posts
+    'foreign_keys': 'ON',
+    # Memory-mapped I/O size in bytes
+    'mmap_size': int(os.getenv('SQLITE_MMAP_SIZE', 268435456)),
+}
+
+
+@event.listens_for(Engine, 'connect')
+def _set_sqlite_pragmas(dbapi_connection, connection_record):
+    """
+    Applies SQLITE_PRAGMAS to new SQLite connections.
+    """
+    if not isinstance(dbapi_connection, sqlite3.Connection):
+        return
+    cursor = dbapi_connection.cursor()
+    for pragma, value in SQLITE_PRAGMAS.items():
+        cursor.execute(f'PRAGMA {pragma}={value}')
+    cursor.close()
+
+
+def engine_options(database_url):
+    """
+    Returns SQLAlchemy engine options tuned for the given database URL.
+    """
+    url = make_url(database_url)
+    if url.get_backend_name() == 'sqlite' and url.database in (None, '', ':memory:'):
+        # In-memory databases live in a single connection; keep SQLAlchemy's defaults
+        return {}
+
+    options = {
+        'pool_size': int(os.getenv('DB_POOL_SIZE', 10)),
+        'max_overflow': int(os.getenv('DB_MAX_OVERFLOW', 20)),
+        'pool_timeout': int(os.getenv('DB_POOL_TIMEOUT', 30)),
+    }
+    if url.get_backend_name() == 'sqlite':
+        # Connections are shared between request and background threads
+        options['connect_args'] = {'check_same_thread': False}
+    else:
+        # Drop connections the server closed while they sat in the pool
+        options['pool_pre_ping'] = True
+        options['pool_recycle'] = int(os.getenv('DB_POOL_RECYCLE', 1800))
+    return options
+
+
 def create_app():
     # Create Flask application instance
     app = Flask(__name__, instance_relative_config=True)
@@ -23,6 +82,8 @@ def create_app():
     # Default to a local SQLite database if not set.
     database_url = os.getenv('SQLALCHEMY_DATABASE_URL', 'sqlite:///sentiments.db')
     app.config['SQLALCHEMY_DATABASE_URI'] = database_url
+    # Connection pool settings (SQLite connections also get SQLITE_PRAGMAS)
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = engine_options(database_url)
     # Disable SQLAlchemy event system to save memory
     app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
 
@@ -42,6 +103,58 @@ def create_app():
     # Initialize the cache with the Flask app
     cache.init_app(app)
 
+    # --- Response Cache Configuration ---
+    # In-process tier in front of the cache above (number of pages)
+    app.config['RESPONSE_CACHE_SIZE'] = int(os.getenv('RESPONSE_CACHE_SIZE', 256))
+    # Seconds an expired page may still be served while it is refreshed
+    app.config['RESPONSE_CACHE_STALE_TTL'] = int(os.getenv('RESPONSE_CACHE_STALE_TTL', 600))
+
+    from app.response_cache import response_cache
+    response_cache.init_app(app, backend=cache)
+
+    # --- Results API Configuration ---
+    # Posts per page of /results (and on the first page of /analyze)
+    app.config['API_PAGE_SIZE'] = int(os.getenv('API_PAGE_SIZE', 25))
+    # Largest 'page_size' a client may request
+    app.config['API_MAX_PAGE_SIZE'] = int(os.getenv('API_MAX_PAGE_SIZE', 100))
+    # Largest 'num_records' (posts analyzed per topic) a client may request
+    app.config['API_MAX_RECORDS'] = int(os.getenv('API_MAX_RECORDS', 1000))
+    # Signs chart URLs so that only charts this app issued are redrawn on a
+    # cache miss; set it when several processes serve the app, so each can
+    # redraw the charts the others issued
+    app.config['SECRET_KEY'] = os.getenv('SECRET_KEY') or os.urandom(32).hex()
+    # Most topics /compare accepts in one request
+    app.config['COMPARE_MAX_TOPICS'] = int(os.getenv('COMPARE_MAX_TOPICS', 20))
+
+    # --- Background Job Configuration ---
+    # Number of analysis jobs run at the same time
+    app.config['JOB_WORKERS'] = int(os.getenv('JOB_WORKERS', 2))
+    # Maximum number of queued or running jobs before submissions are rejected
+    app.config['JOB_MAX_PENDING'] = int(os.getenv('JOB_MAX_PENDING', 100))
+    # Seconds a finished job's results stay available
+    app.config['JOB_RETENTION'] = int(os.getenv('JOB_RETENTION', 3600))
+
+    from app.jobs import jobs
+    jobs.init_app(app)
+
+    # --- Logging Configuration ---
+    # Request IDs and one JSON record per request (see app/logger.py for the LOG_* settings)
+    from app import logger
+    logger.init_app(app)
+
+    # --- Metrics and Profiling Configuration ---
+    # Allow profiling single requests with the 'X-Profile' header
+    app.config['PROFILING_ENABLED'] = os.getenv('PROFILING_ENABLED', '').lower() in ('1', 'true', 'yes')
+    # Directory profiles are written to, defaults to instance/profiles
+    app.config['PROFILE_DIR'] = os.getenv('PROFILE_DIR')
+
+    from app import metrics
+    metrics.init_app(app)
+
+    # Report how long it took until the first request was served
+    from app.startup import install_first_request_timer
+    install_first_request_timer(app)
+
     # Import and register the sentiment blueprint
     from app.routes import sentiment_bp
     app.register_blueprint(sentiment_bp, url_prefix='/api/sentiment')
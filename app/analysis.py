@@ -1,48 +1,492 @@
+import atexit
+import hashlib
+import logging
+import multiprocessing
 import nltk
 import os
-from nltk.sentiment.vader import SentimentIntensityAnalyzer
+import pickle
+import threading
+import unicodedata
+from collections import OrderedDict
+from concurrent.futures import Future, ProcessPoolExecutor
+
+import numpy as np
+from nltk.sentiment.vader import SentimentIntensityAnalyzer, VaderConstants
+
+from app.metrics import record_cache, timed
+from app.results import SENTIMENT_LABELS, SentimentResults
 
 nltk.data.path.append(os.path.join(os.getcwd(), 'nltk_data'))
 
+# VADER lexicon shipped in the NLTK data directory
+LEXICON_RESOURCE = 'sentiment/vader_lexicon.zip'
+# Preparsed copy of the lexicon, written on first load so later starts
+# (and worker processes) skip unzipping and parsing the text file
+LEXICON_SNAPSHOT = os.getenv(
+    'VADER_LEXICON_SNAPSHOT',
+    os.path.join(os.getcwd(), 'nltk_data', 'sentiment', 'vader_lexicon.pickle')
+)
+
+# --- Scoring Engine Configuration ---
+# Batches with at most this many posts are scored in-process; anything larger
+# is split into chunks and fanned out to the worker pool.
+PARALLEL_THRESHOLD = int(os.getenv('SENTIMENT_PARALLEL_THRESHOLD', 500))
+# Number of posts sent to a worker in a single task
+CHUNK_SIZE = int(os.getenv('SENTIMENT_CHUNK_SIZE', 250))
+# Number of worker processes, defaults to one per core
+MAX_WORKERS = int(os.getenv('SENTIMENT_WORKERS', os.cpu_count() or 1))
+# Start method for worker processes. 'spawn' is safe to use from the
+# multi-threaded Flask server.
+MP_CONTEXT = os.getenv('SENTIMENT_MP_CONTEXT', 'spawn')
+
+# Maximum number of scores kept in the in-process LRU tier of the score cache
+SCORE_CACHE_SIZE = int(os.getenv('SENTIMENT_SCORE_CACHE_SIZE', 100000))
+# Number of hashes looked up in the persistent tier per query
+SCORE_CACHE_QUERY_BATCH = 500
+
+# VADER thresholds for the compound score:
+# compound score >= 0.05 is positive
+# compound score <= -0.05 is negative
+# otherwise, it's neutral.
+POSITIVE_THRESHOLD = 0.05
+NEGATIVE_THRESHOLD = -0.05
+# Reddit submission details copied from the input posts to the results
+POST_DETAIL_KEYS = ('id', 'url', 'created_utc')
+
+logger = logging.getLogger(__name__)
+
+
+# Analyzer used for in-process scoring, created on first use
+_sia = None
+_sia_lock = threading.Lock()
+
+# Process pool shared by all requests, created on first parallel batch
+_pool = None
+_pool_workers = 0
+_pool_lock = threading.Lock()
+# Analyzer kept warm inside each worker process
+_worker_sia = None
+
+
+def load_analyzer(snapshot_path=None):
+    """
+    Creates a SentimentIntensityAnalyzer, using the preparsed lexicon snapshot
+    when it is present and up to date.
+
+    Without a usable snapshot, the analyzer is built from the zipped lexicon
+    as usual and a new snapshot is written (if the directory is writable).
+
+    Args:
+        snapshot_path (str): Location of the snapshot. Defaults to LEXICON_SNAPSHOT.
+
+    Returns:
+        SentimentIntensityAnalyzer: The analyzer.
+    """
+    snapshot_path = snapshot_path or LEXICON_SNAPSHOT
+    pointer = nltk.data.find(LEXICON_RESOURCE)
+    # Zip resources resolve to a pointer into the archive rather than a path
+    lexicon_path = getattr(pointer, 'path', None) or pointer.zipfile.filename
+    try:
+        if os.path.getmtime(snapshot_path) >= os.path.getmtime(lexicon_path):
+            with open(snapshot_path, 'rb') as snapshot:
+                lexicon = pickle.load(snapshot)
+            # Skip __init__, which would re-read and re-parse the lexicon file
+            analyzer = SentimentIntensityAnalyzer.__new__(SentimentIntensityAnalyzer)
+            analyzer.lexicon = lexicon
+            analyzer.constants = VaderConstants()
+            return analyzer
+    except (OSError, pickle.UnpicklingError, EOFError):
+        pass
+
+    analyzer = SentimentIntensityAnalyzer()
+    try:
+        temp_path = f'{snapshot_path}.{os.getpid()}.tmp'
+        with open(temp_path, 'wb') as snapshot:
+            pickle.dump(analyzer.lexicon, snapshot, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(temp_path, snapshot_path)
+    except OSError as e:
+        logger.warning(f"Could not write VADER lexicon snapshot: {e}")
+    return analyzer
+
+
+def get_analyzer():
+    """
+    Returns the process-wide SentimentIntensityAnalyzer, loading it on first use.
+    """
+    global _sia
+    if _sia is None:
+        with _sia_lock:
+            if _sia is None:
+                _sia = load_analyzer()
+    return _sia
+
+
+def _init_worker(nltk_paths):
+    """
+    Initializes a worker process with its own SentimentIntensityAnalyzer so the
+    lexicon is loaded once per worker instead of once per task.
+    """
+    global _worker_sia
+    for path in nltk_paths:
+        if path not in nltk.data.path:
+            nltk.data.path.append(path)
+    _worker_sia = load_analyzer()
+
+
+def _score_chunk(texts):
+    """
+    Returns the VADER compound score of every text in the chunk.
+    """
+    analyzer = _worker_sia or get_analyzer()
+    return [analyzer.polarity_scores(text)['compound'] for text in texts]
+
+
+def get_pool(max_workers=None):
+    """
+    Returns the shared process pool, creating it (or resizing it) on demand.
+    """
+    global _pool, _pool_workers
+    max_workers = max_workers or MAX_WORKERS
+    with _pool_lock:
+        if _pool is None or _pool_workers != max_workers:
+            if _pool is not None:
+                _pool.shutdown(wait=False, cancel_futures=True)
+            _pool = ProcessPoolExecutor(
+                max_workers=max_workers,
+                mp_context=multiprocessing.get_context(MP_CONTEXT),
+                initializer=_init_worker,
+                initargs=(list(nltk.data.path),)
+            )
+            _pool_workers = max_workers
+        return _pool
+
+
+def shutdown_pool():
+    """
+    Shuts down the shared process pool, if one was started.
+    """
+    global _pool, _pool_workers
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(wait=True, cancel_futures=True)
+            _pool = None
+            _pool_workers = 0
+
+
+atexit.register(shutdown_pool)
+
+
+def score_texts(texts, parallel_threshold=None, chunk_size=None, max_workers=None):
+    """
+    Computes VADER compound scores for a batch of texts.
+
+    Small batches are scored in the calling thread. Batches larger than
+    `parallel_threshold` are split into chunks of `chunk_size` texts and
+    scored across the shared process pool.
+
+    Args:
+        texts (list): The texts to score.
+        parallel_threshold (int): Largest batch scored in-process.
+                                  Defaults to PARALLEL_THRESHOLD.
+        chunk_size (int): Texts per worker task. Defaults to CHUNK_SIZE.
+        max_workers (int): Size of the process pool. Defaults to MAX_WORKERS.
+
+    Returns:
+        numpy.ndarray: The compound scores, in input order.
+    """
+    texts = list(texts)
+    if parallel_threshold is None:
+        parallel_threshold = PARALLEL_THRESHOLD
+    chunk_size = chunk_size or CHUNK_SIZE
+    max_workers = max_workers or MAX_WORKERS
+
+    # A single worker can't beat the in-process path, so only fan out when
+    # there is both enough work and more than one core to spread it over.
+    if len(texts) <= parallel_threshold or max_workers < 2:
+        return np.array(_score_chunk(texts), dtype=np.float64)
+
+    chunks = [texts[i:i + chunk_size] for i in range(0, len(texts), chunk_size)]
+    pool = get_pool(max_workers)
+    scores = []
+    for chunk_scores in pool.map(_score_chunk, chunks):
+        scores.extend(chunk_scores)
+    return np.array(scores, dtype=np.float64)
+
+
+def submit_texts(texts, chunk_size=None, max_workers=None):
+    """
+    Queues a batch of texts for scoring on the shared process pool without
+    waiting for the result, so callers can overlap scoring with other work.
+
+    With a single worker the texts are scored in the calling thread and the
+    returned futures are already done.
+
+    Args:
+        texts (list): The texts to score.
+        chunk_size (int): Texts per worker task. Defaults to CHUNK_SIZE.
+        max_workers (int): Size of the process pool. Defaults to MAX_WORKERS.
+
+    Returns:
+        list: One future per chunk, each resolving to the chunk's compound
+              scores; concatenated in order they match `texts`.
+    """
+    texts = list(texts)
+    chunk_size = chunk_size or CHUNK_SIZE
+    max_workers = max_workers or MAX_WORKERS
+    chunks = [texts[i:i + chunk_size] for i in range(0, len(texts), chunk_size)]
+    if max_workers < 2:
+        futures = []
+        for chunk in chunks:
+            future = Future()
+            future.set_result(_score_chunk(chunk))
+            futures.append(future)
+        return futures
+    pool = get_pool(max_workers)
+    return [pool.submit(_score_chunk, chunk) for chunk in chunks]
+
+
+def classify_codes(scores):
+    """
+    Maps compound scores to label codes (indexes into SENTIMENT_LABELS)
+    using the VADER thresholds.
+
+    Args:
+        scores (array-like): VADER compound scores.
+
+    Returns:
+        numpy.ndarray: The int8 label code for each score.
+    """
+    scores = np.asarray(scores, dtype=np.float64)
+    # Label codes: 0 = NEGATIVE, 1 = NEUTRAL, 2 = POSITIVE
+    return 1 + (scores >= POSITIVE_THRESHOLD).astype(np.int8) - (scores <= NEGATIVE_THRESHOLD).astype(np.int8)
+
+
+def classify_scores(scores):
+    """
+    Maps compound scores to sentiment labels using the VADER thresholds.
+
+    Args:
+        scores (array-like): VADER compound scores.
+
+    Returns:
+        numpy.ndarray: The label for each score (POSITIVE/NEGATIVE/NEUTRAL).
+    """
+    return SENTIMENT_LABELS[classify_codes(scores)]
+
+
+def content_hash(text):
+    """
+    Returns the cache key for a piece of post content.
+
+    The text is Unicode-normalized and its whitespace collapsed before hashing.
+    VADER splits on whitespace, so this never changes the score, but case is
+    kept because VADER scores capitalized words differently.
+    """
+    normalized = ' '.join(unicodedata.normalize('NFC', text).split())
+    return hashlib.blake2b(normalized.encode('utf-8'), digest_size=16).hexdigest()
+
+
+class ScoreCache:
+    """
+    Content-addressed cache of VADER compound scores.
+
+    A bounded in-process LRU sits in front of the SentimentScoreCache table.
+    The table is only used while a Flask application context is active, so
+    the cache still works (memory tier only) outside of the app.
+    """
+
+    def __init__(self, maxsize=SCORE_CACHE_SIZE):
+        self.maxsize = maxsize
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.memory_hits = 0
+        self.store_hits = 0
+        self.misses = 0
+
+    def get_many(self, keys):
+        """
+        Looks up scores for a set of content hashes.
+
+        Args:
+            keys (iterable): Content hashes to look up.
+
+        Returns:
+            dict: The cached scores, keyed by content hash. Missing keys are absent.
+        """
+        found = {}
+        pending = []
+        with self._lock:
+            for key in keys:
+                if key in self._entries:
+                    self._entries.move_to_end(key)
+                    found[key] = self._entries[key]
+                else:
+                    pending.append(key)
+            self.memory_hits += len(found)
+
+        stored = self._load_from_store(pending) if pending else {}
+        if stored:
+            self._remember(stored)
+            found.update(stored)
+
+        with self._lock:
+            self.store_hits += len(stored)
+            self.misses += len(pending) - len(stored)
+        record_cache('score', len(found), len(pending) - len(stored))
+        return found
+
+    def put_many(self, scores):
+        """
+        Stores freshly computed scores in both tiers.
+
+        Args:
+            scores (dict): Compound scores keyed by content hash.
+        """
+        if not scores:
+            return
+        self._remember(scores)
+        self._save_to_store(scores)
+
+    def stats(self):
+        """
+        Returns the hit/miss counters and the current size of the memory tier.
+        """
+        with self._lock:
+            return {
+                "memory_hits": self.memory_hits,
+                "store_hits": self.store_hits,
+                "misses": self.misses,
+                "size": len(self._entries)
+            }
+
+    def clear(self):
+        """
+        Empties the memory tier and resets the counters.
+        The persistent tier is left untouched.
+        """
+        with self._lock:
+            self._entries.clear()
+            self.memory_hits = self.store_hits = self.misses = 0
+
+    def _remember(self, scores):
+        with self._lock:
+            for key, score in scores.items():
+                self._entries[key] = score
+                self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def _load_from_store(self, keys):
+        from flask import has_app_context
+        if not has_app_context():
+            return {}
+        from app.models import SentimentScoreCache
+
+        stored = {}
+        try:
+            for i in range(0, len(keys), SCORE_CACHE_QUERY_BATCH):
+                batch = keys[i:i + SCORE_CACHE_QUERY_BATCH]
+                rows = SentimentScoreCache.query.with_entities(
+                    SentimentScoreCache.content_hash, SentimentScoreCache.score
+                ).filter(SentimentScoreCache.content_hash.in_(batch)).all()
+                stored.update(rows)
+        except Exception as e:
+            logger.error(f"Error reading sentiment score cache: {e}")
+        return stored
+
+    def _save_to_store(self, scores):
+        from flask import has_app_context
+        if not has_app_context():
+            return
+        from app import db
+        from app.models import SentimentScoreCache
+        from app.storage import insert_ignore
+
+        # Written on a connection of its own, so the caller's pending session
+        # writes are neither committed nor rolled back with the cache rows
+        try:
+            with db.engine.begin() as connection:
+                insert_ignore(SentimentScoreCache, [
+                    {"content_hash": key, "score": score} for key, score in scores.items()
+                ], connection=connection)
+        except Exception as e:
+            logger.error(f"Error writing sentiment score cache: {e}")
 
-sia = SentimentIntensityAnalyzer()
 
-def analyze_sentiment(posts):
+# Score cache shared by all requests in this process
+score_cache = ScoreCache()
+
+
+def score_posts(texts, parallel_threshold=None, use_cache=True):
+    """
+    Computes compound scores for a batch of texts, scoring only cache misses.
+
+    Args:
+        texts (list): The texts to score.
+        parallel_threshold (int): Passed through to score_texts.
+        use_cache (bool): Whether to consult and fill the score cache.
+
+    Returns:
+        numpy.ndarray: The compound scores, in input order.
+    """
+    texts = list(texts)
+    if not use_cache:
+        return score_texts(texts, parallel_threshold=parallel_threshold)
+
+    keys = [content_hash(text) for text in texts]
+    cached = score_cache.get_many(set(keys))
+
+    # Score each distinct missing text once, even if it repeats in the batch
+    missing = {}
+    for key, text in zip(keys, texts):
+        if key not in cached and key not in missing:
+            missing[key] = text
+    if missing:
+        fresh = score_texts(list(missing.values()), parallel_threshold=parallel_threshold)
+        fresh = dict(zip(missing.keys(), fresh.tolist()))
+        score_cache.put_many(fresh)
+        cached.update(fresh)
+
+    return np.fromiter((cached[key] for key in keys), dtype=np.float64, count=len(keys))
+
+
+def analyze_sentiment(posts, parallel_threshold=None, use_cache=True):
     """
     Analyzes the sentiment of a list of text posts using NLTK's VADER.
 
     Args:
         posts (list): A list of dictionaries, where each dictionary has a
                       'content' key containing the text to analyze.
+        parallel_threshold (int): Largest batch scored in-process before
+                                  switching to the process pool.
+                                  Defaults to PARALLEL_THRESHOLD.
+        use_cache (bool): Whether to reuse cached scores for content that
+                          has been scored before. Defaults to True.
 
     Returns:
-        list: A list of dictionaries, each containing the original 'title'
-              and 'content', plus the calculated 'sentiment' (POSITIVE/NEGATIVE/NEUTRAL)
-              and 'score' (VADER compound score).
+        SentimentResults: The results in columnar form. Each item is a
+              dictionary-like view with the original 'title' and 'content'
+              (and 'id', 'url' and 'created_utc' when present), plus the
+              calculated 'sentiment' (POSITIVE/NEGATIVE/NEUTRAL) and 'score'
+              (VADER compound score).
     """
-    results = []
-    for post in posts:
-        # Get sentiment scores using VADER's polarity_scores method
+    posts = list(posts)
+    with timed('score'):
+        # Get sentiment scores for the whole batch at once, reusing cached ones
         # The 'compound' score is a normalized, weighted composite score.
-        sentiment_score = sia.polarity_scores(post['content'])['compound']
-        
-        # Classify sentiment based on the compound score
-        # VADER typically uses thresholds:
-        # compound score >= 0.05 is positive
-        # compound score <= -0.05 is negative
-        # otherwise, it's neutral.
-        if sentiment_score >= 0.05:
-            sentiment = "POSITIVE"
-        elif sentiment_score <= -0.05:
-            sentiment = "NEGATIVE"
-        else:
-            sentiment = "NEUTRAL" # Added Neutral sentiment for better classification
-        
-        # Append the analysis results to the list
-        results.append({
-            "title": post['title'],
-            "content": post['content'],
-            "sentiment": sentiment,
-            "score": sentiment_score
-        })
-    return results
+        scores = score_posts([post['content'] for post in posts], parallel_threshold=parallel_threshold, use_cache=use_cache)
+        codes = classify_codes(scores)
+
+    # Carry the Reddit submission details through for storage
+    details = {
+        key: [post.get(key) for post in posts]
+        for key in POST_DETAIL_KEYS
+        if any(key in post for post in posts)
+    }
+    return SentimentResults(
+        [post['title'] for post in posts],
+        scores,
+        codes,
+        content=[post['content'] for post in posts],
+        **details
+    )
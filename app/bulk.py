@@ -0,0 +1,336 @@
+"""
+Scores large offline dumps of Reddit posts with the same logic as the app.
+
+Usage (from the repository root):
+
+    python -m app.bulk posts.jsonl --database sqlite:///dump.db --topic archive
+    python -m app.bulk posts.jsonl --columnar scores/
+
+The input is JSON Lines with one submission (or comment) per line, as in
+the Reddit archive dumps: 'id', 'title', 'selftext' (or 'body' for
+comments), 'url' and 'created_utc' are read and other fields are ignored.
+The file is read in batches, so memory use depends on --batch-size rather
+than the size of the dump. Batches are scored across all cores, with the
+next batch being scored while the previous one is written.
+
+Results go either to a database through the SentimentAnalysis schema or
+to a directory of columnar .npz files (one per batch, with 'id',
+'created_utc', 'score' and 'sentiment' arrays). Progress is checkpointed
+after every written batch; running the same command again resumes after
+the last checkpoint. A checkpoint only applies to the input and output it
+was written for.
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from collections import deque
+from itertools import chain
+
+import numpy as np
+
+from app.analysis import MAX_WORKERS, classify_scores, submit_texts
+from app.tokens import PLACEHOLDER_CONTENT
+
+# Posts read, scored and written together
+DEFAULT_BATCH_SIZE = 10000
+# Batches being scored while the previous one is written
+SCORE_DEPTH = 2
+# Seconds between throughput reports
+REPORT_INTERVAL = 10.0
+
+
+def _to_post(record):
+    """
+    Maps a dump record to the post dictionary used by the pipeline.
+    """
+    content = record.get('selftext') or record.get('body') or PLACEHOLDER_CONTENT
+    created_utc = record.get('created_utc')
+    return {
+        'id': record.get('id'),
+        'title': record.get('title') or '',
+        'content': content,
+        'url': record.get('url'),
+        'created_utc': float(created_utc) if created_utc is not None else None
+    }
+
+
+def read_batches(path, batch_size=DEFAULT_BATCH_SIZE, offset=0):
+    """
+    Reads a JSON Lines dump in batches, starting at a byte offset.
+
+    Lines are read through the file's buffer one at a time, so at most one
+    batch of posts is held in memory. Blank and malformed lines are skipped.
+
+    Args:
+        path (str): The dump to read.
+        batch_size (int): Posts per batch.
+        offset (int): Byte offset to start at, e.g. from a checkpoint.
+
+    Yields:
+        tuple: (posts, end_offset, skipped) where end_offset is the byte
+               offset just past the batch and skipped the number of lines
+               that could not be read.
+    """
+    with open(path, 'rb') as dump:
+        dump.seek(offset)
+        posts = []
+        skipped = 0
+        for line in dump:
+            offset += len(line)
+            if not line.strip():
+                continue
+            try:
+                posts.append(_to_post(json.loads(line)))
+            except (ValueError, TypeError, AttributeError):
+                skipped += 1
+                continue
+            if len(posts) >= batch_size:
+                yield posts, offset, skipped
+                posts = []
+                skipped = 0
+        if posts or skipped:
+            yield posts, offset, skipped
+
+
+def score_batches(batches, max_workers=None, depth=SCORE_DEPTH):
+    """
+    Scores batches of posts on the shared process pool, keeping up to
+    `depth` batches queued so the workers stay busy while the caller
+    writes the previous batch.
+
+    Args:
+        batches (iterable): (posts, end_offset, skipped) tuples from read_batches.
+        max_workers (int): Size of the process pool. Defaults to MAX_WORKERS.
+        depth (int): Batches queued ahead of the caller.
+
+    Yields:
+        tuple: (results, end_offset, skipped) where results are
+               analyze_sentiment-style dictionaries, in input order.
+    """
+    pending = deque()
+
+    def collect(posts, futures, end_offset, skipped):
+        scores = np.fromiter(chain.from_iterable(future.result() for future in futures), dtype=np.float64, count=len(posts))
+        results = [
+            dict(post, sentiment=sentiment, score=score)
+            for post, sentiment, score in zip(posts, classify_scores(scores).tolist(), scores.tolist())
+        ]
+        return results, end_offset, skipped
+
+    for posts, end_offset, skipped in batches:
+        futures = submit_texts([post['content'] for post in posts], max_workers=max_workers)
+        pending.append((posts, futures, end_offset, skipped))
+        if len(pending) > depth:
+            yield collect(*pending.popleft())
+    while pending:
+        yield collect(*pending.popleft())
+
+
+class DatabaseWriter:
+    """
+    Saves results to a database through the app's SentimentAnalysis schema.
+    Re-writing a batch after a resume updates the same rows.
+    """
+
+    def __init__(self, database_url, topic):
+        # The app reads its database URL when it is created
+        os.environ['SQLALCHEMY_DATABASE_URL'] = database_url
+        from sqlalchemy.engine import make_url
+
+        from app import create_app, db
+        from app.storage import init_db, upsert_sentiment_results
+
+        self.topic = topic
+        # Identifies the output in checkpoints, without the password
+        self.target = {'database': make_url(database_url).render_as_string(hide_password=True), 'topic': topic}
+        self._db = db
+        self._upsert = upsert_sentiment_results
+        self._app = create_app()
+        self._context = self._app.app_context()
+        self._context.push()
+        init_db()
+
+    def reset(self):
+        # Re-written rows update the rows already stored
+        pass
+
+    def write(self, results, end_offset):
+        self._upsert(self.topic, results)
+        self._db.session.commit()
+
+    def close(self):
+        self._db.session.remove()
+        self._context.pop()
+
+
+class ColumnarWriter:
+    """
+    Saves each batch as a .npz file of column arrays, named by the batch's
+    end offset so a re-written batch replaces its earlier file.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.target = {'columnar': os.path.abspath(directory)}
+        os.makedirs(directory, exist_ok=True)
+
+    def reset(self):
+        """
+        Removes the parts written by earlier runs, so a restarted run does
+        not leave parts of a previous one next to its own.
+        """
+        for name in os.listdir(self.directory):
+            if name.startswith('part-') and name.endswith(('.npz', '.npz.tmp')):
+                os.remove(os.path.join(self.directory, name))
+
+    def write(self, results, end_offset):
+        path = os.path.join(self.directory, f'part-{end_offset:016d}.npz')
+        temp_path = f'{path}.tmp'
+        with open(temp_path, 'wb') as part:
+            np.savez(
+                part,
+                id=np.array([result['id'] or '' for result in results], dtype=str),
+                created_utc=np.array([result['created_utc'] if result['created_utc'] is not None else np.nan for result in results], dtype=np.float64),
+                score=np.array([result['score'] for result in results], dtype=np.float64),
+                sentiment=np.array([result['sentiment'] for result in results], dtype=str)
+            )
+        os.replace(temp_path, path)
+
+    def close(self):
+        pass
+
+
+def load_checkpoint(path, input_path, target=None):
+    """
+    Returns the saved progress for `input_path` written to `target` (the
+    writer's output), or a fresh start if there is no checkpoint or it
+    belongs to another input or output.
+    """
+    try:
+        with open(path) as checkpoint_file:
+            checkpoint = json.load(checkpoint_file)
+    except (OSError, ValueError):
+        checkpoint = None
+    if not checkpoint or checkpoint.get('input') != os.path.abspath(input_path) or checkpoint.get('target') != target:
+        return {'input': os.path.abspath(input_path), 'target': target, 'offset': 0, 'posts': 0, 'skipped': 0}
+    return checkpoint
+
+
+def save_checkpoint(path, checkpoint):
+    """
+    Writes a checkpoint atomically, so an interruption leaves the previous one intact.
+    """
+    temp_path = f'{path}.tmp'
+    with open(temp_path, 'w') as checkpoint_file:
+        json.dump(checkpoint, checkpoint_file)
+    os.replace(temp_path, path)
+
+
+def run_bulk(input_path, writer, checkpoint_path, batch_size=DEFAULT_BATCH_SIZE, max_workers=None, restart=False, report=None):
+    """
+    Scores a dump and writes the results, resuming from a checkpoint.
+
+    Args:
+        input_path (str): The JSON Lines dump.
+        writer: A DatabaseWriter or ColumnarWriter.
+        checkpoint_path (str): Where progress is saved after each batch.
+        batch_size (int): Posts per batch.
+        max_workers (int): Size of the process pool. Defaults to MAX_WORKERS.
+        restart (bool): Ignore an existing checkpoint, discard the writer's
+                        earlier output and start over.
+        report (callable): Called with a progress dictionary every
+                           REPORT_INTERVAL seconds and once at the end.
+
+    Returns:
+        dict: Posts and skipped lines in total, posts scored by this run,
+              its duration and its throughput in posts per second.
+    """
+    checkpoint = load_checkpoint(checkpoint_path, input_path, writer.target)
+    if restart:
+        checkpoint.update(offset=0, posts=0, skipped=0)
+        writer.reset()
+
+    started = time.perf_counter()
+    last_report = started
+    scored = 0
+
+    def progress():
+        elapsed = time.perf_counter() - started
+        return {
+            'posts': checkpoint['posts'],
+            'skipped': checkpoint['skipped'],
+            'offset': checkpoint['offset'],
+            'scored_this_run': scored,
+            'elapsed_s': round(elapsed, 3),
+            'posts_per_s': round(scored / elapsed, 1) if elapsed else None
+        }
+
+    try:
+        batches = read_batches(input_path, batch_size, checkpoint['offset'])
+        for results, end_offset, skipped in score_batches(batches, max_workers or MAX_WORKERS):
+            if results:
+                writer.write(results, end_offset)
+            scored += len(results)
+            checkpoint.update(
+                offset=end_offset,
+                posts=checkpoint['posts'] + len(results),
+                skipped=checkpoint['skipped'] + skipped
+            )
+            save_checkpoint(checkpoint_path, checkpoint)
+            if report and time.perf_counter() - last_report >= REPORT_INTERVAL:
+                last_report = time.perf_counter()
+                report(progress())
+    finally:
+        writer.close()
+
+    summary = progress()
+    if report:
+        report(summary)
+    return summary
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('input', help='JSON Lines dump of Reddit posts')
+    output = parser.add_mutually_exclusive_group(required=True)
+    output.add_argument('--database', help='SQLAlchemy database URL to save results to')
+    output.add_argument('--columnar', help='directory to write .npz column files to')
+    parser.add_argument('--topic', help='topic the posts are saved under (required with --database)')
+    parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE, help='posts per batch')
+    parser.add_argument('--workers', type=int, default=MAX_WORKERS, help='scoring processes')
+    parser.add_argument('--checkpoint', help='progress file (defaults to <input>.checkpoint.json)')
+    parser.add_argument('--restart', action='store_true', help='ignore the checkpoint and start over')
+    args = parser.parse_args(argv)
+
+    if args.database and not args.topic:
+        parser.error('--topic is required with --database')
+
+    from app.startup import ensure_nltk_data
+    ensure_nltk_data(os.path.join(os.getcwd(), 'nltk_data'))
+
+    writer = DatabaseWriter(args.database, args.topic) if args.database else ColumnarWriter(args.columnar)
+
+    def report(progress):
+        print(
+            f"{progress['posts']} posts ({progress['skipped']} skipped), "
+            f"{progress['posts_per_s'] or 0:.0f} posts/s",
+            file=sys.stderr
+        )
+
+    summary = run_bulk(
+        args.input,
+        writer,
+        args.checkpoint or f'{args.input}.checkpoint.json',
+        batch_size=args.batch_size,
+        max_workers=args.workers,
+        restart=args.restart,
+        report=report
+    )
+    print(json.dumps(summary))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,49 +1,432 @@
+import contextvars
+import heapq
+import logging
 import os
-import praw # Python Reddit API Wrapper
+import queue
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from contextlib import contextmanager
+from functools import partial
+
 from dotenv import load_dotenv # For loading environment variables
 
 # Load environment variables from .env file (if not already loaded by app.py)
 load_dotenv()
 
-def fetch_reddit_data(topic, limit=10):
+# --- Reddit Client Configuration ---
+# Maximum number of PRAW clients (and HTTP sessions) kept per process
+CLIENT_POOL_SIZE = int(os.getenv('REDDIT_CLIENT_POOL_SIZE', 4))
+# Number of searches run at the same time by fetch_from_subreddits and fetch_topics
+FETCH_MAX_WORKERS = int(os.getenv('REDDIT_FETCH_WORKERS', 4))
+# Requests left in the rate-limit window at which fetching pauses until reset
+RATE_LIMIT_RESERVE = int(os.getenv('REDDIT_RATE_LIMIT_RESERVE', 5))
+# Comma-separated subreddits searched for each topic; all of Reddit when empty
+SUBREDDITS = [name.strip() for name in os.getenv('REDDIT_SUBREDDITS', '').split(',') if name.strip()]
+
+# --- Comment Fetching Configuration ---
+# Number of submissions whose comment trees are expanded at the same time
+COMMENT_FETCH_WORKERS = int(os.getenv('REDDIT_COMMENT_WORKERS', 4))
+# Most comments read per submission
+COMMENT_LIMIT = int(os.getenv('REDDIT_COMMENT_LIMIT', 200))
+# Seconds spent expanding "load more comments" links per submission
+COMMENT_TIME_BUDGET = float(os.getenv('REDDIT_COMMENT_TIME_BUDGET', 10))
+
+logger = logging.getLogger(__name__)
+
+
+def _in_context(func):
+    """
+    Wraps `func` to run in a copy of the caller's context, so work handed
+    to pool threads is still attributed to the caller's request in logs.
+    """
+    context = contextvars.copy_context()
+
+    def run(*args):
+        # A context can only be entered by one thread at a time
+        return context.copy().run(func, *args)
+    return run
+
+
+def create_reddit_client(**overrides):
+    """
+    Creates a read-only PRAW Reddit instance with credentials from environment variables.
+
+    Setting REDDIT_OAUTH_URL and REDDIT_URL points the client at another
+    Reddit-compatible API, such as a local fake server used in tests.
+
+    Args:
+        **overrides: Extra keyword arguments passed to praw.Reddit.
+
+    Returns:
+        praw.Reddit: The configured client.
+    """
+    # PRAW is imported on first use to keep app startup fast
+    import praw # Python Reddit API Wrapper
+
+    settings = {
+        'client_id': os.getenv('REDDIT_CLIENT_ID'),
+        'client_secret': os.getenv('REDDIT_CLIENT_SECRET'),
+        'user_agent': os.getenv('REDDIT_USER_AGENT'),
+        'check_for_updates': False
+    }
+    if os.getenv('REDDIT_OAUTH_URL'):
+        settings['oauth_url'] = os.getenv('REDDIT_OAUTH_URL')
+    if os.getenv('REDDIT_URL'):
+        settings['reddit_url'] = os.getenv('REDDIT_URL')
+    settings.update(overrides)
+
+    reddit = praw.Reddit(**settings)
+    # Set Reddit instance to read-only mode for safety and performance
+    reddit.read_only = True
+    return reddit
+
+
+class RedditClientPool:
+    """
+    Process-wide pool of PRAW clients.
+
+    PRAW clients are not thread-safe, so each one is lent to a single thread
+    at a time. Returned clients keep their HTTP session and OAuth token, so
+    later fetches reuse open connections instead of re-authenticating.
+    """
+
+    def __init__(self, size=CLIENT_POOL_SIZE, factory=create_reddit_client):
+        self.size = size
+        self.factory = factory
+        self._idle = queue.LifoQueue()
+        self._created = 0
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def borrow(self, timeout=None):
+        """
+        Lends a client to the caller for the duration of the `with` block.
+        A new client is created only if none are idle and the pool is not full.
+        """
+        try:
+            client = self._idle.get_nowait()
+        except queue.Empty:
+            with self._lock:
+                create = self._created < self.size
+                if create:
+                    self._created += 1
+            if create:
+                try:
+                    client = self.factory()
+                except Exception:
+                    with self._lock:
+                        self._created -= 1
+                    raise
+            else:
+                client = self._idle.get(timeout=timeout)
+        try:
+            yield client
+        finally:
+            self._idle.put(client)
+
+
+class RateLimiter:
+    """
+    Rate-limit state shared by every pooled client.
+
+    Reddit reports the remaining requests and the seconds until the window
+    resets in its X-Ratelimit-* headers, which PRAW exposes as `auth.limits`.
+    When the remaining budget drops to the reserve, callers wait for the reset.
+    """
+
+    def __init__(self, reserve=RATE_LIMIT_RESERVE):
+        self.reserve = reserve
+        self.remaining = None
+        self.reset_timestamp = None
+        self._lock = threading.Lock()
+
+    def update(self, reddit):
+        """
+        Records the limits reported with the client's most recent response.
+        """
+        limits = reddit.auth.limits
+        if limits.get('remaining') is None:
+            return
+        with self._lock:
+            self.remaining = limits['remaining']
+            self.reset_timestamp = limits.get('reset_timestamp')
+
+    def wait(self):
+        """
+        Blocks until the rate-limit window resets if the budget is used up.
+        """
+        with self._lock:
+            if self.remaining is None or self.remaining > self.reserve or not self.reset_timestamp:
+                return
+            delay = self.reset_timestamp - time.time()
+        if delay > 0:
+            logger.warning(f"Reddit rate limit nearly exhausted, waiting {delay:.1f}s")
+            time.sleep(delay)
+
+
+_client_pool = None
+_rate_limiter = RateLimiter()
+_pool_lock = threading.Lock()
+
+
+def get_client_pool():
+    """
+    Returns the process-wide Reddit client pool, creating it on first use.
+    """
+    global _client_pool
+    with _pool_lock:
+        if _client_pool is None:
+            _client_pool = RedditClientPool()
+        return _client_pool
+
+
+def configure_client_pool(size=CLIENT_POOL_SIZE, factory=create_reddit_client):
+    """
+    Replaces the process-wide Reddit client pool, e.g. to change its size or
+    point it at a different API endpoint.
+    """
+    global _client_pool
+    with _pool_lock:
+        _client_pool = RedditClientPool(size=size, factory=factory)
+        return _client_pool
+
+
+def _search(reddit, topic, limit, subreddit_name):
+    """
+    Yields post dictionaries for a search, respecting the shared rate limit.
+    """
+    subreddit = reddit.subreddit(subreddit_name)
+    _rate_limiter.wait()
+    # Search for submissions within the subreddit
+    # Using 'new' sort and 'all' time_filter to get recent relevant posts
+    for submission in subreddit.search(topic, sort='new', time_filter='all', limit=limit):
+        _rate_limiter.update(reddit)
+        yield {
+            'id': submission.id,
+            'title': submission.title,
+
+            'content': submission.selftext or 'No Content Available',
+            'url': submission.url,
+            'created_utc': submission.created_utc
+        }
+        _rate_limiter.wait()
+
+
+def iter_reddit_data(topic, limit=10, subreddit='all', on_error=None):
+    """
+    Lazily fetches Reddit posts based on a given topic.
+
+    Posts are yielded one at a time as PRAW paginates through the search
+    results, so callers can start processing the first page while later
+    pages are still being requested.
+
+    Args:
+        topic (str): The search query for Reddit posts.
+        limit (int): The maximum number of posts to fetch. Defaults to 10.
+        subreddit (str): The subreddit to search. Defaults to 'all'.
+        on_error (callable): Called with the exception if fetching fails, so
+                             callers can tell a failed fetch from one that
+                             found no posts.
+
+    Yields:
+        dict: A post with 'id', 'title', 'content', 'url' and 'created_utc' keys.
+              Iteration stops early if an error occurs.
+    """
+    try:
+        with get_client_pool().borrow() as reddit:
+            yield from _search(reddit, topic, limit, subreddit)
+    except Exception as e:
+        logger.error(f"Error fetching data from Reddit: {e}")
+        if on_error:
+            on_error(e)
+
+
+def fetch_reddit_data(topic, limit=10, stream=False, on_error=None):
     """
     Fetches Reddit posts based on a given topic.
 
+    Searches all of Reddit, or only the subreddits listed in REDDIT_SUBREDDITS
+    when it is set (see fetch_from_subreddits).
+
     Args:
         topic (str): The search query for Reddit posts.
         limit (int): The maximum number of posts to fetch. Defaults to 10.
+        stream (bool): If True, return a generator that yields posts as they
+                       are fetched instead of a list. Defaults to False.
+        on_error (callable): Called with the exception if fetching fails.
 
     Returns:
         list: A list of dictionaries, where each dictionary represents a post
-              with 'title', 'content', and 'url' keys.
-              Returns an empty list if an error occurs.
+              with 'id', 'title', 'content', 'url' and 'created_utc' keys.
+              Returns the posts fetched so far if an error occurs.
     """
-    try:
-        # Initialize PRAW Reddit instance with credentials from environment variables
-        reddit = praw.Reddit(
-            client_id=os.getenv('REDDIT_CLIENT_ID'),
-            client_secret=os.getenv('REDDIT_CLIENT_SECRET'),
-            user_agent=os.getenv('REDDIT_USER_AGENT')
-        )
-        # Set Reddit instance to read-only mode for safety and performance
-        reddit.read_only = True
-
-        posts = []
-        # Access the 'all' subreddit (or a specific subreddit if needed)
-        subreddit = reddit.subreddit('all')
-
-        # Search for submissions within the subreddit
-        # Using 'new' sort and 'all' time_filter to get recent relevant posts
-        for submission in subreddit.search(topic, sort='new', time_filter='all', limit=limit):
-            # Append post details to the list
-            posts.append({
-                'title': submission.title,
-                
-                'content': submission.selftext or 'No Content Available',
-                'url': submission.url
-            })
+    if SUBREDDITS:
+        # The subreddit results are merged and sorted, so they arrive all at once
+        posts = fetch_from_subreddits(topic, SUBREDDITS, limit, on_error=on_error)
+        return iter(posts) if stream else posts
+    posts = iter_reddit_data(topic, limit, on_error=on_error)
+    if stream:
         return posts
-    except Exception as e:
-        
-        print(f"Error fetching data from Reddit: {e}")
-        return [] # Return empty list on error
+    return list(posts)
+
+
+def fetch_from_subreddits(topic, subreddits, limit=10, max_workers=None, on_error=None):
+    """
+    Searches several subreddits for a topic concurrently.
+
+    Each subreddit is searched on its own pooled client. Results are merged,
+    de-duplicated by submission ID (crossposts found in several subreddits
+    are kept once) and ordered newest first.
+
+    Args:
+        topic (str): The search query for Reddit posts.
+        subreddits (list): Names of the subreddits to search.
+        limit (int): The maximum number of posts to return. Defaults to 10.
+        max_workers (int): Number of concurrent searches. Defaults to FETCH_MAX_WORKERS.
+        on_error (callable): Called with the exception of each failed search.
+
+    Returns:
+        list: Post dictionaries as returned by fetch_reddit_data.
+    """
+    if not subreddits:
+        return []
+
+    def search_one(name):
+        return list(iter_reddit_data(topic, limit, subreddit=name, on_error=on_error))
+
+    workers = min(max_workers or FETCH_MAX_WORKERS, len(subreddits))
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='reddit-fetch') as executor:
+        results = list(executor.map(_in_context(search_one), subreddits))
+
+    merged = {}
+    for posts in results:
+        for post in posts:
+            merged.setdefault(post['id'], post)
+    posts = sorted(merged.values(), key=lambda post: post['created_utc'], reverse=True)
+    return posts[:limit]
+
+
+def fetch_topics(topics, limit=10, max_workers=None, on_error=None, filter_posts=None):
+    """
+    Searches for several topics concurrently.
+
+    Each topic is searched on its own pooled client, so the total time is
+    close to that of the slowest search rather than the sum of all of them.
+
+    Args:
+        topics (list): The search queries.
+        limit (int): The maximum number of posts per topic. Defaults to 10.
+        max_workers (int): Number of concurrent searches. Defaults to FETCH_MAX_WORKERS.
+        on_error (callable): Called as on_error(topic, exception) for each
+                             topic whose search failed.
+        filter_posts (callable): Called as filter_posts(topic, posts) with the
+                                 stream of a topic's posts, in its worker, and
+                                 returns the posts to keep; stopping early
+                                 stops fetching pages.
+
+    Returns:
+        dict: The posts found for each topic, as returned by fetch_reddit_data.
+    """
+    if not topics:
+        return {}
+
+    def search_one(topic):
+        posts = fetch_reddit_data(topic, limit, stream=True, on_error=partial(on_error, topic) if on_error else None)
+        if filter_posts:
+            posts = filter_posts(topic, posts)
+        return list(posts)
+
+    workers = min(max_workers or FETCH_MAX_WORKERS, len(topics))
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='reddit-fetch') as executor:
+        return dict(zip(topics, executor.map(_in_context(search_one), topics)))
+
+
+def _comment_tree(reddit, submission_id, max_comments, time_budget):
+    """
+    Reads up to `max_comments` comments of a submission.
+
+    The comments returned with the submission are read first. "Load more
+    comments" stubs are then expanded largest first, one request each,
+    until the comment budget is reached or `time_budget` seconds have
+    passed; whatever is left unexpanded is skipped.
+    """
+    from praw.models import MoreComments
+
+    deadline = time.monotonic() + time_budget
+    submission = reddit.submission(id=submission_id)
+    _rate_limiter.wait()
+    pending = deque(submission.comments)
+    _rate_limiter.update(reddit)
+
+    comments = []
+    stubs = []
+    while True:
+        # Breadth first, so top-level comments are read before deep replies
+        while pending and len(comments) < max_comments:
+            item = pending.popleft()
+            if isinstance(item, MoreComments):
+                item.submission = submission
+                heapq.heappush(stubs, item)
+            else:
+                comments.append(item)
+                pending.extend(item.replies)
+        if not stubs or len(comments) >= max_comments or time.monotonic() >= deadline:
+            break
+        _rate_limiter.wait()
+        pending.extend(heapq.heappop(stubs).comments())
+        _rate_limiter.update(reddit)
+
+    return [
+        {
+            'id': comment.id,
+            'submission_id': submission_id,
+            # Fullname of the parent: 't3_<id>' for top-level comments, 't1_<id>' for replies
+            'parent_id': comment.parent_id,
+            'content': comment.body,
+            'created_utc': comment.created_utc
+        }
+        for comment in comments
+    ]
+
+
+def fetch_comments(submission_ids, max_comments=None, time_budget=None, max_workers=None):
+    """
+    Fetches the comment trees of several submissions concurrently.
+
+    Each submission is read on its own pooled client, at most `max_workers`
+    at a time, within a per-submission comment and time budget. Comments
+    are yielded as each submission finishes, so callers can start scoring
+    before the slowest tree has been expanded.
+
+    Args:
+        submission_ids (list): Reddit IDs of the submissions.
+        max_comments (int): Most comments per submission. Defaults to COMMENT_LIMIT.
+        time_budget (float): Seconds spent expanding each submission's
+                             "load more comments" links. Defaults to COMMENT_TIME_BUDGET.
+        max_workers (int): Concurrent submissions. Defaults to COMMENT_FETCH_WORKERS.
+
+    Yields:
+        dict: A comment with 'id', 'submission_id', 'parent_id', 'content'
+              and 'created_utc' keys. Submissions that fail are skipped.
+    """
+    if not submission_ids:
+        return
+    max_comments = max_comments or COMMENT_LIMIT
+    time_budget = COMMENT_TIME_BUDGET if time_budget is None else time_budget
+
+    def read_one(submission_id):
+        with get_client_pool().borrow() as reddit:
+            return _comment_tree(reddit, submission_id, max_comments, time_budget)
+
+    workers = min(max_workers or COMMENT_FETCH_WORKERS, len(submission_ids))
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='reddit-comments') as executor:
+        futures = {executor.submit(_in_context(read_one), submission_id): submission_id for submission_id in submission_ids}
+        for future in as_completed(futures):
+            try:
+                comments = future.result()
+            except Exception as e:
+                logger.error(f"Error fetching comments for submission {futures[future]}: {e}")
+                continue
+            yield from comments
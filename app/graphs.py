@@ -1,66 +1,141 @@
-import os
-import matplotlib
-import seaborn as sns
-from wordcloud import WordCloud
 import base64
+import hashlib
+import logging
+import os
+import threading
+from collections import Counter, OrderedDict
 from io import BytesIO
-from collections import Counter
-import re
-import matplotlib.pyplot as plt
-from flask import current_app
-import nltk 
-matplotlib.use('Agg')
 
-def create_directory(path):
+from app import cache, tokens
+from app.metrics import record_cache, timed
+from app.results import SentimentResults
+
+# Number of rendered images kept in memory, keyed by a hash of their inputs
+GRAPH_CACHE_SIZE = int(os.getenv('GRAPH_CACHE_SIZE', 128))
+# Seconds a published chart can be fetched by its URL from the shared cache
+CHART_CACHE_TIMEOUT = int(os.getenv('CHART_CACHE_TIMEOUT', 86400))
+# Order in which sentiment bars are drawn
+SENTIMENT_ORDER = ('POSITIVE', 'NEUTRAL', 'NEGATIVE')
+
+logger = logging.getLogger(__name__)
+
+_image_cache = OrderedDict()
+_image_cache_lock = threading.Lock()
+
+
+def _cache_key(kind, *parts):
     """
-    Creates a directory if it does not already exist.
+    Returns a content hash identifying an image by its kind and inputs.
     """
-    if not os.path.exists(path):
-        os.makedirs(path)
-        print(f"Created directory: {path}")
-    else:
-        print(f"Directory already exists: {path}")
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(kind.encode('utf-8'))
+    for part in parts:
+        digest.update(b'\0')
+        digest.update(repr(part).encode('utf-8'))
+    return digest.hexdigest()
 
 
-def generate_graphs(sentiment_results, topic):
+def _cached_render(key, render):
     """
-    Generates a sentiment count bar chart and a word cloud from sentiment analysis results.
-    The generated images are saved to static files and then encoded to base64.
+    Returns the cached base64 image for `key`, rendering and storing it on a miss.
+    """
+    with _image_cache_lock:
+        if key in _image_cache:
+            _image_cache.move_to_end(key)
+            record_cache('graph', 1, 0)
+            return _image_cache[key]
+
+    record_cache('graph', 0, 1)
+    with timed('render_chart'):
+        image_b64 = render()
+
+    with _image_cache_lock:
+        # If another thread rendered the same image meanwhile, keep its copy
+        image_b64 = _image_cache.setdefault(key, image_b64)
+        _image_cache.move_to_end(key)
+        while len(_image_cache) > GRAPH_CACHE_SIZE:
+            _image_cache.popitem(last=False)
+    return image_b64
+
+
+def clear_graph_cache():
+    """
+    Empties the rendered image cache.
+    """
+    with _image_cache_lock:
+        _image_cache.clear()
+
+
+def publish_chart(image_b64):
+    """
+    Stores a rendered chart in the shared cache so it can be served from its
+    own URL, keyed by a hash of the PNG bytes.
+
+    The same image always gets the same key, so browsers can cache chart
+    URLs indefinitely. Requires an app context.
 
     Args:
-        sentiment_results (list): A list of dictionaries, each containing
-                                  'sentiment', 'score', and 'content' keys.
-        topic (str): The topic for which the analysis was performed, used in chart titles.
+        image_b64 (str): The base64 encoded PNG, as returned by generate_graphs.
 
     Returns:
-        tuple: A tuple containing two base64 encoded strings:
-               (bar_chart_base64, word_cloud_base64).
-               word_cloud_base64 might be None if no content is available.
+        str: The content hash, or None if there is no image.
     """
-    # Extract sentiment labels from the results
-    sentiments = [result['sentiment'] for result in sentiment_results]
-    
-    # Count the occurrences of each sentiment
-    sentiment_counts = Counter(sentiments)
-    sentiment_labels = list(sentiment_counts.keys())
-    sentiment_values = list(sentiment_counts.values())
+    if image_b64 is None:
+        return None
+    png = base64.b64decode(image_b64)
+    digest = hashlib.blake2b(png, digest_size=16).hexdigest()
+    cache.set(f'chart:{digest}', png, timeout=CHART_CACHE_TIMEOUT)
+    return digest
+
+
+def load_chart(digest):
+    """
+    Returns the PNG bytes published under a content hash, or None if unknown or expired.
+    """
+    return cache.get(f'chart:{digest}')
+
+
+def _encode_png(save):
+    """
+    Calls `save` with an in-memory buffer and returns the PNG it wrote as base64.
+    """
+    buffer = BytesIO()
+    save(buffer)
+    return base64.b64encode(buffer.getvalue()).decode('utf-8')
 
-    # Define paths for saving images
-    images_dir = os.path.join(current_app.instance_path, 'static', 'images')
-    create_directory(images_dir)
 
-    bar_chart_path = os.path.join(images_dir, 'sentiment_bar_chart.png')
-    word_chart_path = os.path.join(images_dir, "word_cloud.png")
+def render_bar_chart(sentiment_counts, topic):
+    """
+    Renders the sentiment count bar chart.
+
+    Uses a standalone Figure rather than the global pyplot state, so
+    concurrent requests can render at the same time.
+
+    Args:
+        sentiment_counts (list): (sentiment, count) pairs in drawing order.
+        topic (str): The topic used in the chart title.
+
+    Returns:
+        str: The base64 encoded PNG.
+    """
+    # Plotting libraries are imported on first use to keep app startup fast
+    import seaborn as sns
+    from matplotlib.figure import Figure
+
+    sentiment_labels = [label for label, _ in sentiment_counts]
+    sentiment_values = [count for _, count in sentiment_counts]
 
     # Bar Chart (Sentiment Counts)
-    plt.figure(figsize=(10, 6))
+    fig = Figure(figsize=(10, 6))
+    ax = fig.add_subplot()
     # Create a bar plot of sentiment counts
-    ax = sns.barplot(x=sentiment_labels, y=sentiment_values, palette='viridis') # Changed palette to 'viridis'
-    plt.title(f'Distribution of Sentiments for Reddit Posts on "{topic}"', fontsize=16)
-    plt.xlabel('Sentiment Category', fontsize=14)
-    plt.ylabel('Number of Posts', fontsize=14)
-    plt.xticks(rotation=45, ha='right')
-    plt.tight_layout()
+    sns.barplot(x=sentiment_labels, y=sentiment_values, hue=sentiment_labels, palette='viridis', legend=False, ax=ax)
+    ax.set_title(f'Distribution of Sentiments for Reddit Posts on "{topic}"', fontsize=16)
+    ax.set_xlabel('Sentiment Category', fontsize=14)
+    ax.set_ylabel('Number of Posts', fontsize=14)
+    ax.tick_params(axis='x', labelrotation=45)
+    for label in ax.get_xticklabels():
+        label.set_horizontalalignment('right')
 
     # Add count labels on top of each bar
     for p in ax.patches:
@@ -68,41 +143,138 @@ def generate_graphs(sentiment_results, topic):
                     (p.get_x() + p.get_width() / 2, p.get_height()),
                     ha="center", va="center", fontsize=10, color='black',
                     xytext=(0, 5), textcoords='offset points')
-    
-    plt.grid(True, linestyle='--', alpha=0.7)
-    plt.savefig(bar_chart_path)
-    plt.close()
 
-    bar_image_b64 = encode_image_to_base64(bar_chart_path)
+    ax.grid(True, linestyle='--', alpha=0.7)
+    fig.tight_layout()
+    return _encode_png(lambda buffer: fig.savefig(buffer, format='png'))
 
-    # --- Generate Word Cloud for Most Frequent Words ---
-    text = ' '.join([result['content'] for result in sentiment_results if result['content'] and result['content'] != 'No Content Available'])
 
-    text = re.sub(r'[^A-Za-z\s]', "", text.lower())
-    words = text.split()
-    
-    # Filter out common English stop words and single-character words
-    stop_words = set(nltk.corpus.stopwords.words('english'))
-    filtered_words = [word for word in words if word.isalpha() and word not in stop_words and len(word) > 2]
+def render_comparison_chart(topic_counts):
+    """
+    Renders the share of each sentiment per topic as grouped bars.
 
-    word_counts = Counter(filtered_words)
+    Shares rather than counts are drawn, so topics with different numbers
+    of posts can be compared directly.
 
-    word_cloud_b64 = None
+    Args:
+        topic_counts (list): (topic, {sentiment: count}) pairs in drawing order.
 
-    if word_counts:
-        wordcloud = WordCloud(width=800, height=400, background_color='white', max_words=200, colormap='viridis').generate_from_frequencies(word_counts)
-        wordcloud.to_file(word_chart_path)
-        word_cloud_b64 = encode_image_to_base64(word_chart_path)
-    else:
-        print("⚠️ Word cloud skipped: No meaningful words found in the content.")
-    
-    return bar_image_b64, word_cloud_b64
+    Returns:
+        str: The base64 encoded PNG.
+    """
+    import seaborn as sns
+    from matplotlib.figure import Figure
+
+    topics, sentiments, shares = [], [], []
+    for topic, counts in topic_counts:
+        total = sum(counts.values()) or 1
+        for label in SENTIMENT_ORDER:
+            topics.append(topic)
+            sentiments.append(label)
+            shares.append(100 * counts.get(label, 0) / total)
+
+    fig = Figure(figsize=(max(10, 1.2 * len(topic_counts)), 6))
+    ax = fig.add_subplot()
+    sns.barplot(x=topics, y=shares, hue=sentiments, hue_order=SENTIMENT_ORDER, palette='viridis', ax=ax)
+    ax.set_title('Sentiment of Reddit Posts by Topic', fontsize=16)
+    ax.set_xlabel('Topic', fontsize=14)
+    ax.set_ylabel('Share of Posts (%)', fontsize=14)
+    ax.tick_params(axis='x', labelrotation=45)
+    for label in ax.get_xticklabels():
+        label.set_horizontalalignment('right')
+    ax.legend(title='Sentiment')
+    ax.grid(True, linestyle='--', alpha=0.7)
+    fig.tight_layout()
+    return _encode_png(lambda buffer: fig.savefig(buffer, format='png'))
+
+
+def generate_comparison_chart(topic_counts):
+    """
+    Returns the comparison chart for several topics' sentiment counts,
+    rendering it only if the same counts were not drawn before.
+
+    Args:
+        topic_counts (list): (topic, {sentiment: count}) pairs in drawing order.
+
+    Returns:
+        str: The base64 encoded PNG.
+    """
+    return _cached_render(
+        _cache_key('comparison', [(topic, sorted(counts.items())) for topic, counts in topic_counts]),
+        lambda: render_comparison_chart(topic_counts)
+    )
+
+
+def render_word_cloud(word_counts):
+    """
+    Renders a word cloud from word frequencies.
+
+    Args:
+        word_counts (dict): Word frequencies.
 
+    Returns:
+        str: The base64 encoded PNG.
+    """
+    from wordcloud import WordCloud
+
+    # A fixed random_state makes the layout, and so the image, depend only on the inputs
+    wordcloud = WordCloud(width=800, height=400, background_color='white', max_words=200, colormap='viridis', random_state=42).generate_from_frequencies(word_counts)
+    return _encode_png(lambda buffer: wordcloud.to_image().save(buffer, format='PNG'))
 
-def encode_image_to_base64(image_path):
+
+def count_words(sentiment_results):
     """
-    Encodes an image file to a base64 string.
+    Counts the meaningful words across the content of the results.
     """
-    with open(image_path, 'rb') as img_file:
-        img_b64 = base64.b64encode(img_file.read()).decode('utf-8')
-    return img_b64
\ No newline at end of file
+    if isinstance(sentiment_results, SentimentResults):
+        return tokens.count_words(sentiment_results.content)
+    return tokens.count_words(result['content'] for result in sentiment_results)
+
+
+def generate_graphs(sentiment_results, topic, word_counts=None):
+    """
+    Generates a sentiment count bar chart and a word cloud from sentiment analysis results.
+    The images are rendered in memory and encoded to base64. Rendered images
+    are cached by a hash of their inputs, so identical results skip rendering.
+
+    Args:
+        sentiment_results (SentimentResults or list): The results, or a list of
+                                  dictionaries with 'sentiment', 'score', and 'content' keys.
+        topic (str): The topic for which the analysis was performed, used in chart titles.
+        word_counts (dict): Precomputed word frequencies for the word cloud,
+                            e.g. from storage.aggregate_term_counts. If None,
+                            they are counted from the results' content.
+
+    Returns:
+        tuple: A tuple containing two base64 encoded strings:
+               (bar_chart_base64, word_cloud_base64).
+               word_cloud_base64 might be None if no content is available.
+    """
+    # Count the occurrences of each sentiment
+    if isinstance(sentiment_results, SentimentResults):
+        counts = Counter(sentiment_results.sentiment_counts())
+    else:
+        counts = Counter(result['sentiment'] for result in sentiment_results)
+    sentiment_counts = [(label, counts[label]) for label in SENTIMENT_ORDER if counts[label]]
+    sentiment_counts += sorted((label, count) for label, count in counts.items() if label not in SENTIMENT_ORDER)
+
+    bar_image_b64 = _cached_render(
+        _cache_key('bar', topic, sentiment_counts),
+        lambda: render_bar_chart(sentiment_counts, topic)
+    )
+
+    # --- Generate Word Cloud for Most Frequent Words ---
+    if word_counts is None:
+        word_counts = count_words(sentiment_results)
+
+    word_cloud_b64 = None
+
+    if word_counts:
+        word_cloud_b64 = _cached_render(
+            _cache_key('wordcloud', sorted(word_counts.items())),
+            lambda: render_word_cloud(word_counts)
+        )
+    else:
+        logger.info("Word cloud skipped: no meaningful words found in the content.")
+
+    return bar_image_b64, word_cloud_b64
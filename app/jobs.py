@@ -0,0 +1,166 @@
+import logging
+import threading
+import time
+import uuid
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+from app.graphs import publish_chart
+from app.pipeline import analyze_topic, render_charts
+
+logger = logging.getLogger(__name__)
+
+
+class JobQueueFull(Exception):
+    """
+    Raised when a job is submitted while the maximum number of jobs is pending.
+    """
+
+
+class Job:
+    """
+    A sentiment analysis run for one topic and limit, executed in the background.
+    """
+
+    def __init__(self, topic, limit):
+        self.id = uuid.uuid4().hex
+        self.topic = topic
+        self.limit = limit
+        # One of 'queued', 'running', 'completed' or 'failed'
+        self.status = 'queued'
+        self.processed = 0
+        self.result = None
+        self.error = None
+        self.created_at = time.time()
+        self.finished_at = None
+        self._lock = threading.Lock()
+
+    def update_progress(self, processed, total):
+        with self._lock:
+            self.processed = processed
+
+    def to_dict(self):
+        """
+        Returns the job's status, progress and (once completed) results.
+        """
+        with self._lock:
+            return {
+                "job_id": self.id,
+                "topic": self.topic,
+                "limit": self.limit,
+                "status": self.status,
+                "progress": {
+                    "processed": self.processed,
+                    "total": self.limit
+                },
+                "result": self.result,
+                "error": self.error
+            }
+
+
+class JobManager:
+    """
+    Runs analysis jobs on a bounded pool of background threads.
+
+    Submitting a topic and limit that already has a queued or running job
+    returns that job instead of starting a second one.
+    """
+
+    def __init__(self, app=None):
+        self._app = None
+        self._executor = None
+        self._jobs = {}
+        self._in_flight = {}
+        self._lock = threading.Lock()
+        self.max_workers = 2
+        self.max_pending = 100
+        self.retention = 3600
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        """
+        Configures the manager from the app's JOB_* settings.
+        """
+        self._app = app
+        self.max_workers = app.config.get('JOB_WORKERS', self.max_workers)
+        self.max_pending = app.config.get('JOB_MAX_PENDING', self.max_pending)
+        self.retention = app.config.get('JOB_RETENTION', self.retention)
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+        self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='analysis-job')
+
+    def submit(self, topic, limit):
+        """
+        Queues an analysis job, or returns the in-flight job for the same topic and limit.
+
+        Raises:
+            JobQueueFull: If max_pending jobs are already queued or running.
+        """
+        key = (topic, limit)
+        with self._lock:
+            self._prune()
+            job = self._in_flight.get(key)
+            if job is not None:
+                return job
+            if len(self._in_flight) >= self.max_pending:
+                raise JobQueueFull(f"{self.max_pending} analysis jobs are already pending.")
+
+            job = Job(topic, limit)
+            self._jobs[job.id] = job
+            self._in_flight[key] = job
+        self._executor.submit(self._run, job, key)
+        return job
+
+    def get(self, job_id):
+        """
+        Returns the job with the given ID, or None if it is unknown or expired.
+        """
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def _run(self, job, key):
+        with job._lock:
+            job.status = 'running'
+        try:
+            with self._app.app_context():
+                sentiment_results, source = analyze_topic(job.topic, job.limit, on_progress=job.update_progress)
+                bar_chart_b64, word_cloud_b64 = (None, None)
+                if sentiment_results:
+                    bar_chart_b64, word_cloud_b64 = render_charts(job.topic, job.limit, sentiment_results)
+                # Only the content hashes are kept; the images are served from /charts
+                charts = {"bar_chart": publish_chart(bar_chart_b64), "word_cloud": publish_chart(word_cloud_b64)}
+            result = {
+                "source": source,
+                "sentiment_counts": dict(Counter(r['sentiment'] for r in sentiment_results)),
+                "sentiment_results": [
+                    {"title": r['title'], "sentiment": r['sentiment'], "score": r['score']}
+                    for r in sentiment_results
+                ],
+                "charts": charts
+            }
+            with job._lock:
+                job.result = result
+                job.processed = len(sentiment_results)
+                job.status = 'completed'
+        except Exception as e:
+            logger.exception(f"Analysis job {job.id} for topic '{job.topic}' failed: {e}")
+            with job._lock:
+                job.error = str(e)
+                job.status = 'failed'
+        finally:
+            job.finished_at = time.time()
+            with self._lock:
+                if self._in_flight.get(key) is job:
+                    del self._in_flight[key]
+
+    def _prune(self):
+        # Forget finished jobs older than the retention period
+        cutoff = time.time() - self.retention
+        expired = [job_id for job_id, job in self._jobs.items() if job.finished_at and job.finished_at < cutoff]
+        for job_id in expired:
+            del self._jobs[job_id]
+
+
+# Job manager shared by the app, configured in create_app
+jobs = JobManager()
@@ -1,37 +1,229 @@
+import atexit
+import copy
+import json
 import logging
 import os
+import queue
+import random
+import threading
+import time
+import uuid
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
 
-def configure_logger():
-    """
-    Configures a logger for the Flask application.
-    Logs will be written to 'logs/app.log'.
-    """
-    # Get a logger instance, typically named after the module where it's used
-    logger = logging.getLogger(__name__)
-    
-    # Define the directory for logs
-    log_dir = 'logs'
-    # Create the log directory if it doesn't exist
-    if not os.path.exists(log_dir):
-        os.makedirs(log_dir)
-
-    # Define the full path for the log file
-    log_file = os.path.join(log_dir, 'app.log')
-    
-    # Create a file handler that writes log messages to the specified file
-    handler = logging.FileHandler(log_file)
-    
-    # Define the format for log messages
-    formatter = logging.Formatter("%(asctime)s - %(name)s - %(levelname)s - %(message)s")
-    
-    # Set the formatter for the handler
-    handler.setFormatter(formatter)
-    
-    # Add the handler to the logger
-    logger.addHandler(handler)
-    
-    # Set the logging level to INFO (or DEBUG, WARNING, ERROR, CRITICAL)
-    # INFO means messages with level INFO and higher will be processed.
-    logger.setLevel(logging.INFO)
-    
-    return logger
\ No newline at end of file
+from flask import g, request
+
+from app.metrics import StageTotals, request_stages
+
+# --- Logging Configuration ---
+# Directory and file JSON log records are written to
+LOG_DIR = os.getenv('LOG_DIR', 'logs')
+LOG_FILE = os.getenv('LOG_FILE', 'app.log')
+# Size at which the log file is rotated, and the number of rotated files kept
+LOG_MAX_BYTES = int(os.getenv('LOG_MAX_BYTES', 10 * 1024 * 1024))
+LOG_BACKUP_COUNT = int(os.getenv('LOG_BACKUP_COUNT', 5))
+# Lowest level logged by the app, and the lowest level also echoed to stderr
+LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO').upper()
+LOG_CONSOLE_LEVEL = os.getenv('LOG_CONSOLE_LEVEL', 'WARNING').upper()
+# Fraction of DEBUG records kept; higher levels are always kept
+LOG_DEBUG_SAMPLE_RATE = float(os.getenv('LOG_DEBUG_SAMPLE_RATE', 0.01))
+# Records buffered for the writer thread; records arriving while it is full are dropped
+LOG_QUEUE_SIZE = int(os.getenv('LOG_QUEUE_SIZE', 10000))
+# Request header carrying a caller-supplied request ID, echoed in the response
+REQUEST_ID_HEADER = 'X-Request-ID'
+
+# Every module logs under this name (app.graphs, app.pipeline, ...)
+APP_LOGGER = 'app'
+# LogRecord attributes that are not extra fields passed by the caller
+_RECORD_ATTRIBUTES = set(vars(logging.makeLogRecord({}))) | {'message', 'asctime', 'request_id'}
+
+# ID of the request being handled; a context variable so that threads run
+# in a copy of the request's context log it too
+request_id = ContextVar('request_id', default=None)
+
+_listener = None
+_queue_handler = None
+_configure_lock = threading.Lock()
+
+
+class JsonFormatter(logging.Formatter):
+    """
+    Formats a record as one line of JSON: time, level, logger, message,
+    request ID and any fields passed through `extra` (e.g. stage timings).
+    """
+
+    def format(self, record):
+        entry = {
+            'time': datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+            'request_id': getattr(record, 'request_id', None)
+        }
+        entry.update((key, value) for key, value in vars(record).items() if key not in _RECORD_ATTRIBUTES)
+        if record.exc_info:
+            entry['exception'] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            entry['exception'] = record.exc_text
+        return json.dumps(entry, default=str)
+
+
+class RequestContextFilter(logging.Filter):
+    """
+    Adds the current request's ID to records, and keeps only a sample of
+    DEBUG records so verbose logging cannot flood the queue.
+
+    Runs in the thread that logs, where the request context is available.
+    """
+
+    def __init__(self, debug_sample_rate=LOG_DEBUG_SAMPLE_RATE):
+        super().__init__()
+        self.debug_sample_rate = debug_sample_rate
+
+    def filter(self, record):
+        if record.levelno <= logging.DEBUG and random.random() >= self.debug_sample_rate:
+            return False
+        if not hasattr(record, 'request_id'):
+            record.request_id = current_request_id()
+        return True
+
+
+class _DroppingQueueHandler(QueueHandler):
+    """
+    Hands records to the writer thread without ever blocking the caller;
+    records that do not fit in the queue are counted and dropped.
+    """
+
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record):
+        # Merge the arguments and format the traceback here, while the
+        # objects they refer to are still alive, leaving the rest to the writer
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+def current_request_id():
+    """
+    Returns the ID of the request being handled, or None outside of a request.
+    """
+    return request_id.get()
+
+
+def configure_logger(name=None):
+    """
+    Sets up logging for the app and returns a logger.
+
+    Records logged under the 'app' logger (and every app.* module logger)
+    are put on a queue and written by a background thread, so logging never
+    does disk I/O in the request thread. The writer emits JSON lines to
+    LOG_DIR/LOG_FILE, rotated at LOG_MAX_BYTES, and echoes records at
+    LOG_CONSOLE_LEVEL and above to stderr. Calling this again reuses the
+    running setup.
+
+    Args:
+        name (str): The logger to return. Defaults to the 'app' logger.
+
+    Returns:
+        logging.Logger: The logger.
+    """
+    global _listener, _queue_handler
+    with _configure_lock:
+        if _listener is None:
+            os.makedirs(LOG_DIR, exist_ok=True)
+            file_handler = RotatingFileHandler(
+                os.path.join(LOG_DIR, LOG_FILE), maxBytes=LOG_MAX_BYTES, backupCount=LOG_BACKUP_COUNT, encoding='utf-8'
+            )
+            file_handler.setFormatter(JsonFormatter())
+            console_handler = logging.StreamHandler()
+            console_handler.setLevel(LOG_CONSOLE_LEVEL)
+            console_handler.setFormatter(logging.Formatter("%(asctime)s - %(name)s - %(levelname)s - %(message)s"))
+
+            log_queue = queue.Queue(maxsize=LOG_QUEUE_SIZE)
+            _queue_handler = _DroppingQueueHandler(log_queue)
+            _queue_handler.addFilter(RequestContextFilter())
+            _listener = QueueListener(log_queue, file_handler, console_handler, respect_handler_level=True)
+            _listener.start()
+            atexit.register(shutdown_logger)
+
+            app_logger = logging.getLogger(APP_LOGGER)
+            app_logger.addHandler(_queue_handler)
+            app_logger.setLevel(LOG_LEVEL)
+    return logging.getLogger(name or APP_LOGGER)
+
+
+def shutdown_logger():
+    """
+    Writes out the queued records and stops the writer thread.
+    """
+    global _listener, _queue_handler
+    with _configure_lock:
+        if _listener is None:
+            return
+        _listener.stop()
+        logging.getLogger(APP_LOGGER).removeHandler(_queue_handler)
+        for handler in _listener.handlers:
+            handler.close()
+        _listener = None
+        _queue_handler = None
+
+
+def init_app(app):
+    """
+    Gives every request an ID (the caller's X-Request-ID, or a new one),
+    returns it in the response and logs one record per request with its
+    duration and the time spent in each pipeline stage.
+    """
+    logger = configure_logger('app.requests')
+
+    @app.before_request
+    def assign_request_id():
+        g.request_log_started = time.perf_counter()
+        g.request_log_tokens = (
+            request_id.set(request.headers.get(REQUEST_ID_HEADER) or uuid.uuid4().hex),
+            request_stages.set(StageTotals())
+        )
+
+    @app.after_request
+    def log_request(response):
+        current_id = request_id.get()
+        if current_id is None:
+            return response
+        response.headers[REQUEST_ID_HEADER] = current_id
+        started = g.get('request_log_started')
+        stages = request_stages.get()
+        logger.info(
+            f"{request.method} {request.path} {response.status_code}",
+            extra={
+                'method': request.method,
+                'path': request.path,
+                'status': response.status_code,
+                'duration_ms': None if started is None else round((time.perf_counter() - started) * 1000, 3),
+                'stages_ms': {
+                    stage: round(seconds * 1000, 3) for stage, seconds in (stages.snapshot() if stages else {}).items()
+                }
+            }
+        )
+        return response
+
+    @app.teardown_request
+    def clear_request_id(exc):
+        # Worker threads are reused, so the next request must not inherit these values
+        tokens = g.pop('request_log_tokens', None)
+        if tokens is not None:
+            request_id.reset(tokens[0])
+            request_stages.reset(tokens[1])
@@ -0,0 +1,266 @@
+import cProfile
+import os
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from flask import g, request
+
+# Histogram bucket upper bounds, in seconds
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+# Request header that turns on cProfile for a single request
+PROFILE_HEADER = 'X-Profile'
+
+
+def _format_labels(label_names, label_values, extra=None):
+    pairs = list(zip(label_names, label_values))
+    if extra:
+        pairs.append(extra)
+    if not pairs:
+        return ''
+    escaped = (
+        '{}="{}"'.format(name, str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n'))
+        for name, value in pairs
+    )
+    return '{' + ','.join(escaped) + '}'
+
+
+class Counter:
+    """
+    A monotonically increasing count, optionally split by labels.
+    """
+
+    def __init__(self, name, documentation, label_names=()):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(label_names)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(labels[name] for name in self.label_names)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        key = tuple(labels[name] for name in self.label_names)
+        with self._lock:
+            return self._values.get(key, 0)
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} counter']
+        with self._lock:
+            values = sorted(self._values.items())
+        for key, value in values:
+            lines.append(f'{self.name}{_format_labels(self.label_names, key)} {value}')
+        return lines
+
+
+class Histogram:
+    """
+    A distribution of observed values in fixed buckets, optionally split by labels.
+
+    Observing a value is a bucket lookup and three additions under a lock,
+    so it is cheap enough for the request hot path.
+    """
+
+    def __init__(self, name, documentation, label_names=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(label_names)
+        self.buckets = tuple(buckets)
+        # Per label set: [per-bucket counts (last one is +Inf), sum, count]
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(labels[name] for name in self.label_names)
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def count(self, **labels):
+        key = tuple(labels[name] for name in self.label_names)
+        with self._lock:
+            series = self._series.get(key)
+            return series[2] if series else 0
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} histogram']
+        with self._lock:
+            series = sorted((key, (list(counts), total, count)) for key, (counts, total, count) in self._series.items())
+        for key, (counts, total, count) in series:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += bucket_count
+                le = '+Inf' if bound == float('inf') else repr(bound)
+                lines.append(f'{self.name}_bucket{_format_labels(self.label_names, key, ("le", le))} {cumulative}')
+            lines.append(f'{self.name}_sum{_format_labels(self.label_names, key)} {total}')
+            lines.append(f'{self.name}_count{_format_labels(self.label_names, key)} {count}')
+        return lines
+
+
+class Registry:
+    """
+    The set of metrics exposed by the /metrics endpoint.
+    """
+
+    def __init__(self):
+        self._metrics = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def render(self):
+        """
+        Returns all metrics in the Prometheus text exposition format.
+        """
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = Registry()
+
+
+class StageTotals:
+    """
+    Time spent in each stage while handling one request.
+
+    Threads working for the request (prefetch, fetch workers) add to the same
+    totals at the same time, so every update is made under a lock.
+    """
+
+    def __init__(self):
+        self._seconds = {}
+        self._lock = threading.Lock()
+
+    def add(self, stage, seconds):
+        with self._lock:
+            self._seconds[stage] = self._seconds.get(stage, 0.0) + seconds
+
+    def snapshot(self):
+        """
+        Returns the totals so far as a dict of seconds by stage.
+        """
+        with self._lock:
+            return dict(self._seconds)
+
+
+# StageTotals of the request being handled (see logger.init_app). A context
+# variable rather than flask.g, so threads started with a copy of the
+# request's context (e.g. pipeline.prefetch) add their time to it too.
+request_stages = ContextVar('request_stages', default=None)
+
+STAGE_SECONDS = REGISTRY.register(Histogram(
+    'sentiment_stage_duration_seconds',
+    'Time spent in each stage of the analyze pipeline.',
+    ('stage',)
+))
+REQUEST_SECONDS = REGISTRY.register(Histogram(
+    'sentiment_request_duration_seconds',
+    'Time spent handling HTTP requests.',
+    ('endpoint', 'method', 'status')
+))
+CACHE_EVENTS = REGISTRY.register(Counter(
+    'sentiment_cache_events_total',
+    'Cache lookups by cache and result (hit or miss).',
+    ('cache', 'result')
+))
+
+
+def observe_stage(stage, seconds):
+    """
+    Records time spent in a stage, in the stage histogram and, during a
+    request, in the request's own stage totals (logged when it finishes).
+    """
+    STAGE_SECONDS.observe(seconds, stage=stage)
+    stages = request_stages.get()
+    if stages is not None:
+        stages.add(stage, seconds)
+
+
+@contextmanager
+def timed(stage):
+    """
+    Records the time spent in the `with` block under the given stage.
+    """
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe_stage(stage, time.perf_counter() - start)
+
+
+def timed_iter(stage, iterable):
+    """
+    Yields the items of `iterable`, recording the time spent producing them
+    (e.g. waiting on the network) under the given stage.
+    """
+    iterator = iter(iterable)
+    while True:
+        start = time.perf_counter()
+        try:
+            item = next(iterator)
+        except StopIteration:
+            observe_stage(stage, time.perf_counter() - start)
+            return
+        observe_stage(stage, time.perf_counter() - start)
+        yield item
+
+
+def record_cache(cache, hits, misses):
+    """
+    Counts cache hits and misses for the given cache.
+    """
+    if hits:
+        CACHE_EVENTS.inc(hits, cache=cache, result='hit')
+    if misses:
+        CACHE_EVENTS.inc(misses, cache=cache, result='miss')
+
+
+def init_app(app):
+    """
+    Times every request and, when PROFILING_ENABLED is set, profiles requests
+    that carry the X-Profile header.
+
+    Profiles are written to PROFILE_DIR as .prof files (readable with pstats
+    or snakeviz) and the file name is returned in the X-Profile-File header.
+    """
+
+    @app.before_request
+    def start_request_timer():
+        g.request_started = time.perf_counter()
+        if app.config.get('PROFILING_ENABLED') and request.headers.get(PROFILE_HEADER):
+            g.profiler = cProfile.Profile()
+            g.profiler.enable()
+
+    @app.after_request
+    def record_request(response):
+        profiler = g.pop('profiler', None)
+        if profiler is not None:
+            profiler.disable()
+            profile_dir = app.config.get('PROFILE_DIR') or os.path.join(app.instance_path, 'profiles')
+            os.makedirs(profile_dir, exist_ok=True)
+            file_name = f"{request.endpoint or 'unknown'}-{time.strftime('%Y%m%d-%H%M%S')}-{id(profiler):x}.prof"
+            profiler.dump_stats(os.path.join(profile_dir, file_name))
+            response.headers['X-Profile-File'] = file_name
+
+        started = g.pop('request_started', None)
+        if started is not None:
+            REQUEST_SECONDS.observe(
+                time.perf_counter() - started,
+                endpoint=request.endpoint or 'unknown',
+                method=request.method,
+                status=str(response.status_code)
+            )
+        return response
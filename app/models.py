@@ -1,10 +1,17 @@
 from app import db
-from datetime import datetime
+from datetime import datetime, timezone
 
 # Define the SentimentAnalysis database model
 class SentimentAnalysis(db.Model):
     # Set the table name in the database
     __tablename__ = 'sentiment_analysis'
+    # Each Reddit post is stored at most once per topic, so re-fetching a
+    # topic updates existing rows instead of duplicating them
+    __table_args__ = (
+        db.Index('uq_sentiment_analysis_topic_post_id', 'topic', 'post_id', unique=True),
+        # Serves the "latest results for a topic" query without a table scan or sort
+        db.Index('ix_sentiment_analysis_topic_created_at', 'topic', 'created_at'),
+    )
     
     # Define columns
     id = db.Column(db.Integer, primary_key=True) 
@@ -13,8 +20,121 @@ class SentimentAnalysis(db.Model):
     content = db.Column(db.Text, nullable=False) 
     sentiment = db.Column(db.String(10), nullable=False) 
     score = db.Column(db.Float, nullable=False) 
-    created_at = db.Column(db.DateTime, server_default=db.func.now())
+    # Set in Python rather than by the database, so every row is stored in the
+    # same format as the bound values keyset pagination compares it with
+    created_at = db.Column(db.DateTime, default=lambda: datetime.now(timezone.utc).replace(tzinfo=None))
+    # Reddit submission details (nullable for rows saved before they were tracked)
+    post_id = db.Column(db.String(20))
+    url = db.Column(db.Text)
+    reddit_created_at = db.Column(db.DateTime)
+    # Number of distinct words stored in PostTermFrequency for this row
+    # (NULL until the row's content has been tokenized)
+    term_count = db.Column(db.Integer)
+    # True once the row is counted in SentimentRollup (NULL for rows saved
+    # before rollups existed, until init_db backfills them)
+    rolled_up = db.Column(db.Boolean)
 
     # String representation of the object for debugging
     def __repr__(self):
         return f'<SentimentAnalysis {self.title}>'
+
+
+# Define the SentimentScoreCache database model
+class SentimentScoreCache(db.Model):
+    # Persistent tier of the score cache in app/analysis.py.
+    # Maps a hash of the normalized post content to its VADER compound score.
+    __tablename__ = 'sentiment_score_cache'
+
+    # Define columns
+    content_hash = db.Column(db.String(32), primary_key=True)
+    score = db.Column(db.Float, nullable=False)
+    created_at = db.Column(db.DateTime, server_default=db.func.now())
+
+    # String representation of the object for debugging
+    def __repr__(self):
+        return f'<SentimentScoreCache {self.content_hash}={self.score}>'
+
+
+
+# Define the PostTermFrequency database model
+class PostTermFrequency(db.Model):
+    # Word counts of each stored post, computed once at ingest time so word
+    # clouds can be built with an aggregate query instead of re-tokenizing.
+    __tablename__ = 'post_term_frequency'
+
+    # Define columns
+    analysis_id = db.Column(db.Integer, db.ForeignKey('sentiment_analysis.id', ondelete='CASCADE'), primary_key=True)
+    term = db.Column(db.String(255), primary_key=True)
+    count = db.Column(db.Integer, nullable=False)
+
+    # String representation of the object for debugging
+    def __repr__(self):
+        return f'<PostTermFrequency {self.analysis_id}:{self.term}={self.count}>'
+
+
+# Define the TopicRefreshState database model
+class TopicRefreshState(db.Model):
+    # When each topic was last fetched from Reddit and the newest submission
+    # seen so far (its high-water mark), so refreshes only fetch newer posts.
+    __tablename__ = 'topic_refresh_state'
+
+    # Define columns
+    topic = db.Column(db.String(255), primary_key=True)
+    newest_created_utc = db.Column(db.Float)
+    newest_post_id = db.Column(db.String(20))
+    refreshed_at = db.Column(db.DateTime, nullable=False)
+
+    # String representation of the object for debugging
+    def __repr__(self):
+        return f'<TopicRefreshState {self.topic} @ {self.newest_created_utc}>'
+
+
+# Define the SentimentRollup database model
+class SentimentRollup(db.Model):
+    # Per-topic sentiment totals for each hour and each day of post creation
+    # time, kept up to date on ingest so trends never scan SentimentAnalysis.
+    # Mean and variance of the score are derived from the running sums.
+    __tablename__ = 'sentiment_rollup'
+
+    # Define columns
+    topic = db.Column(db.String(255), primary_key=True)
+    # 'hour' or 'day'
+    granularity = db.Column(db.String(4), primary_key=True)
+    bucket_start = db.Column(db.DateTime, primary_key=True)
+    post_count = db.Column(db.Integer, nullable=False, default=0)
+    positive_count = db.Column(db.Integer, nullable=False, default=0)
+    neutral_count = db.Column(db.Integer, nullable=False, default=0)
+    negative_count = db.Column(db.Integer, nullable=False, default=0)
+    score_sum = db.Column(db.Float, nullable=False, default=0.0)
+    score_sq_sum = db.Column(db.Float, nullable=False, default=0.0)
+
+    # String representation of the object for debugging
+    def __repr__(self):
+        return f'<SentimentRollup {self.topic} {self.granularity} {self.bucket_start}: {self.post_count}>'
+
+
+# Define the CommentSentiment database model
+class CommentSentiment(db.Model):
+    # Scored comments of stored submissions, linked to the submission's row
+    # and to their parent comment (or the submission) by Reddit fullname
+    __tablename__ = 'comment_sentiment'
+    __table_args__ = (
+        # Each comment is stored once per submission row
+        db.Index('uq_comment_sentiment_analysis_id_comment_id', 'analysis_id', 'comment_id', unique=True),
+    )
+
+    # Define columns
+    id = db.Column(db.Integer, primary_key=True)
+    analysis_id = db.Column(db.Integer, db.ForeignKey('sentiment_analysis.id', ondelete='CASCADE'), nullable=False)
+    comment_id = db.Column(db.String(20), nullable=False)
+    # 't3_<id>' for top-level comments, 't1_<id>' for replies
+    parent_id = db.Column(db.String(20))
+    content = db.Column(db.Text, nullable=False)
+    sentiment = db.Column(db.String(10), nullable=False)
+    score = db.Column(db.Float, nullable=False)
+    reddit_created_at = db.Column(db.DateTime)
+    created_at = db.Column(db.DateTime, server_default=db.func.now())
+
+    # String representation of the object for debugging
+    def __repr__(self):
+        return f'<CommentSentiment {self.comment_id} on {self.analysis_id}>'
@@ -0,0 +1,417 @@
+import contextvars
+import logging
+import os
+import queue
+import threading
+from itertools import islice
+
+from app import db
+from app.analysis import analyze_sentiment, classify_scores, score_posts
+from app.fetch_reddit_data import fetch_comments, fetch_reddit_data, fetch_topics
+from app.graphs import generate_graphs
+from app.metrics import timed, timed_iter
+from app.results import SentimentResults
+from app.storage import (
+    aggregate_term_counts, get_refresh_state, is_stale, load_recent_results, query_comment_results, query_recent_results,
+    record_refresh,
+    upsert_comment_results, upsert_sentiment_results
+)
+
+# --- Streaming Pipeline Configuration ---
+# Number of posts scored together. Matches PRAW's page size of 100 so one
+# chunk is scored while the next page is being fetched.
+STREAM_CHUNK_SIZE = int(os.getenv('STREAM_CHUNK_SIZE', 100))
+# Number of fetched posts buffered ahead of the scorer
+PREFETCH_SIZE = int(os.getenv('STREAM_PREFETCH_SIZE', 200))
+# Number of rows written to the database per commit
+COMMIT_BATCH_SIZE = int(os.getenv('STREAM_COMMIT_BATCH_SIZE', 500))
+# Seconds after which a stored topic is refreshed with posts newer than its high-water mark
+REFRESH_TTL = int(os.getenv('TOPIC_REFRESH_TTL', 900))
+
+# Marks the end of a prefetched stream
+_DONE = object()
+
+logger = logging.getLogger(__name__)
+
+
+def prefetch(iterable, maxsize=None):
+    """
+    Consumes an iterable in a background thread, buffering up to `maxsize`
+    items ahead of the caller.
+
+    This lets network-bound producers (such as PRAW pagination) run while the
+    caller is busy with the previous items. Exceptions raised by the producer
+    are re-raised in the caller.
+
+    Args:
+        iterable (iterable): The items to prefetch.
+        maxsize (int): Maximum number of buffered items. Defaults to PREFETCH_SIZE.
+
+    Yields:
+        The items of `iterable`, in order.
+    """
+    buffer = queue.Queue(maxsize=maxsize or PREFETCH_SIZE)
+    stopped = threading.Event()
+
+    def put(item):
+        # Give up if the consumer has stopped reading
+        while not stopped.is_set():
+            try:
+                buffer.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def produce():
+        try:
+            for item in iterable:
+                if not put(item):
+                    return
+        except Exception as e:
+            put(e)
+            return
+        put(_DONE)
+
+    # Run in a copy of the caller's context, so fetch time and log records
+    # are attributed to the request that started the fetch
+    producer = threading.Thread(target=contextvars.copy_context().run, args=(produce,), name='prefetch', daemon=True)
+    producer.start()
+    try:
+        while True:
+            item = buffer.get()
+            if item is _DONE:
+                break
+            if isinstance(item, Exception):
+                raise item
+            yield item
+    finally:
+        stopped.set()
+
+
+def chunked(iterable, size):
+    """
+    Splits an iterable into lists of at most `size` items.
+    """
+    iterator = iter(iterable)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def stream_analysis(posts, chunk_size=None):
+    """
+    Scores a stream of posts chunk by chunk.
+
+    Posts are prefetched in a background thread so that fetching the next
+    page overlaps with scoring the current chunk.
+
+    Args:
+        posts (iterable): Post dictionaries, e.g. from fetch_reddit_data(..., stream=True).
+        chunk_size (int): Posts scored per chunk. Defaults to STREAM_CHUNK_SIZE.
+
+    Yields:
+        list: The analyze_sentiment results for each chunk.
+    """
+    for chunk in chunked(prefetch(posts), chunk_size or STREAM_CHUNK_SIZE):
+        yield analyze_sentiment(chunk)
+
+
+def persist_results(topic, result_chunks, batch_size=None):
+    """
+    Saves streamed sentiment results to the database in fixed-size batches.
+
+    Each batch is upserted and committed as soon as it is full, so at most
+    `batch_size` pending rows are held at any time. The chunks are passed
+    through unchanged once they have been queued for saving.
+
+    Args:
+        topic (str): The topic the results belong to.
+        result_chunks (iterable): Lists of analyze_sentiment results.
+        batch_size (int): Rows per commit. Defaults to COMMIT_BATCH_SIZE.
+
+    Yields:
+        list: Each chunk of results.
+    """
+    batch_size = batch_size or COMMIT_BATCH_SIZE
+    pending = []
+    try:
+        for chunk in result_chunks:
+            pending.extend(chunk)
+            while len(pending) >= batch_size:
+                with timed('db_write'):
+                    upsert_sentiment_results(topic, pending[:batch_size])
+                    db.session.commit()
+                # Sampled (see LOG_DEBUG_SAMPLE_RATE), so arguments are only formatted if kept
+                logger.debug("Saved %d results for topic '%s'", batch_size, topic)
+                del pending[:batch_size]
+            yield chunk
+        if pending:
+            with timed('db_write'):
+                upsert_sentiment_results(topic, pending)
+                db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+
+
+def run_pipeline(topic, posts, chunk_size=None, batch_size=None):
+    """
+    Scores and saves a stream of posts for a topic.
+
+    Args:
+        topic (str): The topic the posts were fetched for.
+        posts (iterable): Post dictionaries to analyze.
+        chunk_size (int): Posts scored per chunk. Defaults to STREAM_CHUNK_SIZE.
+        batch_size (int): Rows per commit. Defaults to COMMIT_BATCH_SIZE.
+
+    Yields:
+        list: Each chunk of saved sentiment results.
+    """
+    return persist_results(topic, stream_analysis(posts, chunk_size), batch_size)
+
+
+def newer_than(posts, created_utc, post_id=None):
+    """
+    Yields posts until the first one at or past a high-water mark.
+
+    Search results arrive newest first, so everything after the mark has
+    been seen before. Stopping there also stops PRAW from requesting
+    further pages.
+
+    Args:
+        posts (iterable): Post dictionaries, newest first.
+        created_utc (float): Creation time of the newest post already stored.
+        post_id (str): ID of that post.
+
+    Yields:
+        dict: The posts created after the mark.
+    """
+    for post in posts:
+        if post.get('id') is not None and post.get('id') == post_id:
+            return
+        if post.get('created_utc') is not None and post['created_utc'] < created_utc:
+            return
+        yield post
+
+
+def analyze_topic(topic, limit, on_progress=None, refresh_ttl=None):
+    """
+    Returns sentiment results for a topic.
+
+    Topics fetched from Reddit within the last `refresh_ttl` seconds are
+    answered from the database. Older topics are refreshed incrementally:
+    only submissions newer than the topic's high-water mark are fetched,
+    scored and saved, then merged with the stored rows. Topics with no
+    stored rows are fetched in full. A topic whose fetch fails is not marked
+    as refreshed, so the next request retries it.
+
+    Args:
+        topic (str): The topic to analyze.
+        limit (int): The maximum number of posts.
+        on_progress (callable): Called as on_progress(processed, limit) after
+                                each scored chunk.
+        refresh_ttl (int): Seconds before a stored topic is refreshed.
+                           Defaults to REFRESH_TTL.
+
+    Returns:
+        tuple: (sentiment_results, source) where source is 'database' if
+               no new posts were fetched, otherwise 'reddit'.
+               sentiment_results is empty if Reddit returned no posts.
+    """
+    refresh_ttl = REFRESH_TTL if refresh_ttl is None else refresh_ttl
+
+    # --- Check if data exists in database ---
+    # Query for existing sentiment analysis records for the given topic,
+    # ordered by creation time (descending), limited by 'limit'.
+    # Rows come back as columns; content is only read if a caller needs it.
+    db_records = load_recent_results(topic, limit)
+    state = get_refresh_state(topic)
+    if db_records and not is_stale(state, refresh_ttl):
+        if on_progress:
+            on_progress(len(db_records), limit)
+        return db_records, 'database'
+
+    # --- Fetch Reddit data newer than what is stored ---
+    # Posts are streamed as PRAW paginates, so scoring and saving of one
+    # page overlaps with fetching the next.
+    errors = []
+    posts = timed_iter('fetch', fetch_reddit_data(topic, limit, stream=True, on_error=errors.append))
+    if db_records and state is not None and state.newest_created_utc is not None:
+        posts = newer_than(posts, state.newest_created_utc, state.newest_post_id)
+
+    # --- Analyze sentiment of fetched posts and save them in batches ---
+    # Each chunk's content is dropped once it is saved, so memory use does
+    # not grow with the post text of the whole fetch
+    chunks = []
+    processed = 0
+    for chunk in run_pipeline(topic, posts):
+        chunks.append(chunk.without_content())
+        processed += len(chunk)
+        if on_progress:
+            on_progress(processed, limit)
+    # A failed fetch is retried on the next request rather than marking the topic fresh
+    if not errors:
+        record_refresh(topic, SentimentResults.concat(chunks))
+    db.session.commit()
+
+    if not processed:
+        return db_records, ('database' if db_records else 'reddit')
+    # Read back from the database, merged with any stored posts, with the
+    # content loaded only if a caller needs it
+    del chunks, db_records
+    return load_recent_results(topic, limit), 'reddit'
+
+
+def compare_topics(topics, limit, refresh_ttl=None):
+    """
+    Returns sentiment results for several topics at once.
+
+    Topics that are fresh in the database are answered from it, as in
+    analyze_topic. The others are searched concurrently, and posts that
+    show up under more than one topic are scored once, in a single pass
+    over the process pool, before each topic's results are saved.
+
+    Args:
+        topics (list): The topics to compare.
+        limit (int): The maximum number of posts per topic.
+        refresh_ttl (int): Seconds before a stored topic is refreshed.
+                           Defaults to REFRESH_TTL.
+
+    Returns:
+        dict: (sentiment_results, source) for each topic, as returned by
+              analyze_topic.
+    """
+    refresh_ttl = REFRESH_TTL if refresh_ttl is None else refresh_ttl
+
+    compared = {}
+    marks = {}
+    for topic in topics:
+        db_records = load_recent_results(topic, limit)
+        state = get_refresh_state(topic)
+        if db_records and not is_stale(state, refresh_ttl):
+            compared[topic] = (db_records, 'database')
+        elif db_records and state is not None and state.newest_created_utc is not None:
+            marks[topic] = (state.newest_created_utc, state.newest_post_id)
+        else:
+            marks[topic] = None
+    if not marks:
+        return compared
+
+    # --- Fetch every stale topic at the same time ---
+    with timed('fetch'):
+        failed = set()
+
+        def past_mark(topic, posts):
+            # Paging stops at the topic's high-water mark, as in analyze_topic
+            mark = marks[topic]
+            return posts if mark is None else newer_than(posts, *mark)
+
+        fetched = fetch_topics(list(marks), limit, on_error=lambda topic, e: failed.add(topic), filter_posts=past_mark)
+
+    # --- Score each distinct post once ---
+    positions = {}
+    unique_posts = []
+    for posts in fetched.values():
+        for post in posts:
+            if post['id'] not in positions:
+                positions[post['id']] = len(unique_posts)
+                unique_posts.append(post)
+    scored = analyze_sentiment(unique_posts)
+
+    # --- Save each topic's share of the results ---
+    try:
+        for topic, posts in fetched.items():
+            sentiment_results = scored.take([positions[post['id']] for post in posts])
+            with timed('db_write'):
+                if sentiment_results:
+                    upsert_sentiment_results(topic, sentiment_results)
+                if topic not in failed:
+                    record_refresh(topic, sentiment_results)
+                db.session.commit()
+            if marks[topic] is None:
+                compared[topic] = (sentiment_results, 'reddit')
+            elif not sentiment_results:
+                compared[topic] = (load_recent_results(topic, limit), 'database')
+            else:
+                compared[topic] = (load_recent_results(topic, limit), 'reddit')
+    except Exception:
+        db.session.rollback()
+        raise
+    return {topic: compared[topic] for topic in topics}
+
+
+def score_comments(comments):
+    """
+    Scores a batch of fetched comments.
+
+    Returns:
+        list: The comments with 'sentiment' and 'score' keys added.
+    """
+    with timed('score'):
+        scores = score_posts([comment['content'] for comment in comments])
+        sentiments = classify_scores(scores)
+    return [
+        dict(comment, sentiment=sentiment, score=score)
+        for comment, sentiment, score in zip(comments, sentiments.tolist(), scores.tolist())
+    ]
+
+
+def analyze_comments(topic, limit, chunk_size=None):
+    """
+    Returns the scored comments of a topic's most recent submissions.
+
+    Comment trees are fetched (see fetch_comments) only for submissions
+    with no stored comments. Fetched comments are scored and saved in
+    chunks while the remaining trees are still being expanded.
+
+    Args:
+        topic (str): The topic whose submissions are read.
+        limit (int): Number of most recent submissions, as for analyze_topic.
+        chunk_size (int): Comments scored and saved together. Defaults to STREAM_CHUNK_SIZE.
+
+    Returns:
+        list: Comment dictionaries with 'analysis_id', 'comment_id',
+              'parent_id', 'sentiment' and 'score' keys.
+    """
+    submissions = query_recent_results(topic, limit, columns=('id', 'post_id'))
+    analysis_ids = {row['post_id']: row['id'] for row in submissions if row['post_id']}
+    comments = query_comment_results(list(analysis_ids.values()))
+    expanded = {comment['analysis_id'] for comment in comments}
+    unexpanded = [post_id for post_id, analysis_id in analysis_ids.items() if analysis_id not in expanded]
+
+    fetched = timed_iter('fetch_comments', fetch_comments(unexpanded))
+    try:
+        for chunk in chunked(prefetch(fetched), chunk_size or STREAM_CHUNK_SIZE):
+            scored = score_comments(chunk)
+            with timed('db_write'):
+                upsert_comment_results(analysis_ids, scored)
+                db.session.commit()
+            comments.extend(
+                {
+                    'analysis_id': analysis_ids[comment['submission_id']],
+                    'comment_id': comment['id'],
+                    'parent_id': comment['parent_id'],
+                    'sentiment': comment['sentiment'],
+                    'score': comment['score']
+                }
+                for comment in scored
+            )
+    except Exception:
+        db.session.rollback()
+        raise
+    return comments
+
+
+def render_charts(topic, limit, sentiment_results):
+    """
+    Generates the bar chart and word cloud for a topic's results.
+
+    Returns:
+        tuple: (bar_chart_base64, word_cloud_base64) as returned by generate_graphs.
+    """
+    # Word counts come from the term index built at ingest time
+    word_counts = aggregate_term_counts(topic, limit)
+    return generate_graphs(sentiment_results, topic, word_counts=word_counts)
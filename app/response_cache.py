@@ -0,0 +1,205 @@
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from flask import current_app
+
+from app.metrics import record_cache
+
+
+def normalize_topic(topic):
+    """
+    Returns the canonical form of a topic: case-folded with runs of
+    whitespace collapsed, so 'Machine  Learning ' and 'machine learning'
+    are the same topic.
+    """
+    return ' '.join(topic.split()).casefold()
+
+
+class _Flight:
+    """
+    A computation in progress that concurrent callers for the same key wait on.
+    """
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.value = None
+        self.error = None
+
+
+class ResponseCache:
+    """
+    Two-tier cache for rendered responses.
+
+    A bounded in-process LRU sits in front of the Flask-Caching backend
+    configured for the app (simple, redis, ...). Entries are fresh for
+    `timeout` seconds and may then be served stale for `stale_ttl` more
+    seconds while a single background refresh recomputes them. Concurrent
+    misses for the same key share one computation instead of each running
+    the full pipeline.
+    """
+
+    def __init__(self, app=None, backend=None):
+        self.backend = backend
+        self.maxsize = 256
+        self.timeout = 3600
+        self.stale_ttl = 600
+        self._entries = OrderedDict()
+        self._flights = {}
+        self._lock = threading.Lock()
+        self._refresher = None
+        if app is not None:
+            self.init_app(app, backend)
+
+    def init_app(self, app, backend=None):
+        """
+        Configures the cache from the app's RESPONSE_CACHE_* settings.
+        """
+        if backend is not None:
+            self.backend = backend
+        self.maxsize = app.config.get('RESPONSE_CACHE_SIZE', self.maxsize)
+        self.timeout = app.config.get('CACHE_DEFAULT_TIMEOUT', self.timeout)
+        self.stale_ttl = app.config.get('RESPONSE_CACHE_STALE_TTL', self.stale_ttl)
+        if self._refresher is None:
+            self._refresher = ThreadPoolExecutor(max_workers=2, thread_name_prefix='cache-refresh')
+        self.clear()
+
+    @staticmethod
+    def key(topic, limit, **params):
+        """
+        Builds the cache key for an analysis response from every parameter
+        that changes its output.
+        """
+        parts = [f'topic={normalize_topic(topic)}', f'limit={int(limit)}']
+        parts.extend(f'{name}={value}' for name, value in sorted(params.items()))
+        return 'analysis:' + '|'.join(parts)
+
+    def get_or_compute(self, key, compute, cacheable=lambda value: True, timeout=None):
+        """
+        Returns the cached value for `key`, computing it on a miss.
+
+        Args:
+            key (str): The cache key.
+            compute (callable): Produces the value. Runs inside an app context.
+            cacheable (callable): Decides whether a computed value is stored;
+                                  values it rejects (e.g. error responses)
+                                  are returned but not cached.
+            timeout (int): Seconds the computed value is fresh for, if
+                           shorter than the cache's timeout.
+
+        Returns:
+            The cached or freshly computed value.
+        """
+        now = time.time()
+        entry = self._get_local(key)
+        tier = 'response_local'
+        if entry is None:
+            record_cache('response_local', 0, 1)
+            entry = self._get_backend(key)
+            tier = 'response_backend'
+            if entry is not None:
+                self._set_local(key, entry)
+        if entry is not None:
+            record_cache(tier, 1, 0)
+            if now >= entry['fresh_until']:
+                # Serve the stale copy and refresh it in the background
+                self._refresh_in_background(key, compute, cacheable, timeout)
+            return entry['value']
+
+        record_cache('response_backend', 0, 1)
+        return self._single_flight(key, compute, cacheable, timeout)
+
+    def invalidate(self, key):
+        """
+        Removes a key from both tiers.
+        """
+        with self._lock:
+            self._entries.pop(key, None)
+        if self.backend is not None:
+            self.backend.delete(key)
+
+    def clear(self):
+        """
+        Empties the in-process tier.
+        """
+        with self._lock:
+            self._entries.clear()
+
+    def _single_flight(self, key, compute, cacheable, timeout=None):
+        with self._lock:
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = _Flight()
+
+        if not leader:
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.value
+
+        try:
+            flight.value = compute()
+            if cacheable(flight.value):
+                self._store(key, flight.value, timeout)
+            return flight.value
+        except Exception as e:
+            flight.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._flights[key]
+            flight.done.set()
+
+    def _refresh_in_background(self, key, compute, cacheable, timeout=None):
+        with self._lock:
+            if key in self._flights:
+                return
+        app = current_app._get_current_object()
+
+        def refresh():
+            with app.app_context():
+                try:
+                    self._single_flight(key, compute, cacheable, timeout)
+                except Exception as e:
+                    app.logger.warning(f"Background refresh of {key} failed: {e}")
+
+        self._refresher.submit(refresh)
+
+    def _store(self, key, value, timeout=None):
+        timeout = self.timeout if timeout is None else min(timeout, self.timeout)
+        entry = {'value': value, 'fresh_until': time.time() + timeout}
+        self._set_local(key, entry)
+        if self.backend is not None:
+            self.backend.set(key, entry, timeout=timeout + self.stale_ttl)
+
+    def _get_local(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if time.time() >= entry['fresh_until'] + self.stale_ttl:
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return entry
+
+    def _set_local(self, key, entry):
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def _get_backend(self, key):
+        if self.backend is None:
+            return None
+        entry = self.backend.get(key)
+        if not isinstance(entry, dict) or 'fresh_until' not in entry:
+            return None
+        return entry
+
+
+# Response cache shared by the app, configured in create_app
+response_cache = ResponseCache()
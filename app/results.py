@@ -0,0 +1,212 @@
+from collections.abc import Mapping, Sequence
+
+import numpy as np
+
+# Label lookup table indexed by label code: 0 = NEGATIVE, 1 = NEUTRAL, 2 = POSITIVE
+SENTIMENT_LABELS = np.array(['NEGATIVE', 'NEUTRAL', 'POSITIVE'])
+_LABELS = tuple(SENTIMENT_LABELS.tolist())
+_LABEL_CODES = {label: code for code, label in enumerate(_LABELS)}
+
+
+def label_codes(labels):
+    """
+    Returns the int8 codes (indexes into SENTIMENT_LABELS) of a list of labels.
+    """
+    return np.fromiter((_LABEL_CODES[label] for label in labels), dtype=np.int8, count=len(labels))
+
+
+class SentimentResults(Sequence):
+    """
+    Sentiment results stored column by column.
+
+    Scores are a float64 array and labels an int8 array of codes into
+    SENTIMENT_LABELS, so a result costs a few bytes plus its title instead
+    of a dictionary per post. Post content is kept as given or loaded on
+    first access through `load_content`, so callers that never read it
+    (aggregates, charts built from the term index) never fetch it.
+
+    Indexing returns a ResultView, a read-only mapping with the same keys
+    as the dictionaries analyze_sentiment used to return, so templates and
+    code written for lists of dicts keep working.
+    """
+
+    __slots__ = ('titles', 'scores', 'codes', 'details', '_content', '_load_content')
+
+    def __init__(self, titles, scores, codes, content=None, load_content=None, **details):
+        """
+        Args:
+            titles (list): Post titles.
+            scores (array-like): VADER compound scores.
+            codes (array-like): Label codes (see SENTIMENT_LABELS).
+            content (list): Post content, if already in memory.
+            load_content (callable): Returns the post content, in order, on first access.
+            **details: Optional extra columns as lists, e.g. id, url and created_utc.
+        """
+        self.titles = list(titles)
+        self.scores = np.asarray(scores, dtype=np.float64)
+        self.codes = np.asarray(codes, dtype=np.int8)
+        self.details = details
+        self._content = content
+        self._load_content = load_content
+
+    @classmethod
+    def from_dicts(cls, results, detail_keys=()):
+        """
+        Builds a container from result dictionaries with 'title', 'sentiment',
+        'score' and optionally 'content' and `detail_keys` keys.
+        """
+        results = list(results)
+        content = [result['content'] for result in results] if all('content' in result for result in results) else None
+        return cls(
+            [result['title'] for result in results],
+            np.fromiter((result['score'] for result in results), dtype=np.float64, count=len(results)),
+            label_codes([result['sentiment'] for result in results]),
+            content=content,
+            **{key: [result.get(key) for result in results] for key in detail_keys}
+        )
+
+    @classmethod
+    def concat(cls, parts):
+        """
+        Joins several containers into one, e.g. the chunks of a streamed analysis.
+        """
+        parts = list(parts)
+        if not parts:
+            return cls([], [], [])
+        keys = set.intersection(*(set(part.details) for part in parts))
+        return cls(
+            [title for part in parts for title in part.titles],
+            np.concatenate([part.scores for part in parts]),
+            np.concatenate([part.codes for part in parts]),
+            content=[text for part in parts for text in part.content] if all(part.has_content for part in parts) else None,
+            **{key: [value for part in parts for value in part.details[key]] for key in keys}
+        )
+
+    @property
+    def has_content(self):
+        return self._content is not None or self._load_content is not None
+
+    @property
+    def content(self):
+        """
+        The post content, loaded on first access if it was not given up front.
+        """
+        if self._content is None and self._load_content is not None:
+            self._content = list(self._load_content())
+            self._load_content = None
+        return self._content
+
+    @property
+    def sentiments(self):
+        """
+        The label of every result, as a numpy array of strings.
+        """
+        return SENTIMENT_LABELS[self.codes]
+
+    def sentiment_counts(self):
+        """
+        Returns the number of results per label.
+        """
+        counts = np.bincount(self.codes, minlength=len(_LABELS))
+        return {label: int(count) for label, count in zip(_LABELS, counts)}
+
+    def mean_score(self):
+        """
+        Returns the mean score, or None if there are no results.
+        """
+        return float(self.scores.mean()) if len(self.scores) else None
+
+    def take(self, indices):
+        """
+        Returns a new container with the results at `indices`, in that order.
+        """
+        indices = np.asarray(indices, dtype=np.intp)
+        positions = indices.tolist()
+        return SentimentResults(
+            [self.titles[i] for i in positions],
+            self.scores[indices],
+            self.codes[indices],
+            content=[self.content[i] for i in positions] if self.has_content else None,
+            **{key: [values[i] for i in positions] for key, values in self.details.items()}
+        )
+
+    def without_content(self, load_content=None):
+        """
+        Returns the same results without their content in memory, e.g. once
+        it has been saved; `load_content` can read it back on demand.
+        """
+        return SentimentResults(
+            self.titles, self.scores, self.codes, load_content=load_content, **self.details
+        )
+
+    def to_dicts(self):
+        """
+        Returns the results as a list of plain dictionaries.
+        """
+        return [dict(view) for view in self]
+
+    def __len__(self):
+        return len(self.titles)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return SentimentResults(
+                self.titles[index],
+                self.scores[index],
+                self.codes[index],
+                content=self.content[index] if self.has_content else None,
+                **{key: values[index] for key, values in self.details.items()}
+            )
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError('result index out of range')
+        return ResultView(self, index)
+
+    def __eq__(self, other):
+        if not isinstance(other, Sequence):
+            return NotImplemented
+        return len(self) == len(other) and all(a == b for a, b in zip(self, other))
+
+    def __repr__(self):
+        return f'<SentimentResults {len(self)} results {self.sentiment_counts()}>'
+
+
+class ResultView(Mapping):
+    """
+    Read-only, dictionary-compatible view of one result in a SentimentResults.
+    """
+
+    __slots__ = ('_results', '_index')
+
+    def __init__(self, results, index):
+        self._results = results
+        self._index = index
+
+    def __getitem__(self, key):
+        results, index = self._results, self._index
+        if key == 'title':
+            return results.titles[index]
+        if key == 'sentiment':
+            return _LABELS[results.codes[index]]
+        if key == 'score':
+            return float(results.scores[index])
+        if key == 'content' and results.has_content:
+            return results.content[index]
+        if key in results.details:
+            return results.details[key][index]
+        raise KeyError(key)
+
+    def __iter__(self):
+        yield 'title'
+        if self._results.has_content:
+            yield 'content'
+        yield 'sentiment'
+        yield 'score'
+        yield from self._results.details
+
+    def __len__(self):
+        return 3 + self._results.has_content + len(self._results.details)
+
+    def __repr__(self):
+        return repr(dict(self))
@@ -1,10 +1,19 @@
-from flask import Blueprint, request, jsonify, render_template, current_app
-from app.fetch_reddit_data import fetch_reddit_data
-from app.analysis import analyze_sentiment
-from app.graphs import generate_graphs
-from app import db, cache
-from app.models import SentimentAnalysis
-from app.logger import configure_logger # Ensure this import is correct
+import base64
+import json
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+
+from flask import Blueprint, request, jsonify, render_template, current_app, url_for, Response, make_response
+from itsdangerous import Signer
+from app.pipeline import REFRESH_TTL, analyze_comments, analyze_topic, compare_topics, render_charts
+from app.graphs import SENTIMENT_ORDER, generate_comparison_chart, load_chart, publish_chart
+from app.storage import ROLLUP_GRANULARITIES, load_recent_results, query_results_page
+from app.trends import query_trend
+from app.jobs import jobs, JobQueueFull
+from app.response_cache import normalize_topic, response_cache
+from app.results import SentimentResults
+from app.metrics import REGISTRY, timed
+from app.logger import configure_logger
 
 # Create a Blueprint for sentiment-related routes
 sentiment_bp = Blueprint(
@@ -14,8 +23,13 @@ sentiment_bp = Blueprint(
     static_folder='static'       # Specifies where Flask should look for static files
 )
 
+# Seconds browsers may cache a chart image (its URL changes whenever the image does)
+CHART_MAX_AGE = 365 * 24 * 3600
+# Range covered by /trend when no start is given
+DEFAULT_TREND_SPAN = timedelta(days=30)
+
 # Get the logger instance
-logger = configure_logger() 
+logger = configure_logger(__name__)
 
 @sentiment_bp.route('/', methods=['GET'])
 def index():
@@ -25,84 +39,495 @@ def index():
     # This route will serve the initial HTML form.
     return render_template('index.html')
 
+def _flag(name):
+    """
+    Returns True if a boolean form field or query argument is set.
+    """
+    value = request.form.get(name) or request.args.get(name, '')
+    return value.lower() in ('1', 'true', 'yes')
+
+def _async_requested():
+    """
+    Returns True if the request asks for a background job ('async' form field or query argument).
+    """
+    return _flag('async')
+
+
+def _submit_job(topic, limit):
+    """
+    Queues an analysis job and returns its ID and status URL.
+    """
+    try:
+        job = jobs.submit(topic, limit)
+    except JobQueueFull as e:
+        logger.warning(f"Rejected analysis job for topic '{topic}': {e}")
+        return jsonify({"error": str(e)}), 503
+    logger.info(f"Analysis job {job.id} for topic '{topic}' is {job.status}.")
+    return jsonify({
+        "job_id": job.id,
+        "status": job.status,
+        "status_url": url_for('sentiment.job_status', job_id=job.id)
+    }), 202
+
 @sentiment_bp.route('/analyze', methods=['POST', 'GET'])
-# Cache the response for 3600 seconds (1 hour).
-# The cache key is generated from the 'topic' form field or query argument.
-@cache.cached(timeout=3600, key_prefix=lambda: request.form.get('topic') or request.args.get('topic', ''))
 def analyze_sentiment_route():
     """
     Analyzes sentiment for a given topic from Reddit and displays results.
     Fetches data from cache/database first, then from Reddit if not found.
+
+    The page is rendered from the same data as the /results API: charts are
+    linked by URL rather than inlined, only the first page of posts is
+    included and later pages are loaded from the API. GET responses carry an
+    ETag, so repeat visits to an unchanged analysis get a 304. With
+    'async=true', the analysis is queued as a background job instead and the
+    job ID is returned immediately (see /jobs/<job_id>).
     """
     # Get 'topic' from form data (POST) or query arguments (GET)
     topic = request.form.get('topic') or request.args.get('topic')
     # Get 'num_records' (limit) from form data or query arguments, default to 10
-    limit = int(request.form.get('num_records', request.args.get('num_records', 10))) 
+    limit = _num_records()
 
     # Validate if topic is provided
-    if not topic:
+    if not topic or not topic.strip():
         # Return a JSON error response if topic is missing
         return jsonify({"error": "Topic is required"}), 400
+    topic = normalize_topic(topic)
 
-    sentiment_results = []
-    # --- Check if data exists in database (using SQLAlchemy query) ---
-    # Query for existing sentiment analysis records for the given topic,
-    # ordered by creation time (descending), limited by 'limit'.
-    db_records = SentimentAnalysis.query.filter_by(topic=topic).order_by(SentimentAnalysis.created_at.desc()).limit(limit).all()
+    if _async_requested():
+        return _submit_job(topic, limit)
 
-    if db_records:
-        logger.info(f"Data for topic '{topic}' fetched from database.")
-        # Convert SQLAlchemy model objects to dictionaries for consistent processing
-        sentiment_results = [
+    analysis = _analysis_page(topic, limit, None, _page_size(), include_comments=_flag('comments'))
+    if not isinstance(analysis, dict):
+        return analysis
+
+    # Render the template with the first page of results and the chart URLs
+    with timed('render_template'):
+        page = render_template('index.html', topic=topic, analysis=analysis)
+    return _conditional(make_response(page))
+
+@sentiment_bp.route('/results', methods=['GET'])
+def results():
+    """
+    Returns a topic's sentiment aggregates and one page of scored posts as JSON.
+
+    Query arguments are 'topic', 'num_records' (the number of most recent
+    posts analyzed), 'page_size', 'cursor' (the 'next_cursor' of the
+    previous page) and 'comments' (also score the submissions' comment
+    trees). Post content is not included and charts are returned as URLs.
+    Responses carry an ETag and honour If-None-Match.
+    """
+    topic = request.args.get('topic')
+    limit = _num_records()
+    if not topic or not topic.strip():
+        return jsonify({"error": "Topic is required"}), 400
+
+    try:
+        analysis = _analysis_page(
+            normalize_topic(topic), limit, request.args.get('cursor'), _page_size(), include_comments=_flag('comments')
+        )
+    except InvalidCursor:
+        return jsonify({"error": "Invalid cursor"}), 400
+    if not isinstance(analysis, dict):
+        return analysis
+    return _conditional(jsonify(analysis))
+
+@sentiment_bp.route('/compare', methods=['GET'])
+def compare():
+    """
+    Compares the sentiment of several topics and returns it as JSON.
+
+    Topics are given as repeated 'topic' arguments or a comma-separated
+    'topics' argument; 'num_records' is the number of most recent posts
+    analyzed per topic. Topics are fetched concurrently and scored together
+    (see pipeline.compare_topics). The response holds each topic's
+    aggregates with a link to its /results, and one comparison chart URL.
+    """
+    topics = request.args.getlist('topic') + request.args.get('topics', '').split(',')
+    topics = list(dict.fromkeys(normalize_topic(topic) for topic in topics if topic.strip()))
+    limit = _num_records()
+    if len(topics) < 2:
+        return jsonify({"error": "At least two topics are required"}), 400
+    max_topics = current_app.config['COMPARE_MAX_TOPICS']
+    if len(topics) > max_topics:
+        return jsonify({"error": f"At most {max_topics} topics can be compared"}), 400
+
+    # Cached like single-topic summaries; the topic order is part of the key
+    # because it is the order the chart is drawn in
+    summary = response_cache.get_or_compute(
+        response_cache.key('compare', limit, topics=json.dumps(topics)),
+        lambda: _summarize_comparison(topics, limit),
+        cacheable=lambda value: isinstance(value, dict),
+        timeout=REFRESH_TTL
+    )
+    if not isinstance(summary, dict):
+        return summary
+
+    data = {
+        "limit": limit,
+        "topics": [
+            dict(entry, results_url=url_for('sentiment.results', topic=entry['topic'], num_records=limit))
+            for entry in summary['topics']
+        ],
+        "chart": _chart_url(summary['chart'], 'comparison', topics, limit)
+    }
+    return _conditional(jsonify(data))
+
+def _summarize_comparison(topics, limit):
+    """
+    Runs the analysis for several topics and computes their aggregates and comparison chart.
+    """
+    try:
+        compared = compare_topics(topics, limit)
+    except Exception as e:
+        logger.exception(f"Error comparing topics {topics}: {e}")
+        return jsonify({"error": "Failed to save results to database."}), 500
+
+    entries = []
+    for topic in topics:
+        sentiment_results, source = compared[topic]
+        entry = _aggregate(sentiment_results)
+        entry.update(topic=topic, source=source)
+        entries.append(entry)
+
+    topic_counts = [(entry['topic'], entry['sentiment_counts']) for entry in entries if entry['total']]
+    return {
+        "topics": entries,
+        "chart": publish_chart(generate_comparison_chart(topic_counts)) if topic_counts else None
+    }
+
+@sentiment_bp.route('/charts/<digest>.png', methods=['GET'])
+def chart(digest):
+    """
+    Serves a chart image by the content hash in its URL.
+    The image behind a URL never changes, so it may be cached indefinitely.
+
+    Chart URLs also name the chart ('chart') and the data it was drawn from
+    ('topic', 'num_records'), signed ('sig', see _chart_url). If the image is
+    no longer in the shared cache (evicted, or published by another worker)
+    and the signature is valid, it is drawn again from the stored results and
+    served if it still matches the hash.
+    """
+    png = load_chart(digest)
+    if png is None:
+        png = _redraw_chart(
+            digest, request.args.get('chart'), request.args.getlist('topic'),
+            request.args.get('num_records', type=int), request.args.get('sig', '')
+        )
+    if png is None:
+        return jsonify({"error": "Chart not found"}), 404
+    response = Response(png, mimetype='image/png')
+    response.headers['Cache-Control'] = f'public, max-age={CHART_MAX_AGE}, immutable'
+    response.set_etag(digest)
+    return response.make_conditional(request)
+
+def _chart_signer():
+    return Signer(current_app.secret_key, salt='chart-url')
+
+def _chart_source(digest, name, topics, limit):
+    # The part of a chart URL its signature covers
+    return json.dumps([digest, name, list(topics), limit])
+
+def _chart_url(digest, name, topics, limit):
+    """
+    Returns the URL of a published chart, or None if there is no chart.
+
+    Besides the content hash, the URL carries what the chart was drawn from
+    and a signature over both, so a chart is only ever redrawn for a URL this
+    app handed out, never for made-up hashes or limits.
+    """
+    if digest is None:
+        return None
+    signature = _chart_signer().get_signature(_chart_source(digest, name, topics, limit))
+    return url_for(
+        'sentiment.chart', digest=digest, chart=name, topic=list(topics), num_records=limit, sig=signature.decode('ascii')
+    )
+
+def _redraw_chart(digest, name, topics, limit, signature):
+    """
+    Draws a chart again from the database alone (nothing is fetched from
+    Reddit) and returns its PNG bytes, or None if the URL was not issued by
+    this app or the stored results no longer produce the requested image.
+    """
+    if not topics or limit is None or name not in ('bar_chart', 'word_cloud', 'comparison'):
+        return None
+    if not _chart_signer().verify_signature(_chart_source(digest, name, topics, limit), signature):
+        return None
+    # Never read more rows than the API would analyze
+    limit = _bounded_records(limit)
+    topics = [normalize_topic(topic) for topic in topics]
+    if name == 'comparison':
+        topic_counts = []
+        for topic in topics:
+            counts = load_recent_results(topic, limit).sentiment_counts()
+            if any(counts.values()):
+                topic_counts.append((topic, {label: counts[label] for label in SENTIMENT_ORDER}))
+        image_b64 = generate_comparison_chart(topic_counts) if topic_counts else None
+    else:
+        sentiment_results = load_recent_results(topics[0], limit)
+        if not sentiment_results:
+            return None
+        bar_chart_b64, word_cloud_b64 = render_charts(topics[0], limit, sentiment_results)
+        image_b64 = bar_chart_b64 if name == 'bar_chart' else word_cloud_b64
+    if publish_chart(image_b64) != digest:
+        return None
+    return load_chart(digest) or base64.b64decode(image_b64)
+
+@sentiment_bp.route('/trend', methods=['GET'])
+def trend():
+    """
+    Returns how sentiment on a topic moved over time, as JSON.
+
+    Query arguments are 'topic', 'start' and 'end' (ISO 8601, UTC; defaults
+    to the last 30 days), 'granularity' ('hour' or 'day'; chosen from the
+    range if omitted) and 'points' (the most points returned; longer ranges
+    are downsampled). Answered from the rollup tables alone.
+    """
+    topic = request.args.get('topic')
+    if not topic or not topic.strip():
+        return jsonify({"error": "Topic is required"}), 400
+    granularity = request.args.get('granularity')
+    if granularity is not None and granularity not in ROLLUP_GRANULARITIES:
+        return jsonify({"error": f"Granularity must be one of {', '.join(ROLLUP_GRANULARITIES)}"}), 400
+    try:
+        end = _parse_time(request.args.get('end')) or datetime.now(timezone.utc).replace(tzinfo=None)
+        start = _parse_time(request.args.get('start')) or end - DEFAULT_TREND_SPAN
+    except ValueError:
+        return jsonify({"error": "start and end must be ISO 8601 timestamps"}), 400
+    if start >= end:
+        return jsonify({"error": "start must be before end"}), 400
+    points = request.args.get('points', type=int)
+    if 'points' in request.args and (points is None or points < 1):
+        return jsonify({"error": "points must be a positive integer"}), 400
+
+    topic = normalize_topic(topic)
+    data = query_trend(topic, start, end, granularity, points)
+    data.update(topic=topic, start=start.isoformat(), end=end.isoformat())
+    return _conditional(jsonify(data))
+
+def _parse_time(value):
+    """
+    Parses an ISO 8601 query argument into a naive UTC datetime, or returns None if it is empty.
+    """
+    if not value:
+        return None
+    parsed = datetime.fromisoformat(value)
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone(timezone.utc).replace(tzinfo=None)
+    return parsed
+
+class InvalidCursor(ValueError):
+    """
+    Raised when a pagination cursor cannot be decoded.
+    """
+
+def _num_records():
+    """
+    Returns the requested 'num_records' (form data, then query arguments;
+    10 by default), bounded by API_MAX_RECORDS.
+    """
+    limit = request.form.get('num_records', type=int)
+    if limit is None:
+        limit = request.args.get('num_records', 10, type=int)
+    return _bounded_records(limit)
+
+def _bounded_records(limit):
+    return max(1, min(limit, current_app.config['API_MAX_RECORDS']))
+
+def _page_size():
+    """
+    Returns the requested 'page_size', bounded by API_MAX_PAGE_SIZE.
+    """
+    size = request.args.get('page_size', type=int) or current_app.config['API_PAGE_SIZE']
+    return max(1, min(size, current_app.config['API_MAX_PAGE_SIZE']))
+
+def _encode_cursor(row, position):
+    """
+    Encodes the key of the last row served and the number of rows served so far.
+    """
+    raw = json.dumps([row['created_at'].isoformat(), row['id'], position])
+    return base64.urlsafe_b64encode(raw.encode('utf-8')).decode('ascii').rstrip('=')
+
+def _decode_cursor(cursor):
+    """
+    Returns ((created_at, id), position) for a cursor made by _encode_cursor.
+    """
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        created_at, row_id, position = json.loads(raw)
+        return (datetime.fromisoformat(created_at), int(row_id)), int(position)
+    except (ValueError, TypeError) as e:
+        raise InvalidCursor(str(e)) from e
+
+def _conditional(response):
+    """
+    Adds an ETag to a response and turns it into a 304 if the client's copy is current.
+    """
+    # Clients may store the response but must revalidate it before reuse
+    response.headers['Cache-Control'] = 'no-cache'
+    response.add_etag()
+    return response.make_conditional(request)
+
+def _analysis_page(topic, limit, cursor, page_size, include_comments=False):
+    """
+    Builds the data shared by the /results API and the HTML view: the
+    topic's aggregates, chart URLs and one page of results.
+
+    Returns:
+        dict: The analysis data, or a (JSON response, status) tuple if there
+              is nothing to show.
+
+    Raises:
+        InvalidCursor: If the cursor cannot be decoded.
+    """
+    after, position = (None, 0) if not cursor else _decode_cursor(cursor)
+
+    # Aggregates and charts are cached per normalized topic and limit (see app/response_cache.py);
+    # error and "no posts" responses are not cached. Entries go stale with the
+    # topic itself (TOPIC_REFRESH_TTL), so a refresh is not hidden behind the cache
+    params = {'comments': 1} if include_comments else {}
+    summary = response_cache.get_or_compute(
+        response_cache.key(topic, limit, **params),
+        lambda: _summarize_analysis(topic, limit, include_comments),
+        cacheable=lambda value: isinstance(value, dict),
+        timeout=REFRESH_TTL
+    )
+    if not isinstance(summary, dict):
+        return summary
+
+    remaining = summary['total'] - position
+    rows = query_results_page(topic, min(page_size, remaining), after) if remaining > 0 else []
+    position += len(rows)
+    next_cursor = _encode_cursor(rows[-1], position) if rows and position < summary['total'] else None
+
+    return {
+        "topic": topic,
+        "limit": limit,
+        "source": summary['source'],
+        "total": summary['total'],
+        "sentiment_counts": summary['sentiment_counts'],
+        "mean_score": summary['mean_score'],
+        "comments": summary.get('comments'),
+        "charts": {
+            name: _chart_url(digest, name, [topic], limit) for name, digest in summary['charts'].items()
+        },
+        "results": [
             {
-                "title": record.title,
-                "content": record.content,
-                "sentiment": record.sentiment,
-                "score": record.score
+                "id": row['id'],
+                "post_id": row['post_id'],
+                "title": row['title'],
+                "url": row['url'],
+                "sentiment": row['sentiment'],
+                "score": row['score'],
+                "created_at": row['created_at'].isoformat() if row['created_at'] else None
             }
-            for record in db_records
-        ]
-    else:
-        logger.info(f"No data for topic '{topic}' found in database. Fetching from Reddit.")
-        # --- Fetch Reddit data if not in database ---
-        posts = fetch_reddit_data(topic, limit)
+            for row in rows
+        ],
+        "next_cursor": next_cursor,
+        "next_url": url_for(
+            'sentiment.results', topic=topic, num_records=limit, page_size=page_size, cursor=next_cursor, **params
+        ) if next_cursor else None
+    }
 
-        if not posts:
-            logger.warning(f"No Reddit posts found for topic '{topic}'.")
-            return jsonify({"message": f"No posts found for topic '{topic}' to analyze."}), 200
+def _summarize_analysis(topic, limit, include_comments=False):
+    """
+    Runs the analysis for a topic and computes its aggregates and charts.
 
-        # --- Analyze sentiment of fetched posts ---
-        sentiment_results = analyze_sentiment(posts)
+    With `include_comments`, the submissions' comments are scored too
+    (see pipeline.analyze_comments) and summarized under 'comments'.
 
-        # --- Save new results to database ---
+    Returns:
+        dict: The source, post count, per-label counts, mean score and chart
+              content hashes, or a (JSON response, status) tuple if there is
+              nothing to summarize.
+    """
+    try:
+        sentiment_results, source = analyze_topic(topic, limit)
+    except Exception as e:
+        logger.exception(f"Error saving sentiment results to database: {e}")
+        # Optionally, return an error response
+        return jsonify({"error": "Failed to save results to database."}), 500
+
+    if source == 'database':
+        logger.info(f"Data for topic '{topic}' fetched from database.")
+    elif not sentiment_results:
+        logger.warning(f"No Reddit posts found for topic '{topic}'.")
+        return jsonify({"message": f"No posts found for topic '{topic}' to analyze."}), 200
+    else:
+        logger.info(f"Sentiment analysis results for topic '{topic}' saved to database.")
+
+    # --- Generate graphs (bar chart and word cloud) ---
+    # Rendered once here and then served from their own content-hashed URLs
+    bar_chart_b64, word_cloud_b64 = render_charts(topic, limit, sentiment_results)
+
+    summary = _aggregate(sentiment_results)
+    summary.update(
+        source=source,
+        charts={
+            "bar_chart": publish_chart(bar_chart_b64),
+            "word_cloud": publish_chart(word_cloud_b64)
+        }
+    )
+    if include_comments:
         try:
-            for result in sentiment_results:
-                # Create a new SentimentAnalysis record and add to session
-                new_record = SentimentAnalysis(
-                    topic=topic,
-                    title=result['title'],
-                    content=result['content'],
-                    sentiment=result['sentiment'],
-                    score=result['score']
-                )
-                db.session.add(new_record)
-            db.session.commit() # Commit all new records to the database
-            logger.info(f"Sentiment analysis results for topic '{topic}' saved to database.")
+            comments = analyze_comments(topic, limit)
         except Exception as e:
-            db.session.rollback() # Rollback transaction in case of error
-            logger.error(f"Error saving sentiment results to database: {e}")
-            # Optionally, return an error response
-            return jsonify({"error": "Failed to save results to database."}), 500
+            logger.exception(f"Error analyzing comments for topic '{topic}': {e}")
+            return jsonify({"error": "Failed to analyze comments."}), 500
+        summary['comments'] = _aggregate(comments)
+    return summary
 
-    # --- Generate graphs (bar chart and word cloud) ---
-    # These functions return base64 encoded image strings
-    bar_chart_b64, word_cloud_b64 = generate_graphs(sentiment_results, topic)
-
-    # Render the template with the data and base64 images
-    return render_template(
-        'index.html',
-        topic=topic,
-        sentiment_results=sentiment_results,
-        bar_chart_b64=bar_chart_b64,
-        word_cloud_b64=word_cloud_b64
-    )
\ No newline at end of file
+def _aggregate(results):
+    """
+    Returns the count, per-label counts and mean score of scored posts or comments.
+    """
+    if isinstance(results, SentimentResults):
+        counts = results.sentiment_counts()
+        return {
+            "total": len(results),
+            "sentiment_counts": {label: counts[label] for label in SENTIMENT_ORDER},
+            "mean_score": results.mean_score()
+        }
+    counts = Counter(result['sentiment'] for result in results)
+    return {
+        "total": len(results),
+        "sentiment_counts": {label: counts[label] for label in SENTIMENT_ORDER},
+        "mean_score": sum(result['score'] for result in results) / len(results) if results else None
+    }
+
+@sentiment_bp.route('/jobs', methods=['POST'])
+def submit_job():
+    """
+    Queues a background analysis job for a topic and returns its ID.
+    Submitting the same topic and limit while a job is in flight returns that job.
+    """
+    topic = request.form.get('topic') or request.args.get('topic')
+    limit = _num_records()
+    if not topic or not topic.strip():
+        return jsonify({"error": "Topic is required"}), 400
+    return _submit_job(normalize_topic(topic), limit)
+
+@sentiment_bp.route('/jobs/<job_id>', methods=['GET'])
+def job_status(job_id):
+    """
+    Returns the status, progress and (once completed) results of an analysis
+    job, with chart URLs instead of inline images.
+    """
+    job = jobs.get(job_id)
+    if job is None:
+        return jsonify({"error": "Job not found"}), 404
+    data = job.to_dict()
+    if data['result'] is not None:
+        # Jobs keep chart content hashes; clients get the same URLs as /results
+        data['result'] = dict(data['result'], charts={
+            name: _chart_url(digest, name, [job.topic], job.limit) for name, digest in data['result']['charts'].items()
+        })
+    return jsonify(data)
+
+
+@sentiment_bp.route('/metrics', methods=['GET'])
+def metrics():
+    """
+    Exposes per-stage latency histograms, request timings and cache
+    hit/miss counters in the Prometheus text format.
+    """
+    return Response(REGISTRY.render(), mimetype='text/plain; version=0.0.4')
@@ -0,0 +1,103 @@
+import logging
+import os
+import threading
+import time
+
+
+def _process_started_at():
+    """
+    Returns when this process started, on the time.perf_counter() clock.
+
+    Read from /proc on Linux, so interpreter startup and the imports made
+    before this module (Flask, SQLAlchemy, ...) are included; elsewhere it
+    falls back to the time this module is imported.
+    """
+    now = time.perf_counter()
+    try:
+        with open('/proc/self/stat') as stat_file:
+            # The process name may contain spaces, so fields are counted after its closing ')'
+            start_ticks = int(stat_file.read().rsplit(')', 1)[1].split()[19])
+        with open('/proc/uptime') as uptime_file:
+            uptime = float(uptime_file.read().split()[0])
+        age = uptime - start_ticks / os.sysconf('SC_CLK_TCK')
+    except (OSError, ValueError, IndexError, AttributeError):
+        return now
+    return now - max(age, 0.0)
+
+
+# When app startup began: when the process started
+STARTED_AT = _process_started_at()
+
+# NLTK resources the app needs, by download name
+NLTK_RESOURCES = {
+    'vader_lexicon': 'sentiment/vader_lexicon.zip',
+    'stopwords': 'corpora/stopwords',
+}
+
+logger = logging.getLogger(__name__)
+
+
+def elapsed():
+    """
+    Returns the seconds since app startup began.
+    """
+    return time.perf_counter() - STARTED_AT
+
+
+def ensure_nltk_data(data_path, offline=None):
+    """
+    Makes sure the NLTK resources the app needs are available locally.
+
+    The bundled data directory is checked on disk first, so no network
+    request is made when the data is already there. Missing resources are
+    downloaded unless offline mode is enabled, in which case startup fails
+    with a clear error instead.
+
+    Args:
+        data_path (str): The NLTK data directory to use and download into.
+        offline (bool): Never download. Defaults to the NLTK_OFFLINE setting.
+
+    Returns:
+        list: The names of the resources that had to be downloaded.
+
+    Raises:
+        RuntimeError: If resources are missing in offline mode.
+    """
+    import nltk
+
+    if offline is None:
+        offline = os.getenv('NLTK_OFFLINE', '').lower() in ('1', 'true', 'yes')
+    # Add the custom NLTK data path if it's not already in the list
+    if data_path not in nltk.data.path:
+        nltk.data.path.append(data_path)
+
+    missing = []
+    for name, resource in NLTK_RESOURCES.items():
+        try:
+            nltk.data.find(resource)
+        except LookupError:
+            missing.append(name)
+
+    if missing and offline:
+        raise RuntimeError(f"NLTK data missing from {data_path} in offline mode: {', '.join(missing)}")
+    for name in missing:
+        logger.info(f"Downloading missing NLTK resource '{name}'...")
+        nltk.download(name, download_dir=data_path, quiet=True)
+    return missing
+
+
+def install_first_request_timer(app):
+    """
+    Reports the time from startup to the first request the app finishes handling.
+    """
+    state = {'reported': False}
+    lock = threading.Lock()
+
+    @app.after_request
+    def report_first_request(response):
+        if not state['reported']:
+            with lock:
+                if not state['reported']:
+                    state['reported'] = True
+                    logger.info(f"First request served {elapsed():.2f}s after startup.", extra={'startup_s': round(elapsed(), 3)})
+        return response
@@ -0,0 +1,641 @@
+from datetime import datetime, timezone
+
+from sqlalchemy import delete, func, inspect, or_, select, text, update
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.exc import IntegrityError
+
+from app import db
+from app.metrics import timed
+from app.models import CommentSentiment, PostTermFrequency, SentimentAnalysis, SentimentRollup, TopicRefreshState
+from app.response_cache import normalize_topic
+from app.results import SentimentResults, label_codes
+from app.tokens import term_counts
+
+# Columns returned by default when reading results back for display
+RESULT_COLUMNS = ('title', 'content', 'sentiment', 'score')
+# Columns returned by the paginated results API (no 'content', and the keys cursors are built from)
+PAGE_COLUMNS = ('id', 'post_id', 'title', 'url', 'sentiment', 'score', 'created_at')
+# Columns refreshed when a post that is already stored for a topic is ingested again
+UPSERT_UPDATE_COLUMNS = ('title', 'content', 'sentiment', 'score', 'url', 'reddit_created_at', 'term_count', 'rolled_up')
+# Columns refreshed when a comment that is already stored is ingested again
+COMMENT_UPDATE_COLUMNS = ('parent_id', 'content', 'sentiment', 'score', 'reddit_created_at')
+# Columns returned when reading stored comments
+COMMENT_COLUMNS = ('analysis_id', 'comment_id', 'parent_id', 'sentiment', 'score')
+# Time buckets SentimentRollup is kept for
+ROLLUP_GRANULARITIES = ('hour', 'day')
+# SentimentRollup column counting each sentiment label
+ROLLUP_LABEL_COLUMNS = {'POSITIVE': 'positive_count', 'NEUTRAL': 'neutral_count', 'NEGATIVE': 'negative_count'}
+# SentimentRollup columns that are running totals
+ROLLUP_VALUE_COLUMNS = ('post_count', 'positive_count', 'neutral_count', 'negative_count', 'score_sum', 'score_sq_sum')
+# Rows added to the rollups per commit when backfilling rows saved before rollups existed
+ROLLUP_BACKFILL_BATCH = 1000
+
+
+def init_db():
+    """
+    Creates missing tables and brings existing ones up to date with the models.
+
+    db.create_all() never alters a table that already exists, so columns and
+    indexes added to a model since the table was created are added here.
+    Only nullable columns are added, which keeps the upgrade safe for
+    databases that already hold data.
+    """
+    db.create_all()
+
+    inspector = inspect(db.engine)
+    for table in db.metadata.sorted_tables:
+        if not inspector.has_table(table.name):
+            continue
+        existing = {column['name'] for column in inspector.get_columns(table.name)}
+        with db.engine.begin() as connection:
+            for column in table.columns:
+                if column.name in existing or not column.nullable:
+                    continue
+                column_type = column.type.compile(dialect=db.engine.dialect)
+                connection.execute(text(f'ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}'))
+            for index in table.indexes:
+                index.create(connection, checkfirst=True)
+
+    if db.engine.dialect.name == 'sqlite':
+        # Rows saved when created_at was a server default hold CURRENT_TIMESTAMP
+        # text without microseconds; rewrite them in the format SQLAlchemy binds
+        # datetimes in, so keyset pages can compare the raw, indexed column
+        with db.engine.begin() as connection:
+            connection.exec_driver_sql(
+                "UPDATE sentiment_analysis SET created_at = strftime('%Y-%m-%d %H:%M:%f', created_at) || '000' "
+                "WHERE length(created_at) = 19"
+            )
+
+    normalize_stored_topics()
+    backfill_rollups()
+
+
+def normalize_stored_topics():
+    """
+    Moves rows stored under a topic that is not in its canonical form (saved
+    before topics were normalized, e.g. 'machine learning ') to the canonical
+    topic, so they are found again.
+
+    A post stored under both spellings keeps its canonical row. The rollups of
+    the merged topics are rebuilt by backfill_rollups, and the refresh state of
+    the canonical topic is kept if it has one.
+
+    Returns:
+        int: The number of topics renamed.
+    """
+    stored = set(db.session.scalars(select(SentimentAnalysis.topic).distinct()))
+    stored.update(db.session.scalars(select(TopicRefreshState.topic)))
+    renames = {topic: normalize_topic(topic) for topic in stored if normalize_topic(topic) != topic}
+    for old, new in renames.items():
+        duplicates = select(SentimentAnalysis.id).where(
+            SentimentAnalysis.topic == old,
+            SentimentAnalysis.post_id.in_(
+                select(SentimentAnalysis.post_id).where(SentimentAnalysis.topic == new, SentimentAnalysis.post_id.is_not(None))
+            )
+        )
+        duplicate_ids = db.session.scalars(duplicates).all()
+        if duplicate_ids:
+            # SQLite does not enforce ON DELETE CASCADE unless foreign keys are enabled
+            db.session.execute(delete(CommentSentiment).where(CommentSentiment.analysis_id.in_(duplicate_ids)))
+            db.session.execute(delete(PostTermFrequency).where(PostTermFrequency.analysis_id.in_(duplicate_ids)))
+            db.session.execute(delete(SentimentAnalysis).where(SentimentAnalysis.id.in_(duplicate_ids)))
+        db.session.execute(
+            update(SentimentAnalysis.__table__)
+            .where(SentimentAnalysis.__table__.c.topic.in_([old, new]))
+            .values(topic=new, rolled_up=None)
+        )
+        db.session.execute(delete(SentimentRollup).where(SentimentRollup.topic.in_([old, new])))
+
+        state = db.session.get(TopicRefreshState, old)
+        if state is not None:
+            if db.session.get(TopicRefreshState, new) is None:
+                db.session.add(TopicRefreshState(
+                    topic=new, newest_created_utc=state.newest_created_utc,
+                    newest_post_id=state.newest_post_id, refreshed_at=state.refreshed_at
+                ))
+            db.session.delete(state)
+    if renames:
+        db.session.commit()
+    return len(renames)
+
+
+def backfill_rollups(batch_size=ROLLUP_BACKFILL_BATCH):
+    """
+    Adds rows that are not counted in SentimentRollup yet (saved before
+    rollups existed) to the rollups and marks them as counted.
+
+    Returns:
+        int: The number of rows added.
+    """
+    created_at = func.coalesce(SentimentAnalysis.reddit_created_at, SentimentAnalysis.created_at)
+    added = 0
+    while True:
+        rows = db.session.execute(
+            select(SentimentAnalysis.id, SentimentAnalysis.topic, created_at, SentimentAnalysis.sentiment, SentimentAnalysis.score)
+            .where(SentimentAnalysis.rolled_up.is_(None))
+            .limit(batch_size)
+        ).all()
+        if not rows:
+            return added
+        by_topic = {}
+        now = datetime.now(timezone.utc).replace(tzinfo=None)
+        for _, topic, timestamp, sentiment, score in rows:
+            by_topic.setdefault(topic, []).append((timestamp or now, sentiment, score))
+        for topic, posts in by_topic.items():
+            update_rollups(topic, added=posts)
+        db.session.execute(
+            update(SentimentAnalysis.__table__)
+            .where(SentimentAnalysis.__table__.c.id.in_([row[0] for row in rows]))
+            .values(rolled_up=True)
+        )
+        db.session.commit()
+        added += len(rows)
+
+
+def _to_datetime(timestamp):
+    """
+    Converts a Reddit 'created_utc' timestamp to a naive UTC datetime.
+    """
+    if timestamp is None:
+        return None
+    return datetime.fromtimestamp(timestamp, timezone.utc).replace(tzinfo=None)
+
+
+def get_refresh_state(topic):
+    """
+    Returns the topic's TopicRefreshState, or None if it was never fetched
+    from Reddit (or was stored before refreshes were tracked).
+    """
+    with timed('db_read'):
+        return db.session.get(TopicRefreshState, topic)
+
+
+def is_stale(state, ttl):
+    """
+    Returns True if a topic's posts were last fetched more than `ttl` seconds ago.
+    """
+    if state is None:
+        return True
+    age = datetime.now(timezone.utc).replace(tzinfo=None) - state.refreshed_at
+    return age.total_seconds() >= ttl
+
+
+def record_refresh(topic, results):
+    """
+    Records that a topic was just fetched, advancing its high-water mark to
+    the newest of the fetched posts. The caller is responsible for committing.
+
+    Args:
+        topic (str): The topic that was refreshed.
+        results (list): The posts (or their analyze_sentiment results)
+                        fetched, with 'id' and 'created_utc' keys.
+
+    Returns:
+        TopicRefreshState: The updated state.
+    """
+    state = db.session.get(TopicRefreshState, topic)
+    if state is None:
+        state = TopicRefreshState(topic=topic)
+        db.session.add(state)
+    for result in results:
+        created_utc = result.get('created_utc')
+        if created_utc is not None and (state.newest_created_utc is None or created_utc > state.newest_created_utc):
+            state.newest_created_utc = created_utc
+            state.newest_post_id = result.get('id')
+    state.refreshed_at = datetime.now(timezone.utc).replace(tzinfo=None)
+    return state
+
+
+def insert_ignore(model, rows, connection=None):
+    """
+    Inserts rows into the model's table, skipping rows that violate a
+    unique or primary key constraint.
+
+    Uses INSERT ... ON CONFLICT DO NOTHING on SQLite and PostgreSQL, and
+    falls back to per-row merges (or per-row inserts in savepoints, on a
+    connection) on other databases.
+
+    Args:
+        model: The SQLAlchemy model class to insert into.
+        rows (list): A list of dictionaries mapping column names to values.
+        connection: A Connection to insert on instead of the session, for
+                    writes that must not touch the caller's transaction.
+    """
+    if not rows:
+        return
+
+    dialect = db.engine.dialect.name
+    if dialect == 'sqlite':
+        statement = sqlite.insert(model).on_conflict_do_nothing()
+    elif dialect == 'postgresql':
+        statement = postgresql.insert(model).on_conflict_do_nothing()
+    elif connection is None:
+        for row in rows:
+            db.session.merge(model(**row))
+        return
+    else:
+        for row in rows:
+            try:
+                with connection.begin_nested():
+                    connection.execute(model.__table__.insert(), row)
+            except IntegrityError:
+                pass
+        return
+
+    # Passing a list of parameter sets makes SQLAlchemy use executemany
+    (connection if connection is not None else db.session).execute(statement, rows)
+
+
+def upsert_sentiment_results(topic, results):
+    """
+    Saves sentiment results for a topic in bulk.
+
+    Results that carry a Reddit post ID already stored for the topic update
+    the existing row, so ingesting the same posts twice never duplicates
+    them. On SQLite and PostgreSQL this is a single executemany
+    INSERT ... ON CONFLICT (topic, post_id) DO UPDATE ... RETURNING; other
+    databases, and SQLite before 3.35 (no RETURNING), fall back to a lookup
+    and add per row. The content of every saved row is
+    tokenized into PostTermFrequency. The caller is responsible for committing.
+
+    Args:
+        topic (str): The topic the results belong to.
+        results (list): analyze_sentiment results, optionally with the
+                        'id', 'url' and 'created_utc' keys of the fetched post.
+
+    Returns:
+        list: The SentimentAnalysis IDs of the saved rows.
+    """
+    rows = {}
+    for position, result in enumerate(results):
+        # A post seen twice in one batch is written once, with its latest values
+        key = result.get('id') or position
+        rows[key] = {
+            'topic': topic,
+            'title': result['title'],
+            'content': result['content'],
+            'sentiment': result['sentiment'],
+            'score': result['score'],
+            'post_id': result.get('id'),
+            'url': result.get('url'),
+            'reddit_created_at': _to_datetime(result.get('created_utc')),
+            'rolled_up': True
+        }
+    rows = list(rows.values())
+    if not rows:
+        return []
+
+    # Tokenize up front so the number of distinct words is saved with the row
+    row_terms = [term_counts(row['content']) for row in rows]
+    for row, counts in zip(rows, row_terms):
+        row['term_count'] = len(counts)
+
+    # Rows being replaced are taken out of the rollups before the new values go in
+    # (rows that were never counted in them have nothing to take out)
+    post_ids = [row['post_id'] for row in rows if row['post_id'] is not None]
+    replaced = []
+    if post_ids:
+        replaced = db.session.execute(
+            select(
+                func.coalesce(SentimentAnalysis.reddit_created_at, SentimentAnalysis.created_at),
+                SentimentAnalysis.sentiment,
+                SentimentAnalysis.score
+            ).where(
+                SentimentAnalysis.topic == topic,
+                SentimentAnalysis.post_id.in_(post_ids),
+                SentimentAnalysis.rolled_up.is_(True)
+            )
+        ).all()
+    ingested_at = datetime.now(timezone.utc).replace(tzinfo=None)
+    update_rollups(
+        topic,
+        removed=replaced,
+        added=[(row['reddit_created_at'] or ingested_at, row['sentiment'], row['score']) for row in rows]
+    )
+
+    dialect = db.engine.dialect.name
+    if dialect in ('sqlite', 'postgresql') and db.engine.dialect.insert_returning:
+        insert = sqlite.insert if dialect == 'sqlite' else postgresql.insert
+        # Core insert on the table skips ORM bookkeeping for the bulk write
+        statement = insert(SentimentAnalysis.__table__)
+        statement = statement.on_conflict_do_update(
+            index_elements=['topic', 'post_id'],
+            set_={column: statement.excluded[column] for column in UPSERT_UPDATE_COLUMNS}
+        ).returning(SentimentAnalysis.__table__.c.id, sort_by_parameter_order=True)
+        row_ids = db.session.execute(statement, rows).scalars().all()
+    else:
+        records = []
+        for row in rows:
+            existing = None
+            if row['post_id'] is not None:
+                existing = SentimentAnalysis.query.filter_by(topic=topic, post_id=row['post_id']).first()
+            if existing is None:
+                existing = SentimentAnalysis(**row)
+                db.session.add(existing)
+            else:
+                for column in UPSERT_UPDATE_COLUMNS:
+                    setattr(existing, column, row[column])
+            records.append(existing)
+        db.session.flush()
+        row_ids = [record.id for record in records]
+
+    index_terms(row_ids, row_terms)
+    return row_ids
+
+
+def bucket_start(timestamp, granularity):
+    """
+    Returns the start of the hour or day containing a timestamp.
+    """
+    if granularity == 'hour':
+        return timestamp.replace(minute=0, second=0, microsecond=0)
+    return timestamp.replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+def update_rollups(topic, removed=(), added=()):
+    """
+    Applies ingested (and replaced) posts to the topic's hourly and daily
+    SentimentRollup rows.
+
+    Each bucket's change is summed in memory and written with one
+    INSERT ... ON CONFLICT DO UPDATE that adds it to the stored totals, so
+    ingest cost grows with the number of buckets touched, not the number
+    of stored posts. The caller is responsible for committing.
+
+    Args:
+        topic (str): The topic the posts belong to.
+        removed (iterable): (created_at, sentiment, score) of posts whose
+                            previous values are being replaced.
+        added (iterable): (created_at, sentiment, score) of posts being saved.
+    """
+    deltas = {}
+    for sign, posts in ((-1, removed), (1, added)):
+        for created_at, sentiment, score in posts:
+            for granularity in ROLLUP_GRANULARITIES:
+                key = (granularity, bucket_start(created_at, granularity))
+                delta = deltas.get(key)
+                if delta is None:
+                    delta = deltas[key] = dict.fromkeys(ROLLUP_VALUE_COLUMNS, 0)
+                delta['post_count'] += sign
+                delta[ROLLUP_LABEL_COLUMNS[sentiment]] += sign
+                delta['score_sum'] += sign * score
+                delta['score_sq_sum'] += sign * score * score
+
+    rows = [
+        dict(delta, topic=topic, granularity=granularity, bucket_start=start)
+        for (granularity, start), delta in deltas.items()
+        # Re-ingesting a post unchanged cancels out
+        if any(delta.values())
+    ]
+    if not rows:
+        return
+
+    table = SentimentRollup.__table__
+    dialect = db.engine.dialect.name
+    if dialect in ('sqlite', 'postgresql'):
+        insert = sqlite.insert if dialect == 'sqlite' else postgresql.insert
+        statement = insert(table)
+        statement = statement.on_conflict_do_update(
+            index_elements=['topic', 'granularity', 'bucket_start'],
+            set_={column: table.c[column] + statement.excluded[column] for column in ROLLUP_VALUE_COLUMNS}
+        )
+        db.session.execute(statement, rows)
+    else:
+        for row in rows:
+            rollup = db.session.get(SentimentRollup, (topic, row['granularity'], row['bucket_start']))
+            if rollup is None:
+                db.session.add(SentimentRollup(**row))
+            else:
+                for column in ROLLUP_VALUE_COLUMNS:
+                    setattr(rollup, column, getattr(rollup, column) + row[column])
+
+
+def index_terms(row_ids, row_terms):
+    """
+    Stores the word counts of saved posts in PostTermFrequency.
+
+    Any counts already stored for the rows are replaced, so re-ingesting a
+    post with edited content keeps its counts current.
+
+    Args:
+        row_ids (list): SentimentAnalysis IDs.
+        row_terms (list): The word counts of each row (see tokens.term_counts),
+                          in the same order.
+    """
+    if not row_ids:
+        return
+
+    term_rows = [
+        {'analysis_id': row_id, 'term': term, 'count': count}
+        for row_id, counts in zip(row_ids, row_terms)
+        for term, count in counts.items()
+    ]
+    table = PostTermFrequency.__table__
+    db.session.execute(delete(table).where(table.c.analysis_id.in_(row_ids)))
+    if term_rows:
+        db.session.execute(table.insert(), term_rows)
+
+
+def aggregate_term_counts(topic, limit):
+    """
+    Sums the stored word counts of the most recent posts for a topic.
+
+    Args:
+        topic (str): The topic to aggregate.
+        limit (int): Number of most recent posts to include, matching
+                     query_recent_results.
+
+    Returns:
+        dict: Word frequencies, or None if any of the posts has not been
+              tokenized yet (e.g. rows saved before the term index existed).
+    """
+    recent = (
+        select(SentimentAnalysis.id, SentimentAnalysis.term_count)
+        .where(SentimentAnalysis.topic == topic)
+        .order_by(SentimentAnalysis.created_at.desc(), SentimentAnalysis.id.desc())
+        .limit(limit)
+        .subquery()
+    )
+    with timed('db_read'):
+        unindexed = db.session.execute(
+            select(func.count()).select_from(recent).where(recent.c.term_count.is_(None))
+        ).scalar()
+        if unindexed:
+            return None
+
+        statement = (
+            select(PostTermFrequency.term, func.sum(PostTermFrequency.count))
+            .where(PostTermFrequency.analysis_id.in_(select(recent.c.id)))
+            .group_by(PostTermFrequency.term)
+        )
+        return dict(db.session.execute(statement).all())
+
+
+def query_recent_results(topic, limit, columns=RESULT_COLUMNS, as_dicts=True):
+    """
+    Reads the most recent sentiment results for a topic.
+
+    Only the requested columns are selected and rows are returned without
+    building ORM objects, so callers that don't need the large 'content'
+    column never load it.
+
+    Args:
+        topic (str): The topic to read results for.
+        limit (int): The maximum number of results to return.
+        columns (tuple): SentimentAnalysis column names to select.
+                         Defaults to RESULT_COLUMNS.
+        as_dicts (bool): Return dictionaries keyed by column name instead of
+                         row tuples. Defaults to True.
+
+    Returns:
+        list: The results, newest first.
+    """
+    statement = (
+        select(*[getattr(SentimentAnalysis, column) for column in columns])
+        .where(SentimentAnalysis.topic == topic)
+        .order_by(SentimentAnalysis.created_at.desc(), SentimentAnalysis.id.desc())
+        .limit(limit)
+    )
+    with timed('db_read'):
+        result = db.session.execute(statement)
+        if as_dicts:
+            return [dict(row) for row in result.mappings()]
+        return [tuple(row) for row in result]
+
+
+def load_recent_results(topic, limit):
+    """
+    Reads the most recent sentiment results for a topic into a SentimentResults.
+
+    Titles, labels and scores are read straight into columns. The 'content'
+    column is only fetched if a caller reads it, e.g. to count words for
+    rows that predate the term index.
+
+    Args:
+        topic (str): The topic to read results for.
+        limit (int): The maximum number of results to return.
+
+    Returns:
+        SentimentResults: The results, newest first.
+    """
+    rows = query_recent_results(topic, limit, columns=('id', 'title', 'sentiment', 'score'), as_dicts=False)
+    row_ids = [row[0] for row in rows]
+
+    def load_content():
+        with timed('db_read'):
+            content = dict(db.session.execute(
+                select(SentimentAnalysis.id, SentimentAnalysis.content).where(SentimentAnalysis.id.in_(row_ids))
+            ).all())
+        return [content[row_id] for row_id in row_ids]
+
+    return SentimentResults(
+        [row[1] for row in rows],
+        [row[3] for row in rows],
+        label_codes([row[2] for row in rows]),
+        load_content=load_content
+    )
+
+
+def query_results_page(topic, page_size, after=None, columns=PAGE_COLUMNS):
+    """
+    Reads one page of a topic's results, newest first.
+
+    Pages are found by keyset pagination on (created_at, id), so each page
+    is an index range scan however deep it is, and rows saved while a client
+    is paging never shift later pages.
+
+    Args:
+        topic (str): The topic to read results for.
+        page_size (int): The maximum number of results to return.
+        after (tuple): (created_at, id) of the last row of the previous
+                       page, or None for the first page.
+        columns (tuple): SentimentAnalysis column names to select.
+                         Defaults to PAGE_COLUMNS.
+
+    Returns:
+        list: The results as dictionaries keyed by column name.
+    """
+    statement = select(*[getattr(SentimentAnalysis, column) for column in columns]).where(SentimentAnalysis.topic == topic)
+    if after is not None:
+        created_at, row_id = after
+        # The bound on created_at alone is what lets the index serve the range
+        statement = statement.where(
+            SentimentAnalysis.created_at <= created_at,
+            or_(SentimentAnalysis.created_at < created_at, SentimentAnalysis.id < row_id)
+        )
+    statement = statement.order_by(SentimentAnalysis.created_at.desc(), SentimentAnalysis.id.desc()).limit(page_size)
+    with timed('db_read'):
+        return [dict(row) for row in db.session.execute(statement).mappings()]
+
+
+def upsert_comment_results(analysis_ids, results):
+    """
+    Saves scored comments in bulk, linked to their submissions' rows.
+
+    Comments already stored for a submission row are updated in place.
+    The caller is responsible for committing.
+
+    Args:
+        analysis_ids (dict): SentimentAnalysis ID of each submission, by Reddit ID.
+        results (list): Scored comments with 'id', 'submission_id',
+                        'parent_id', 'content', 'created_utc', 'sentiment'
+                        and 'score' keys.
+    """
+    rows = {}
+    for result in results:
+        analysis_id = analysis_ids.get(result['submission_id'])
+        if analysis_id is None:
+            continue
+        rows[(analysis_id, result['id'])] = {
+            'analysis_id': analysis_id,
+            'comment_id': result['id'],
+            'parent_id': result.get('parent_id'),
+            'content': result['content'],
+            'sentiment': result['sentiment'],
+            'score': result['score'],
+            'reddit_created_at': _to_datetime(result.get('created_utc'))
+        }
+    rows = list(rows.values())
+    if not rows:
+        return
+
+    table = CommentSentiment.__table__
+    dialect = db.engine.dialect.name
+    if dialect in ('sqlite', 'postgresql'):
+        insert = sqlite.insert if dialect == 'sqlite' else postgresql.insert
+        statement = insert(table)
+        statement = statement.on_conflict_do_update(
+            index_elements=['analysis_id', 'comment_id'],
+            set_={column: statement.excluded[column] for column in COMMENT_UPDATE_COLUMNS}
+        )
+        db.session.execute(statement, rows)
+    else:
+        for row in rows:
+            existing = CommentSentiment.query.filter_by(analysis_id=row['analysis_id'], comment_id=row['comment_id']).first()
+            if existing is None:
+                db.session.add(CommentSentiment(**row))
+            else:
+                for column in COMMENT_UPDATE_COLUMNS:
+                    setattr(existing, column, row[column])
+
+
+def query_comment_results(analysis_ids, columns=COMMENT_COLUMNS):
+    """
+    Reads the stored comments of the given submission rows.
+
+    Args:
+        analysis_ids (list): SentimentAnalysis IDs.
+        columns (tuple): CommentSentiment column names to select.
+                         Defaults to COMMENT_COLUMNS.
+
+    Returns:
+        list: The comments as dictionaries keyed by column name.
+    """
+    if not analysis_ids:
+        return []
+    statement = (
+        select(*[getattr(CommentSentiment, column) for column in columns])
+        .where(CommentSentiment.analysis_id.in_(analysis_ids))
+    )
+    with timed('db_read'):
+        return [dict(row) for row in db.session.execute(statement).mappings()]
@@ -0,0 +1,66 @@
+import re
+from collections import Counter
+from functools import lru_cache
+
+import nltk
+
+# Content stored for posts without a body; never counted as words
+PLACEHOLDER_CONTENT = 'No Content Available'
+# Words shorter than this are ignored
+MIN_WORD_LENGTH = 3
+# Longest word kept, matching the size of the PostTermFrequency.term column
+MAX_WORD_LENGTH = 255
+
+# Compiled once per process and shared by every call
+_NON_LETTERS = re.compile(r'[^A-Za-z\s]')
+
+
+@lru_cache(maxsize=None)
+def get_stop_words():
+    """
+    Returns the English stop words, loaded from the NLTK corpus once per process.
+    """
+    return frozenset(nltk.corpus.stopwords.words('english'))
+
+
+def tokenize(text):
+    """
+    Splits post content into the words used for word clouds.
+
+    Non-letters are removed, the text is lower-cased, and stop words and
+    words shorter than MIN_WORD_LENGTH are dropped.
+
+    Args:
+        text (str): The post content.
+
+    Returns:
+        list: The meaningful words, in order.
+    """
+    if not text or text == PLACEHOLDER_CONTENT:
+        return []
+
+    stop_words = get_stop_words()
+    words = _NON_LETTERS.sub('', text.lower()).split()
+    # Filter out common English stop words and short words
+    # (only letters are left after the substitution, so no isalpha() check is needed)
+    return [
+        word for word in words
+        if word not in stop_words and MIN_WORD_LENGTH <= len(word) <= MAX_WORD_LENGTH
+    ]
+
+
+def term_counts(text):
+    """
+    Returns the word frequencies of a single post.
+    """
+    return Counter(tokenize(text))
+
+
+def count_words(texts):
+    """
+    Returns the combined word frequencies of several posts.
+    """
+    counts = Counter()
+    for text in texts:
+        counts.update(tokenize(text))
+    return counts
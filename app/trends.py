@@ -0,0 +1,110 @@
+import os
+from datetime import timedelta
+
+import numpy as np
+from sqlalchemy import select
+
+from app import db
+from app.metrics import timed
+from app.models import SentimentRollup
+from app.storage import ROLLUP_LABEL_COLUMNS, ROLLUP_VALUE_COLUMNS, bucket_start
+
+# Longest range answered from hourly rollups when no granularity is requested
+HOURLY_MAX_SPAN = timedelta(days=int(os.getenv('TREND_HOURLY_MAX_DAYS', 7)))
+# Most points returned for one trend; longer ranges are downsampled
+TREND_MAX_POINTS = int(os.getenv('TREND_MAX_POINTS', 500))
+
+
+def choose_granularity(start, end):
+    """
+    Returns 'hour' for ranges up to HOURLY_MAX_SPAN and 'day' for longer ones.
+    """
+    return 'hour' if end - start <= HOURLY_MAX_SPAN else 'day'
+
+
+def downsample(starts, values, max_points):
+    """
+    Merges consecutive buckets into at most `max_points` equal-width bins.
+
+    Rollup values are running totals, so merged bins are exact sums and
+    mean and variance stay correct after downsampling.
+
+    Args:
+        starts (numpy.ndarray): Bucket start times in epoch seconds, ascending.
+        values (numpy.ndarray): One row of ROLLUP_VALUE_COLUMNS totals per bucket.
+        max_points (int): Maximum number of bins.
+
+    Returns:
+        tuple: (bin start times, summed values) for the non-empty bins.
+    """
+    if len(starts) <= max_points:
+        return starts, values
+    span = starts[-1] - starts[0] + 1
+    width = -(-span // max_points)
+    bins = (starts - starts[0]) // width
+    # Buckets are sorted, so each bin is a contiguous run of rows
+    first = np.flatnonzero(np.r_[True, bins[1:] != bins[:-1]])
+    return starts[0] + bins[first] * width, np.add.reduceat(values, first, axis=0)
+
+
+def query_trend(topic, start, end, granularity=None, max_points=None):
+    """
+    Returns a topic's sentiment over time, read from SentimentRollup only.
+
+    Args:
+        topic (str): The topic.
+        start (datetime): Start of the range (naive UTC), inclusive.
+        end (datetime): End of the range (naive UTC), exclusive.
+        granularity (str): 'hour' or 'day'. Defaults to choose_granularity().
+        max_points (int): Maximum number of points. Defaults to TREND_MAX_POINTS.
+
+    Returns:
+        dict: The granularity used and a list of points, each with its start
+              time, post count, per-label counts, mean score and score variance.
+
+    Raises:
+        ValueError: If max_points is less than 1.
+    """
+    granularity = granularity or choose_granularity(start, end)
+    max_points = TREND_MAX_POINTS if max_points is None else max_points
+    if max_points < 1:
+        raise ValueError("max_points must be at least 1")
+
+    statement = (
+        select(SentimentRollup.bucket_start, *[getattr(SentimentRollup, column) for column in ROLLUP_VALUE_COLUMNS])
+        .where(
+            SentimentRollup.topic == topic,
+            SentimentRollup.granularity == granularity,
+            SentimentRollup.bucket_start >= bucket_start(start, granularity),
+            SentimentRollup.bucket_start < end,
+            SentimentRollup.post_count > 0
+        )
+        .order_by(SentimentRollup.bucket_start)
+    )
+    with timed('db_read'):
+        rows = db.session.execute(statement).all()
+    if not rows:
+        return {"granularity": granularity, "points": []}
+
+    starts = np.array([row[0] for row in rows], dtype='datetime64[s]').astype(np.int64)
+    values = np.array([row[1:] for row in rows], dtype=np.float64)
+    starts, values = downsample(starts, values, max_points)
+
+    columns = dict(zip(ROLLUP_VALUE_COLUMNS, values.T))
+    counts = columns['post_count']
+    means = columns['score_sum'] / counts
+    # Population variance from the running sums; clipped at 0 against rounding error
+    variances = np.maximum(columns['score_sq_sum'] / counts - means ** 2, 0.0)
+    label_counts = {label: columns[column].astype(np.int64) for label, column in ROLLUP_LABEL_COLUMNS.items()}
+
+    points = [
+        {
+            "start": timestamp,
+            "post_count": int(count),
+            "sentiment_counts": {label: int(label_counts[label][i]) for label in ROLLUP_LABEL_COLUMNS},
+            "mean_score": float(means[i]),
+            "score_variance": float(variances[i])
+        }
+        for i, (timestamp, count) in enumerate(zip(np.datetime_as_string(starts.astype('datetime64[s]')), counts))
+    ]
+    return {"granularity": granularity, "points": points}
@@ -0,0 +1,78 @@
+import random
+
+# Words used to build synthetic posts, grouped by the sentiment they push towards
+POSITIVE_WORDS = ['great', 'love', 'excellent', 'happy', 'amazing', 'helpful', 'fantastic', 'good', 'enjoy', 'recommend']
+NEGATIVE_WORDS = ['terrible', 'hate', 'awful', 'broken', 'sad', 'worst', 'angry', 'bad', 'disappointing', 'useless']
+NEUTRAL_WORDS = [
+    'python', 'data', 'server', 'market', 'update', 'release', 'question', 'thread', 'weekend', 'project',
+    'version', 'library', 'team', 'price', 'model', 'guide', 'city', 'course', 'review', 'build'
+]
+FILLER_WORDS = ['the', 'a', 'is', 'and', 'to', 'of', 'it', 'this', 'with', 'for', 'I', 'was', 'on', 'my']
+
+# Share of posts without a body, stored as the 'No Content Available' placeholder
+EMPTY_RATIO = 0.15
+# Share of posts that repeat the body of an earlier post (reposts and crossposts)
+REPOST_RATIO = 0.1
+
+
+def _sentence(rng, length):
+    words = []
+    for _ in range(length):
+        roll = rng.random()
+        if roll < 0.1:
+            words.append(rng.choice(POSITIVE_WORDS))
+        elif roll < 0.18:
+            words.append(rng.choice(NEGATIVE_WORDS))
+        elif roll < 0.55:
+            words.append(rng.choice(NEUTRAL_WORDS))
+        else:
+            words.append(rng.choice(FILLER_WORDS))
+    return ' '.join(words).capitalize() + rng.choice(['.', '!', '?'])
+
+
+def generate_posts(count, seed=0, start_utc=1700000000.0):
+    """
+    Generates a deterministic, Reddit-like corpus of posts.
+
+    Posts have the same keys as fetch_reddit_data results. Bodies vary in
+    length, some are empty and some repeat earlier posts, so caches and
+    the word index see realistic overlap.
+
+    Args:
+        count (int): Number of posts to generate.
+        seed (int): Random seed; the same seed always yields the same corpus.
+        start_utc (float): Creation time of the newest post.
+
+    Returns:
+        list: Post dictionaries, newest first.
+    """
+    rng = random.Random(seed)
+    posts = []
+    for i in range(count):
+        roll = rng.random()
+        if roll < EMPTY_RATIO:
+            content = 'No Content Available'
+        elif roll < EMPTY_RATIO + REPOST_RATIO and posts:
+            content = rng.choice(posts)['content']
+        else:
+            content = ' '.join(_sentence(rng, rng.randint(6, 25)) for _ in range(rng.randint(1, 6)))
+        post_id = f'{seed:x}{i:07x}'
+        posts.append({
+            'id': post_id,
+            'title': _sentence(rng, rng.randint(4, 12)),
+            'content': content,
+            'url': f'https://www.reddit.com/r/bench/comments/{post_id}/',
+            'created_utc': start_utc - i * 60
+        })
+    return posts
+
+
+def fake_fetch_reddit_data(corpus):
+    """
+    Returns a stand-in for fetch_reddit_data that serves posts from `corpus`
+    without touching the network.
+    """
+    def fetch_reddit_data(topic, limit=10, stream=False, on_error=None):
+        posts = (dict(post) for post in corpus[:limit])
+        return posts if stream else list(posts)
+    return fetch_reddit_data
@@ -0,0 +1,250 @@
+"""
+Offline benchmarks for every stage of the analyze pipeline.
+
+Usage (from the repository root):
+
+    python -m benchmarks.run                          # 10, 1k and 10k posts
+    python -m benchmarks.run --sizes 10 1000 10000 100000 --output bench.json
+    python -m benchmarks.run --baseline bench.json    # compare against a stored run
+
+Each stage runs against a synthetic corpus (benchmarks/corpus.py) and a
+temporary SQLite database; Reddit is replaced by a local fake, so no
+network access or credentials are needed. Results are printed (or written)
+as JSON. With --baseline, stages whose median time grew by more than the
+tolerance are reported and the exit status is 1.
+"""
+import argparse
+import contextlib
+import json
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+from unittest.mock import patch
+
+from benchmarks.corpus import fake_fetch_reddit_data, generate_posts
+
+DEFAULT_SIZES = (10, 1000, 10000)
+# Fractional slowdown tolerated before a stage is reported as a regression
+DEFAULT_TOLERANCE = 0.2
+
+
+def _time(func, repeat):
+    """
+    Runs `func` `repeat` times and returns the durations in seconds.
+    """
+    durations = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        durations.append(time.perf_counter() - start)
+    return durations
+
+
+def _summary(durations, size):
+    median = statistics.median(durations)
+    return {
+        'posts': size,
+        'runs': len(durations),
+        'median_s': round(median, 6),
+        'min_s': round(min(durations), 6),
+        'posts_per_s': round(size / median, 1) if median else None
+    }
+
+
+def _retained_bytes(func):
+    """
+    Returns the memory still allocated after `func` returns, i.e. the size
+    of what it built and returned, in bytes.
+    """
+    tracemalloc.start()
+    try:
+        before = tracemalloc.get_traced_memory()[0]
+        value = func()
+        after = tracemalloc.get_traced_memory()[0]
+    finally:
+        tracemalloc.stop()
+    del value
+    return after - before
+
+
+def run_benchmarks(sizes=DEFAULT_SIZES, repeat=3, stages=None):
+    """
+    Runs the pipeline benchmarks.
+
+    Args:
+        sizes (iterable): Corpus sizes to benchmark.
+        repeat (int): Runs per stage and size (sizes above 10k run once).
+        stages (set): Stage names to run. Defaults to all stages.
+
+    Returns:
+        dict: Environment details, per stage and size timing summaries and,
+              per size, the memory held by results in each representation.
+    """
+    workdir = tempfile.mkdtemp(prefix='sentiment-bench-')
+    os.environ['SQLALCHEMY_DATABASE_URL'] = f"sqlite:///{os.path.join(workdir, 'bench.db')}"
+    # Render and response caches would hide the work being measured
+    os.environ['CACHE_TYPE'] = 'NullCache'
+    os.environ['NLTK_OFFLINE'] = '1'
+
+    from app import create_app, db
+    from app.analysis import analyze_sentiment, get_analyzer, score_cache
+    from app.graphs import clear_graph_cache, generate_graphs
+    from app.startup import ensure_nltk_data
+    from app.storage import init_db, load_recent_results, query_recent_results, upsert_sentiment_results
+
+    ensure_nltk_data(os.path.join(os.getcwd(), 'nltk_data'))
+    app = create_app()
+    with app.app_context():
+        init_db()
+    # Load the lexicon outside of the timed sections
+    get_analyzer()
+
+    def wanted(stage):
+        return stages is None or stage in stages
+
+    results = {}
+    memory = {}
+
+    def record(stage, size, durations):
+        results.setdefault(stage, {})[str(size)] = _summary(durations, size)
+
+    for size in sizes:
+        corpus = generate_posts(size)
+        runs = repeat if size <= 10000 else 1
+        scored = analyze_sentiment(corpus, use_cache=False)
+
+        if wanted('analyze_sentiment'):
+            record('analyze_sentiment', size, _time(lambda: analyze_sentiment(corpus, use_cache=False), runs))
+
+        if wanted('analyze_sentiment_cached'):
+            score_cache.clear()
+            analyze_sentiment(corpus)
+            record('analyze_sentiment_cached', size, _time(lambda: analyze_sentiment(corpus), runs))
+
+        with app.app_context():
+            if wanted('db_insert'):
+                counter = iter(range(runs))
+
+                def insert():
+                    upsert_sentiment_results(f'bench-insert-{size}-{next(counter)}', scored)
+                    db.session.commit()
+                record('db_insert', size, _time(insert, runs))
+
+            if wanted('db_query'):
+                upsert_sentiment_results(f'bench-query-{size}', scored)
+                db.session.commit()
+                record('db_query', size, _time(lambda: query_recent_results(f'bench-query-{size}', size), runs))
+
+            if wanted('result_memory'):
+                # Post text is shared with the corpus (or not yet loaded), so
+                # this is the per-result overhead of each representation
+                upsert_sentiment_results(f'bench-memory-{size}', scored)
+                db.session.commit()
+                memory[str(size)] = {
+                    'posts': size,
+                    'analysis_dicts_bytes': _retained_bytes(scored.to_dicts),
+                    'analysis_columns_bytes': _retained_bytes(lambda: analyze_sentiment(corpus, use_cache=False)),
+                    'db_read_dicts_bytes': _retained_bytes(lambda: query_recent_results(f'bench-memory-{size}', size)),
+                    'db_read_columns_bytes': _retained_bytes(lambda: load_recent_results(f'bench-memory-{size}', size))
+                }
+
+        if wanted('generate_graphs'):
+            def render():
+                clear_graph_cache()
+                generate_graphs(scored, f'bench-{size}')
+            record('generate_graphs', size, _time(render, runs))
+
+        if wanted('analyze_request'):
+            app.config['API_MAX_RECORDS'] = max(app.config['API_MAX_RECORDS'], size)
+            client = app.test_client()
+            counter = iter(range(runs))
+
+            def request():
+                # A fresh topic each run so the request always goes to "Reddit"
+                topic = f'bench-request-{size}-{next(counter)}'
+                clear_graph_cache()
+                response = client.post('/api/sentiment/analyze', data={'topic': topic, 'num_records': size})
+                assert response.status_code == 200, response.status_code
+
+            with patch('app.pipeline.fetch_reddit_data', fake_fetch_reddit_data(corpus)):
+                record('analyze_request', size, _time(request, runs))
+
+    return {
+        'meta': {
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count(),
+            'sizes': list(sizes),
+            'repeat': repeat
+        },
+        'results': results,
+        'memory': memory
+    }
+
+
+def compare(current, baseline, tolerance=DEFAULT_TOLERANCE):
+    """
+    Compares a benchmark run with a baseline run.
+
+    Returns:
+        list: One entry per stage and size present in both runs, with the
+              ratio of current to baseline median time and whether it
+              exceeds the tolerance.
+    """
+    comparison = []
+    for stage, sizes in current['results'].items():
+        for size, summary in sizes.items():
+            base = baseline.get('results', {}).get(stage, {}).get(size)
+            if not base or not base['median_s']:
+                continue
+            ratio = summary['median_s'] / base['median_s']
+            comparison.append({
+                'stage': stage,
+                'posts': int(size),
+                'baseline_s': base['median_s'],
+                'current_s': summary['median_s'],
+                'ratio': round(ratio, 3),
+                'regression': ratio > 1 + tolerance
+            })
+    return comparison
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', type=int, nargs='+', default=list(DEFAULT_SIZES), help='corpus sizes to benchmark')
+    parser.add_argument('--repeat', type=int, default=3, help='runs per stage and size')
+    parser.add_argument('--stages', nargs='+', help='only run these stages')
+    parser.add_argument('--output', help='write the JSON results to this file')
+    parser.add_argument('--baseline', help='compare against a stored JSON run')
+    parser.add_argument('--tolerance', type=float, default=DEFAULT_TOLERANCE, help='allowed slowdown before flagging a regression')
+    args = parser.parse_args(argv)
+
+    # Keep the app's own console messages out of the JSON on stdout
+    with contextlib.redirect_stdout(sys.stderr):
+        report = run_benchmarks(args.sizes, args.repeat, set(args.stages) if args.stages else None)
+
+    regressions = []
+    if args.baseline:
+        with open(args.baseline) as baseline_file:
+            report['comparison'] = compare(report, json.load(baseline_file), args.tolerance)
+        regressions = [entry for entry in report['comparison'] if entry['regression']]
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as output_file:
+            output_file.write(output + '\n')
+    else:
+        print(output)
+
+    for entry in regressions:
+        print(f"Regression: {entry['stage']} at {entry['posts']} posts is {entry['ratio']}x the baseline", file=sys.stderr)
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,12 +1,21 @@
+import json
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import parse_qs, urlparse
+
 import pytest
 from flask import Flask
 
 from unittest.mock import patch 
 from app import create_app, db
-from app.models import SentimentAnalysis
-from app.analysis import analyze_sentiment
+from app.models import SentimentAnalysis, SentimentScoreCache
+from app.analysis import analyze_sentiment, classify_scores, shutdown_pool, score_cache, content_hash, load_analyzer
+from app.startup import ensure_nltk_data
 
-from app.fetch_reddit_data import fetch_reddit_data 
+from app.fetch_reddit_data import fetch_reddit_data, fetch_from_subreddits, configure_client_pool, create_reddit_client
+from app.pipeline import run_pipeline, prefetch
+from app.storage import init_db, upsert_sentiment_results, query_recent_results, aggregate_term_counts
+from app.graphs import generate_graphs, clear_graph_cache, count_words
 
 @pytest.fixture
 def client():
@@ -15,12 +24,76 @@ def client():
     app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///test_sentiments.db'
     with app.test_client() as client:
         with app.app_context():
-            db.create_all()
+            init_db()
         yield client
         with app.app_context():
             db.drop_all()
         
-    
+
+class FakeRedditHandler(BaseHTTPRequestHandler):
+    """
+    Minimal stand-in for the Reddit OAuth and search endpoints.
+    """
+    def log_message(self, *args):
+        pass
+
+    def _send_json(self, payload):
+        body = json.dumps(payload).encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.send_header('x-ratelimit-remaining', '100')
+        self.send_header('x-ratelimit-used', '0')
+        self.send_header('x-ratelimit-reset', '600')
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get('Content-Length', 0))).decode('utf-8')
+        path = urlparse(self.path).path
+        self.server.requests.append(('POST', path))
+        if path.startswith('/api/morechildren'):
+            children = parse_qs(body)['children'][0].split(',')
+            things = [self.server.more[child] for child in children]
+            self._send_json({"json": {"errors": [], "data": {"things": things}}})
+            return
+        self._send_json({"access_token": "token", "token_type": "bearer", "expires_in": 3600, "scope": "*"})
+
+    def do_GET(self):
+        path = urlparse(self.path).path
+        self.server.requests.append(('GET', path))
+        if path.startswith('/comments/'):
+            submission_id = path.split('/')[2]
+            submission = {"kind": "t3", "data": {"id": submission_id, "name": f"t3_{submission_id}", "title": "", "subreddit": "all"}}
+            self._send_json([
+                {"kind": "Listing", "data": {"after": None, "children": [submission]}},
+                {"kind": "Listing", "data": {"after": None, "children": self.server.comments.get(submission_id, [])}}
+            ])
+            return
+        subreddit = path.split('/')[2]
+        children = [
+            {"kind": "t3", "data": dict(post, name=f"t3_{post['id']}", subreddit=subreddit)}
+            for post in self.server.listings.get(subreddit, [])
+        ]
+        self._send_json({"kind": "Listing", "data": {"after": None, "children": children}})
+
+@pytest.fixture
+def fake_reddit():
+    server = ThreadingHTTPServer(('127.0.0.1', 0), FakeRedditHandler)
+    server.requests = []
+    server.listings = {}
+    server.comments = {}
+    server.more = {}
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f"http://127.0.0.1:{server.server_address[1]}"
+    configure_client_pool(size=2, factory=lambda: create_reddit_client(
+        client_id='id', client_secret='secret', user_agent='tests', oauth_url=url, reddit_url=url
+    ))
+    yield server
+    server.shutdown()
+    configure_client_pool()
+
+
 def test_analysis_sentiment():
     posts = [
         {
@@ -39,7 +112,7 @@ def test_analysis_sentiment():
 
 def test_analyze_route(client):
     
-    with patch('app.routes.fetch_reddit_data') as mock_fetch:
+    with patch('app.pipeline.fetch_reddit_data') as mock_fetch:
         mock_fetch.return_value = [
             {
                "title":"I go to Loyola Maryland and don't know what to major",
@@ -71,3 +144,757 @@ def test_invalid_input(client):
     assert response.status_code == 400
     assert 'Topic is required' in response.data.decode('utf-8')
 
+
+def test_classify_scores_thresholds():
+    labels = classify_scores([0.05, 0.0499, -0.0499, -0.05, 0.9, -0.9])
+    assert labels.tolist() == ['POSITIVE', 'NEUTRAL', 'NEUTRAL', 'NEGATIVE', 'POSITIVE', 'NEGATIVE']
+
+def test_parallel_scoring_matches_serial(monkeypatch):
+    monkeypatch.setattr('app.analysis.MAX_WORKERS', 2)
+    monkeypatch.setattr('app.analysis.CHUNK_SIZE', 3)
+    posts = [
+        {"title": f"post {i}", "content": text}
+        for i, text in enumerate(["I love this", "This is awful", "It is a table", "Great work!", "Terrible idea"] * 2)
+    ]
+    try:
+        serial = analyze_sentiment(posts)
+        parallel = analyze_sentiment(posts, parallel_threshold=0)
+    finally:
+        shutdown_pool()
+    assert parallel == serial
+
+def test_score_cache_scores_only_misses(client):
+    posts = [
+        {"title": "a", "content": "No Content Available"},
+        {"title": "b", "content": "No   Content\nAvailable"},
+        {"title": "c", "content": "What a wonderful day"},
+    ]
+    with client.application.app_context():
+        score_cache.clear()
+        first = analyze_sentiment(posts)
+        assert score_cache.stats()['misses'] == 2
+        assert SentimentScoreCache.query.count() == 2
+
+        # A cold memory tier falls back to the persistent table
+        score_cache.clear()
+        second = analyze_sentiment(posts)
+        stats = score_cache.stats()
+        assert stats['misses'] == 0
+        assert stats['store_hits'] == 2
+    assert content_hash(posts[0]['content']) == content_hash(posts[1]['content'])
+    assert [r['score'] for r in first] == [r['score'] for r in second]
+
+def test_streaming_pipeline_commits_in_batches(client):
+    def generate_posts():
+        for i in range(250):
+            yield {"title": f"post {i}", "content": f"I really like item number {i}"}
+
+    with client.application.app_context():
+        with patch.object(db.session, 'commit', wraps=db.session.commit) as commit:
+            chunks = list(run_pipeline('streaming', generate_posts(), chunk_size=40, batch_size=100))
+            # Only the pipeline commits the session, per 100 rows plus the remainder;
+            # the score cache writes on its own connection
+            assert commit.call_count == 3
+        assert SentimentScoreCache.query.filter(SentimentScoreCache.content_hash.in_(
+            [content_hash(f"I really like item number {i}") for i in range(250)]
+        )).count() == 250
+        assert [len(chunk) for chunk in chunks] == [40] * 6 + [10]
+        assert SentimentAnalysis.query.filter_by(topic='streaming').count() == 250
+
+def test_prefetch_propagates_producer_errors():
+    def failing():
+        yield 1
+        raise RuntimeError("page failed")
+
+    consumed = []
+    with pytest.raises(RuntimeError):
+        for item in prefetch(failing(), maxsize=1):
+            consumed.append(item)
+    assert consumed == [1]
+
+def fake_comment(comment_id, parent, body, replies=()):
+    return {"kind": "t1", "data": {
+        "id": comment_id, "name": f"t1_{comment_id}", "parent_id": parent, "link_id": "t3_x", "body": body,
+        "created_utc": 1700000000, "replies": {"kind": "Listing", "data": {"children": list(replies)}} if replies else ""
+    }}
+
+def fake_more(parent, children):
+    return {"kind": "more", "data": {"id": children[0], "name": f"t1_{children[0]}", "parent_id": parent, "count": len(children), "children": children, "depth": 0}}
+
+def fake_post(post_id, created_utc, selftext="Some text"):
+    return {"id": post_id, "title": f"Post {post_id}", "selftext": selftext, "url": f"https://reddit.test/{post_id}", "created_utc": created_utc}
+
+def test_fetch_reuses_pooled_clients(fake_reddit):
+    fake_reddit.listings['all'] = [fake_post('a', 2.0), fake_post('b', 1.0, selftext="")]
+    first = fetch_reddit_data('python', 5)
+    second = fetch_reddit_data('python', 5)
+    assert first == second
+    assert first[1]['content'] == 'No Content Available'
+    # One OAuth token for both fetches: the client was reused
+    assert [r for r in fake_reddit.requests if r[0] == 'POST'] == [('POST', '/api/v1/access_token')]
+
+def test_fetch_from_subreddits_merges_and_deduplicates(fake_reddit):
+    fake_reddit.listings['python'] = [fake_post('shared', 3.0), fake_post('p1', 1.0)]
+    fake_reddit.listings['learnpython'] = [fake_post('shared', 3.0), fake_post('l1', 2.0)]
+    posts = fetch_from_subreddits('python', ['python', 'learnpython'], limit=10)
+    assert [post['id'] for post in posts] == ['shared', 'l1', 'p1']
+    searched = {path for method, path in fake_reddit.requests if method == 'GET'}
+    assert searched == {'/r/python/search/', '/r/learnpython/search/'}
+
+    fake_reddit.requests.clear()
+    with patch('app.fetch_reddit_data.SUBREDDITS', ['python', 'learnpython']):
+        assert [post['id'] for post in fetch_reddit_data('python', 2, stream=True)] == ['shared', 'l1']
+    assert {path for method, path in fake_reddit.requests if method == 'GET'} == searched
+
+def test_upsert_is_idempotent_per_topic_and_post(client):
+    results = [
+        {"id": "abc", "title": "First", "content": "Good", "sentiment": "POSITIVE", "score": 0.4, "url": "https://reddit.test/abc", "created_utc": 1700000000.0},
+        {"id": "def", "title": "Second", "content": "Bad", "sentiment": "NEGATIVE", "score": -0.5, "url": "https://reddit.test/def", "created_utc": 1700000100.0},
+    ]
+    with client.application.app_context():
+        upsert_sentiment_results('ingest', results)
+        db.session.commit()
+        results[0] = dict(results[0], title="First (edited)")
+        upsert_sentiment_results('ingest', results)
+        upsert_sentiment_results('other topic', results[:1])
+        db.session.commit()
+
+        assert SentimentAnalysis.query.filter_by(topic='ingest').count() == 2
+        assert SentimentAnalysis.query.filter_by(topic='other topic').count() == 1
+        record = SentimentAnalysis.query.filter_by(topic='ingest', post_id='abc').one()
+        assert record.title == "First (edited)"
+        assert record.reddit_created_at.year == 2023
+
+        # Without RETURNING support (SQLite before 3.35) rows are saved one at a time
+        with patch.object(db.engine.dialect, 'insert_returning', False):
+            row_ids = upsert_sentiment_results('ingest', [dict(results[1], title="Second (edited)"), dict(results[1], id='ghi')])
+        db.session.commit()
+        assert row_ids[0] == SentimentAnalysis.query.filter_by(topic='ingest', post_id='def').one().id
+        assert SentimentAnalysis.query.filter_by(topic='ingest').count() == 3
+        assert db.session.get(SentimentAnalysis, row_ids[0]).title == "Second (edited)"
+
+def test_query_recent_results_projects_columns(client):
+    results = [
+        {"id": str(i), "title": f"Post {i}", "content": "x" * 1000, "sentiment": "NEUTRAL", "score": 0.0}
+        for i in range(5)
+    ]
+    with client.application.app_context():
+        upsert_sentiment_results('projection', results)
+        db.session.commit()
+
+        rows = query_recent_results('projection', 3, columns=('post_id', 'score'), as_dicts=False)
+        assert rows == [('4', 0.0), ('3', 0.0), ('2', 0.0)]
+        records = query_recent_results('projection', 1)
+        assert set(records[0]) == {'title', 'content', 'sentiment', 'score'}
+
+        journal_mode = db.session.execute(db.text('PRAGMA journal_mode')).scalar()
+        assert journal_mode == 'wal'
+
+def test_generate_graphs_renders_in_memory_and_caches():
+    import base64
+    from concurrent.futures import ThreadPoolExecutor
+
+    results = [
+        {"sentiment": "POSITIVE", "score": 0.6, "content": "Excellent graphics performance benchmarks"},
+        {"sentiment": "NEGATIVE", "score": -0.4, "content": "Terrible driver crashes everywhere"},
+    ]
+    clear_graph_cache()
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        images = list(executor.map(lambda topic: generate_graphs(results, topic), ['gpu', 'cpu', 'gpu', 'cpu']))
+    for bar_chart, word_cloud in images:
+        assert base64.b64decode(bar_chart).startswith(b'\x89PNG')
+        assert base64.b64decode(word_cloud).startswith(b'\x89PNG')
+
+    with patch('app.graphs.render_bar_chart') as render_bar, patch('app.graphs.render_word_cloud') as render_cloud:
+        assert generate_graphs(results, 'gpu') == images[0]
+        render_bar.assert_not_called()
+        render_cloud.assert_not_called()
+
+def test_term_index_matches_content_word_counts(client):
+    results = [
+        {"id": "t1", "title": "One", "content": "Rust compilers are fast, rust is great!", "sentiment": "POSITIVE", "score": 0.6},
+        {"id": "t2", "title": "Two", "content": "No Content Available", "sentiment": "NEUTRAL", "score": 0.0},
+        {"id": "t3", "title": "Three", "content": "Slow compilers make me sad", "sentiment": "NEGATIVE", "score": -0.5},
+    ]
+    with client.application.app_context():
+        upsert_sentiment_results('terms', results)
+        db.session.commit()
+        assert aggregate_term_counts('terms', 10) == count_words(results)
+        assert aggregate_term_counts('terms', 10)['compilers'] == 2
+
+        # Re-ingesting edited content replaces the stored counts
+        upsert_sentiment_results('terms', [dict(results[0], content="Rust rust rust")])
+        db.session.commit()
+        counts = aggregate_term_counts('terms', 10)
+        assert counts['rust'] == 3
+        assert counts['compilers'] == 1
+
+        # Rows saved without tokenizing fall back to counting content
+        db.session.add(SentimentAnalysis(topic='terms', title='Legacy', content='legacy words', sentiment='NEUTRAL', score=0.0))
+        db.session.commit()
+        assert aggregate_term_counts('terms', 10) is None
+
+def test_async_jobs_coalesce_and_report_results(client):
+    import time
+
+    release = threading.Event()
+
+    def slow_fetch(topic, limit, stream=False, on_error=None):
+        release.wait(5)
+        return [{"id": "job1", "title": "Async", "content": "Background jobs are wonderful"}]
+
+    with patch('app.pipeline.fetch_reddit_data', side_effect=slow_fetch) as mock_fetch:
+        first = client.post('/api/sentiment/analyze', data={'topic': 'jobs', 'num_records': 5, 'async': 'true'})
+        second = client.post('/api/sentiment/jobs', data={'topic': 'jobs', 'num_records': 5})
+        assert first.status_code == 202
+        assert first.get_json()['job_id'] == second.get_json()['job_id']
+        release.set()
+
+        status_url = first.get_json()['status_url']
+        for _ in range(100):
+            job = client.get(status_url).get_json()
+            if job['status'] in ('completed', 'failed'):
+                break
+            time.sleep(0.05)
+        assert job['status'] == 'completed'
+        assert job['progress'] == {'processed': 1, 'total': 5}
+        assert job['result']['sentiment_results'][0]['sentiment'] == 'POSITIVE'
+        assert client.get(job['result']['charts']['bar_chart']).mimetype == 'image/png'
+        assert mock_fetch.call_count == 1
+
+    with patch('app.pipeline.fetch_reddit_data', side_effect=RuntimeError("reddit down")), \
+            patch('app.jobs.logger.exception') as log_exception:
+        status_url = client.post('/api/sentiment/jobs', data={'topic': 'jobs-down', 'num_records': 5}).get_json()['status_url']
+        for _ in range(100):
+            job = client.get(status_url).get_json()
+            if job['status'] in ('completed', 'failed'):
+                break
+            time.sleep(0.05)
+    assert job['status'] == 'failed'
+    log_exception.assert_called_once()
+
+    assert client.get('/api/sentiment/jobs/unknown').status_code == 404
+
+def test_lexicon_snapshot_round_trip(tmp_path):
+    snapshot = tmp_path / 'vader_lexicon.pickle'
+    built = load_analyzer(str(snapshot))
+    assert snapshot.exists()
+    with patch('app.analysis.SentimentIntensityAnalyzer.make_lex_dict') as parse:
+        restored = load_analyzer(str(snapshot))
+        parse.assert_not_called()
+    text = "This is GREAT, but the ending was awful :("
+    assert restored.polarity_scores(text) == built.polarity_scores(text)
+
+def test_startup_checks_bundled_nltk_data_offline(tmp_path):
+    import os
+    with patch('nltk.download') as download:
+        assert ensure_nltk_data(os.path.join(os.getcwd(), 'nltk_data'), offline=True) == []
+        download.assert_not_called()
+    with patch('nltk.data.find', side_effect=LookupError), patch('nltk.download') as download:
+        with pytest.raises(RuntimeError):
+            ensure_nltk_data(str(tmp_path), offline=True)
+        download.assert_not_called()
+
+def test_benchmark_suite_smoke():
+    import os
+    from benchmarks.run import compare, run_benchmarks
+
+    with patch.dict(os.environ):
+        report = run_benchmarks(sizes=[10], repeat=1)
+    assert set(report['results']) == {
+        'analyze_sentiment', 'analyze_sentiment_cached', 'db_insert', 'db_query', 'generate_graphs', 'analyze_request'
+    }
+    assert all(entry['ratio'] == 1.0 for entry in compare(report, report))
+
+def test_metrics_endpoint_reports_stage_latencies(client, tmp_path):
+    client.application.config['PROFILING_ENABLED'] = True
+    client.application.config['PROFILE_DIR'] = str(tmp_path)
+    with patch('app.pipeline.fetch_reddit_data') as mock_fetch:
+        mock_fetch.return_value = [{"id": "m1", "title": "Metrics", "content": "Observability makes debugging pleasant"}]
+        response = client.post('/api/sentiment/analyze', data={'topic': 'metrics', 'num_records': 1}, headers={'X-Profile': '1'})
+    assert response.status_code == 200
+    assert (tmp_path / response.headers['X-Profile-File']).exists()
+
+    body = client.get('/api/sentiment/metrics').get_data(as_text=True)
+    for stage in ('fetch', 'score', 'db_read', 'db_write', 'render_template'):
+        assert f'sentiment_stage_duration_seconds_count{{stage="{stage}"}}' in body
+    assert 'sentiment_cache_events_total{cache="score",result=' in body
+    assert 'sentiment_request_duration_seconds_bucket{endpoint="sentiment.analyze_sentiment_route",method="POST",status="200",le="+Inf"}' in body
+
+def test_response_cache_keys_single_flight_and_stale_refresh(client):
+    import time
+    from cachelib import SimpleCache
+    from app.response_cache import ResponseCache
+
+    assert ResponseCache.key(' Machine  Learning', 10) == ResponseCache.key('machine learning', 10)
+    assert ResponseCache.key('machine learning', 10) != ResponseCache.key('machine learning', 500)
+
+    app = client.application
+    backend = SimpleCache()
+    cache = ResponseCache(app, backend=backend)
+    calls = []
+    release = threading.Event()
+
+    def compute():
+        calls.append(1)
+        release.wait(5)
+        return f"page {len(calls)}"
+
+    with app.app_context():
+        from concurrent.futures import ThreadPoolExecutor
+        with ThreadPoolExecutor(max_workers=5) as executor:
+            futures = [executor.submit(cache.get_or_compute, 'k', compute) for _ in range(5)]
+            time.sleep(0.2)
+            release.set()
+            assert {future.result() for future in futures} == {"page 1"}
+        assert len(calls) == 1
+
+        # The shared backend tier answers when the in-process tier is empty
+        cache.clear()
+        assert cache.get_or_compute('k', compute) == "page 1"
+        assert len(calls) == 1
+
+        # Entries can go stale sooner than the cache's timeout, never later
+        cache.get_or_compute('short', lambda: "value", timeout=30)
+        assert backend.get('short')['fresh_until'] <= time.time() + 30
+        cache.get_or_compute('long', lambda: "value", timeout=10 ** 9)
+        assert backend.get('long')['fresh_until'] <= time.time() + cache.timeout
+
+        # Expired entries are served stale while one background refresh runs
+        cache.timeout = 0
+        cache.invalidate('k')
+        assert cache.get_or_compute('k', compute) == "page 2"
+        assert cache.get_or_compute('k', compute) == "page 2"
+        for _ in range(100):
+            if backend.get('k')['value'] == "page 3":
+                break
+            time.sleep(0.02)
+        assert backend.get('k')['value'] == "page 3"
+
+def test_results_api_paginates_with_etags_and_chart_urls(client):
+    posts = [
+        {"id": f"api{i}", "title": f"Post {i}", "content": "Pagination keeps payloads wonderfully small", "url": f"https://example.com/{i}", "created_utc": 1700000000 + i}
+        for i in range(5)
+    ]
+    with patch('app.pipeline.fetch_reddit_data', return_value=posts) as mock_fetch:
+        first = client.get('/api/sentiment/results', query_string={'topic': 'API', 'num_records': 5, 'page_size': 2})
+        assert first.status_code == 200
+        data = first.get_json()
+        assert data['total'] == 5 and data['sentiment_counts']['POSITIVE'] == 5
+        assert 'content' not in data['results'][0]
+
+        # Walking the cursors visits every post once
+        titles = [row['title'] for row in data['results']]
+        next_url = data['next_url']
+        while next_url:
+            page = client.get(next_url).get_json()
+            titles.extend(row['title'] for row in page['results'])
+            next_url = page['next_url']
+        assert sorted(titles) == sorted(post['title'] for post in posts)
+        assert mock_fetch.call_count == 1
+
+        # Later pages are an index range scan, not a walk over the earlier rows
+        from sqlalchemy import event
+        from app.storage import query_results_page
+        with client.application.app_context():
+            last = query_results_page('api', 2)[-1]
+            executed = []
+
+            def capture(conn, cursor, statement, parameters, context, executemany):
+                executed.append((statement, parameters))
+
+            event.listen(db.engine, 'before_cursor_execute', capture)
+            try:
+                query_results_page('api', 2, after=(last['created_at'], last['id']))
+            finally:
+                event.remove(db.engine, 'before_cursor_execute', capture)
+            plan = db.session.connection().exec_driver_sql('EXPLAIN QUERY PLAN ' + executed[-1][0], executed[-1][1]).all()
+            assert 'created_at<?' in plan[0][-1]
+
+        # Unchanged data revalidates with a 304 and no body
+        again = client.get('/api/sentiment/results', query_string={'topic': 'api', 'num_records': 5, 'page_size': 2},
+                           headers={'If-None-Match': first.headers['ETag']})
+        assert again.status_code == 304 and not again.data
+        assert client.get('/api/sentiment/results', query_string={'topic': 'api', 'cursor': 'bogus'}).status_code == 400
+
+        # Charts are linked, not inlined, and cacheable indefinitely
+        page = client.get('/api/sentiment/analyze', query_string={'topic': 'api', 'num_records': 5})
+        html = page.get_data(as_text=True)
+        assert data['charts']['bar_chart'] in html.replace('&amp;', '&') and 'base64' not in html
+        assert client.get('/api/sentiment/analyze', query_string={'topic': 'api', 'num_records': 5},
+                          headers={'If-None-Match': page.headers['ETag']}).status_code == 304
+        image = client.get(data['charts']['bar_chart'])
+        assert image.mimetype == 'image/png' and 'immutable' in image.headers['Cache-Control']
+        assert client.get('/api/sentiment/charts/unknown.png').status_code == 404
+
+        # Charts missing from the shared cache are drawn again from the stored results
+        from app import cache
+        cache.clear()
+        clear_graph_cache()
+        redrawn = client.get(data['charts']['bar_chart'])
+        assert redrawn.status_code == 200 and redrawn.data == image.data
+        # ... but only if they still draw the image the URL names
+        stale_url = data['charts']['bar_chart'].replace(data['charts']['bar_chart'].split('/')[-1].split('.')[0], '0' * 32)
+        assert client.get(stale_url).status_code == 404
+        # ... and only for URLs this app issued
+        cache.clear()
+        assert client.get(data['charts']['bar_chart'].replace('num_records=5', 'num_records=6')).status_code == 404
+
+        # Clients cannot ask for more posts than API_MAX_RECORDS
+        huge = client.get('/api/sentiment/results', query_string={'topic': 'api', 'num_records': 10 ** 6}).get_json()
+        assert huge['limit'] == client.application.config['API_MAX_RECORDS']
+
+def test_incremental_refresh_fetches_only_newer_posts(client):
+    from app.pipeline import analyze_topic
+    from app.storage import get_refresh_state
+
+    def listing(*ids):
+        return [{"id": f"inc{i}", "title": f"Post {i}", "content": "Fresh posts are lovely", "created_utc": 1700000000 + i}
+                for i in sorted(ids, reverse=True)]
+
+    consumed = []
+
+    def fetch(topic, limit, stream=False, on_error=None):
+        for post in feed:
+            consumed.append(post['id'])
+            yield post
+        if outage:
+            on_error(RuntimeError("Reddit is down"))
+
+    outage = False
+    with client.application.app_context(), patch('app.pipeline.fetch_reddit_data', side_effect=fetch) as mock_fetch:
+        feed = listing(1, 2, 3)
+        results, source = analyze_topic('incremental', 10)
+        assert source == 'reddit' and len(results) == 3
+        assert get_refresh_state('incremental').newest_post_id == 'inc3'
+
+        # Fresh topics are answered from the database without calling Reddit
+        feed = listing(1, 2, 3, 4, 5)
+        results, source = analyze_topic('incremental', 10, refresh_ttl=3600)
+        assert source == 'database' and mock_fetch.call_count == 1
+
+        # Stale topics fetch past the high-water mark only, then merge with stored rows
+        consumed.clear()
+        results, source = analyze_topic('incremental', 10, refresh_ttl=0)
+        assert source == 'reddit'
+        assert consumed == ['inc5', 'inc4', 'inc3']
+        assert sorted(r['title'] for r in results[:2]) == ['Post 4', 'Post 5']
+        assert sorted(r['title'] for r in results) == ['Post 1', 'Post 2', 'Post 3', 'Post 4', 'Post 5']
+        assert SentimentAnalysis.query.filter_by(topic='incremental').count() == 5
+        assert get_refresh_state('incremental').newest_post_id == 'inc5'
+
+        # A failed fetch leaves the topic stale, so the next request retries it
+        refreshed_at = get_refresh_state('incremental').refreshed_at
+        outage, feed = True, []
+        results, source = analyze_topic('incremental', 10, refresh_ttl=0)
+        assert source == 'database' and len(results) == 5
+        assert get_refresh_state('incremental').refreshed_at == refreshed_at
+        outage = False
+        analyze_topic('incremental', 10, refresh_ttl=0)
+        assert get_refresh_state('incremental').refreshed_at > refreshed_at
+
+def test_rollups_track_ingest_and_serve_downsampled_trends(client):
+    import numpy as np
+    from app.models import SentimentRollup
+
+    base = 1767225600  # 2026-01-01T00:00:00Z
+    posts = [
+        {"id": f"tr{i}", "title": f"Trend {i}", "content": "text", "sentiment": label, "score": score, "created_utc": base + offset}
+        for i, (offset, label, score) in enumerate([
+            (60, 'POSITIVE', 0.5), (120, 'NEGATIVE', -0.25), (3600 + 5, 'NEUTRAL', 0.0), (86400 + 10, 'POSITIVE', 0.75)
+        ])
+    ]
+    with client.application.app_context():
+        upsert_sentiment_results('trend', posts)
+        # Re-ingesting a post with a new score replaces its contribution
+        upsert_sentiment_results('trend', [dict(posts[1], sentiment='POSITIVE', score=0.25)])
+        db.session.commit()
+        assert SentimentRollup.query.filter_by(topic='trend', granularity='hour').count() == 3
+        day = SentimentRollup.query.filter_by(topic='trend', granularity='day').order_by(SentimentRollup.bucket_start).first()
+        assert (day.post_count, day.positive_count, day.negative_count, day.neutral_count) == (3, 2, 0, 1)
+
+    query = {'topic': 'Trend', 'start': '2026-01-01T00:00:00', 'end': '2026-01-03T00:00:00'}
+    hourly = client.get('/api/sentiment/trend', query_string=query).get_json()
+    assert hourly['granularity'] == 'hour'
+    assert [p['post_count'] for p in hourly['points']] == [2, 1, 1]
+    assert hourly['points'][0]['start'] == '2026-01-01T00:00:00'
+    assert hourly['points'][0]['mean_score'] == pytest.approx(0.375)
+    assert hourly['points'][0]['score_variance'] == pytest.approx(np.var([0.5, 0.25]))
+
+    # Downsampling merges buckets into exact totals
+    merged = client.get('/api/sentiment/trend', query_string=dict(query, granularity='hour', points=2)).get_json()
+    assert [p['post_count'] for p in merged['points']] == [3, 1]
+    assert merged['points'][0]['mean_score'] == pytest.approx(0.25)
+    assert merged['points'][0]['score_variance'] == pytest.approx(np.var([0.5, 0.25, 0.0]))
+
+    daily = client.get('/api/sentiment/trend', query_string=dict(query, granularity='day')).get_json()
+    assert [p['sentiment_counts']['POSITIVE'] for p in daily['points']] == [2, 1]
+    assert client.get('/api/sentiment/trend', query_string=dict(query, granularity='week')).status_code == 400
+    for points in ('0', '-1', 'many'):
+        assert client.get('/api/sentiment/trend', query_string=dict(query, points=points)).status_code == 400
+
+    # Rows saved before rollups existed are backfilled once, and re-ingesting
+    # one before that does not subtract what was never counted
+    from datetime import datetime, timezone
+    from app.storage import backfill_rollups
+    with client.application.app_context():
+        created_utc = base + 4 * 86400 + 45000
+        created = datetime.fromtimestamp(created_utc, timezone.utc).replace(tzinfo=None)
+        db.session.add_all([
+            SentimentAnalysis(topic='legacy', post_id=f'old{i}', title='Old', content='text', sentiment='POSITIVE', score=0.5, reddit_created_at=created)
+            for i in range(2)
+        ])
+        db.session.commit()
+        upsert_sentiment_results('legacy', [{"id": "old0", "title": "Old", "content": "text", "sentiment": "NEGATIVE", "score": -0.5, "created_utc": created_utc}])
+        db.session.commit()
+        assert backfill_rollups() == 1
+        assert backfill_rollups() == 0
+        hour = SentimentRollup.query.filter_by(topic='legacy', granularity='hour').one()
+        assert (hour.post_count, hour.positive_count, hour.negative_count) == (2, 1, 1)
+
+def test_init_db_moves_rows_stored_under_unnormalized_topics(client):
+    from datetime import datetime
+    from app.models import SentimentRollup, TopicRefreshState
+
+    with client.application.app_context():
+        db.session.add_all([
+            SentimentAnalysis(topic=topic, post_id=post_id, title='Old', content='text', sentiment='POSITIVE', score=0.5)
+            for topic, post_id in [('Quantum  Computing ', 'qc1'), ('Quantum  Computing ', 'qc2'), ('quantum computing', 'qc2'), ('quantum computing ', None)]
+        ])
+        db.session.add(TopicRefreshState(topic='Quantum  Computing ', newest_post_id='qc2', refreshed_at=datetime(2026, 1, 1)))
+        db.session.commit()
+
+        init_db()
+        rows = SentimentAnalysis.query.filter(SentimentAnalysis.topic.like('%uantum%')).all()
+        assert sorted((row.topic, row.post_id or '') for row in rows) == [
+            ('quantum computing', ''), ('quantum computing', 'qc1'), ('quantum computing', 'qc2')
+        ]
+        assert db.session.get(TopicRefreshState, 'quantum computing').newest_post_id == 'qc2'
+        assert TopicRefreshState.query.count() == 1
+        day = SentimentRollup.query.filter_by(topic='quantum computing', granularity='day').one()
+        assert (day.post_count, day.positive_count) == (3, 3)
+
+    with patch('app.pipeline.fetch_reddit_data', return_value=[]):
+        response = client.get('/api/sentiment/results', query_string={'topic': 'Quantum Computing', 'num_records': 10})
+    assert response.get_json()['total'] == 3
+
+def test_bulk_cli_streams_checkpoints_and_resumes(tmp_path):
+    import os
+    import numpy as np
+    from app.bulk import ColumnarWriter, main, run_bulk
+
+    dump = tmp_path / 'dump.jsonl'
+    lines = [json.dumps({"id": f"b{i}", "title": f"Bulk {i}", "selftext": "What a great day" if i % 2 else "This is awful", "created_utc": 1700000000 + i}) for i in range(7)]
+    lines.insert(3, '{not json')
+    dump.write_text('\n'.join(lines) + '\n')
+    checkpoint = tmp_path / 'progress.json'
+
+    class FailingWriter(ColumnarWriter):
+        def write(self, results, end_offset):
+            if self.writes == 2:
+                raise KeyboardInterrupt
+            self.writes += 1
+            super().write(results, end_offset)
+
+    writer = FailingWriter(str(tmp_path / 'parts'))
+    writer.writes = 0
+    with pytest.raises(KeyboardInterrupt):
+        run_bulk(str(dump), writer, str(checkpoint), batch_size=2, max_workers=1)
+    assert json.loads(checkpoint.read_text())['posts'] == 4
+
+    summary = run_bulk(str(dump), ColumnarWriter(str(tmp_path / 'parts')), str(checkpoint), batch_size=2, max_workers=1)
+    assert (summary['posts'], summary['skipped'], summary['scored_this_run']) == (7, 1, 3)
+    parts = [np.load(path) for path in sorted((tmp_path / 'parts').glob('*.npz'))]
+    ids = np.concatenate([part['id'] for part in parts])
+    sentiments = np.concatenate([part['sentiment'] for part in parts])
+    assert ids.tolist() == [f"b{i}" for i in range(7)]
+    assert sentiments.tolist() == ['NEGATIVE' if i % 2 == 0 else 'POSITIVE' for i in range(7)]
+
+    with patch.dict(os.environ):
+        database = tmp_path / 'bulk.db'
+        # The checkpoint of the columnar run does not apply to a database output
+        assert main([str(dump), '--database', f'sqlite:///{database}', '--topic', 'archive', '--workers', '1', '--checkpoint', str(checkpoint)]) == 0
+        import sqlite3
+        with sqlite3.connect(database) as connection:
+            assert connection.execute("SELECT count(*) FROM sentiment_analysis WHERE topic = 'archive'").fetchone()[0] == 7
+
+    # Restarting discards the parts of earlier runs
+    stale = tmp_path / 'parts' / 'part-9999999999999999.npz'
+    stale.write_bytes(b'')
+    run_bulk(str(dump), ColumnarWriter(str(tmp_path / 'parts')), str(checkpoint), batch_size=4, max_workers=1, restart=True)
+    assert not stale.exists() and len(list((tmp_path / 'parts').glob('*.npz'))) == 2
+
+def test_comment_trees_are_expanded_within_budget_and_stored(client, fake_reddit):
+    from app.fetch_reddit_data import fetch_comments
+    from app.models import CommentSentiment
+
+    fake_reddit.listings['all'] = [fake_post('s1', 1700000100), fake_post('s2', 1700000000)]
+    fake_reddit.comments['s1'] = [
+        fake_comment('c1', 't3_s1', 'I love this idea', replies=[fake_comment('c2', 't1_c1', 'It is terrible')]),
+        fake_more('t3_s1', ['c3', 'c4'])
+    ]
+    fake_reddit.comments['s2'] = [fake_more('t3_s2', ['c5'])]
+    fake_reddit.more = {
+        'c3': fake_comment('c3', 't3_s1', 'Great work everyone'),
+        'c4': fake_comment('c4', 't1_c3', 'Awful, just awful'),
+        'c5': fake_comment('c5', 't3_s2', 'Pretty good')
+    }
+
+    # The comment budget stops expansion before the "load more" stub is requested
+    budgeted = list(fetch_comments(['s1'], max_comments=2))
+    assert [(c['id'], c['parent_id']) for c in budgeted] == [('c1', 't3_s1'), ('c2', 't1_c1')]
+    # So does the time budget
+    assert list(fetch_comments(['s2'], time_budget=0)) == []
+    assert not any(path.startswith('/api/morechildren') for _, path in fake_reddit.requests)
+
+    response = client.get('/api/sentiment/results', query_string={'topic': 'comments', 'num_records': 2, 'comments': 'true'})
+    comments = response.get_json()['comments']
+    assert comments['total'] == 5
+    assert comments['sentiment_counts'] == {'POSITIVE': 3, 'NEUTRAL': 0, 'NEGATIVE': 2}
+    with client.application.app_context():
+        stored = {c.comment_id: c.parent_id for c in CommentSentiment.query.all()}
+        assert stored == {'c1': 't3_s1', 'c2': 't1_c1', 'c3': 't3_s1', 'c4': 't1_c3', 'c5': 't3_s2'}
+
+        # Expanded submissions are read from the database next time
+        from app.pipeline import analyze_comments
+        fetched = len(fake_reddit.requests)
+        assert len(analyze_comments('comments', 2)) == 5
+        assert len(fake_reddit.requests) == fetched
+
+        # Databases without ON CONFLICT upserts go through the per-row path
+        from app.storage import upsert_comment_results
+        analysis_id = SentimentAnalysis.query.filter_by(topic='comments', post_id='s2').one().id
+        comment = {'id': 'c6', 'submission_id': 's2', 'parent_id': 't3_s2', 'content': 'Fine', 'sentiment': 'NEUTRAL', 'score': 0.0}
+        with patch.object(db.engine.dialect, 'name', 'mysql'):
+            upsert_comment_results({'s2': analysis_id}, [comment])
+        assert CommentSentiment.query.filter_by(comment_id='c6').one().analysis_id == analysis_id
+
+def test_columnar_results_aggregate_and_load_content_lazily(client):
+    from app.results import SentimentResults
+    from app.storage import load_recent_results
+
+    posts = [
+        {"id": str(i), "title": f"Post {i}", "content": text, "created_utc": 1700000000 + i}
+        for i, text in enumerate(["I love this", "This is terrible", "A table", "Great, wonderful"])
+    ]
+    results = analyze_sentiment(posts)
+    assert isinstance(results, SentimentResults)
+    assert results.sentiment_counts() == {'NEGATIVE': 1, 'NEUTRAL': 1, 'POSITIVE': 2}
+    assert dict(results[1]) == {
+        "title": "Post 1", "content": "This is terrible", "sentiment": "NEGATIVE",
+        "score": results[1]['score'], "id": "1", "created_utc": 1700000001
+    }
+    assert results == results.to_dicts()
+    assert SentimentResults.concat([results[:1], results[1:]]) == results
+
+    with client.application.app_context():
+        upsert_sentiment_results('columnar', results)
+        db.session.commit()
+        loaded = load_recent_results('columnar', 3)
+        assert loaded.sentiments.tolist() == ['POSITIVE', 'NEUTRAL', 'NEGATIVE']
+        assert loaded.mean_score() == pytest.approx(results.scores[1:].mean())
+        # Content is only read from the database on first access
+        assert loaded._content is None
+        assert loaded[2]['content'] == 'This is terrible'
+        assert loaded.content == ['Great, wonderful', 'A table', 'This is terrible']
+
+def test_compare_fetches_topics_concurrently_and_scores_shared_posts_once(client):
+    import time
+    import app.pipeline
+
+    def post(post_id, text):
+        return {"id": post_id, "title": post_id, "content": text, "url": None, "created_utc": 1700000000}
+
+    listings = {
+        'cats': [post('shared', 'I love pets'), post('c1', 'Cats are wonderful')],
+        'dogs': [post('shared', 'I love pets'), post('d1', 'Dogs are terrible')],
+        'fish': [post('f1', 'A fish tank')]
+    }
+
+    windows = []
+
+    def search(topic, limit, on_error=None):
+        started = time.perf_counter()
+        time.sleep(0.2)
+        windows.append((started, time.perf_counter()))
+        return iter(listings[topic])
+
+    scored = []
+
+    def analyze(posts):
+        scored.extend(p['id'] for p in posts)
+        return analyze_sentiment(posts)
+
+    with patch('app.fetch_reddit_data.iter_reddit_data', side_effect=search), \
+            patch.object(app.pipeline, 'analyze_sentiment', side_effect=analyze):
+        response = client.get('/api/sentiment/compare', query_string={'topics': 'Cats,dogs', 'topic': 'fish', 'num_records': 5})
+
+    assert response.status_code == 200
+    data = response.get_json()
+    # Searches overlap, and the post found under two topics is scored once
+    assert max(start for start, _ in windows) < min(end for _, end in windows)
+    assert sorted(scored) == ['c1', 'd1', 'f1', 'shared']
+    assert [entry['topic'] for entry in data['topics']] == ['fish', 'cats', 'dogs']
+    assert [entry['total'] for entry in data['topics']] == [1, 2, 2]
+    assert data['topics'][2]['sentiment_counts'] == {'POSITIVE': 1, 'NEUTRAL': 0, 'NEGATIVE': 1}
+    assert client.get(data['chart']).status_code == 200
+    with client.application.app_context():
+        assert SentimentAnalysis.query.filter_by(post_id='shared').count() == 2
+
+    # Stale stored topics stop paging at their high-water mark
+    consumed = []
+
+    def search_newer(topic, limit, on_error=None):
+        for item in [dict(post(f'{topic}-new', 'Fresh news'), created_utc=1700000001)] + listings[topic]:
+            consumed.append(item['id'])
+            yield item
+
+    with client.application.app_context(), patch('app.fetch_reddit_data.iter_reddit_data', side_effect=search_newer):
+        compared = app.pipeline.compare_topics(['cats', 'fish'], 5, refresh_ttl=0)
+    assert sorted(consumed) == ['cats-new', 'f1', 'fish-new', 'shared']
+    assert [len(compared[topic][0]) for topic in ('cats', 'fish')] == [3, 2]
+
+    assert client.get('/api/sentiment/compare', query_string={'topic': 'cats'}).status_code == 400
+
+def test_logging_is_queued_json_with_request_ids(client):
+    import logging
+    import uuid
+    from app import logger as app_logging
+
+    app_logger = app_logging.configure_logger()
+    assert app_logging.configure_logger() is app_logger
+    assert sum(isinstance(h, app_logging.QueueHandler) for h in app_logger.handlers) == 1
+
+    # Unique per run, since the log file outlives the test
+    request_id = f'req-{uuid.uuid4().hex}'
+
+    def fetch(topic, limit, stream=False, on_error=None):
+        # Runs in the prefetch thread
+        logging.getLogger('app.fetch_reddit_data').warning('Fetching from a worker thread')
+        yield from []
+
+    with patch('app.pipeline.fetch_reddit_data', side_effect=fetch):
+        response = client.get('/api/sentiment/results', query_string={'topic': 'logging'}, headers={'X-Request-ID': request_id})
+    assert response.headers['X-Request-ID'] == request_id
+
+    # Records are written by the listener thread; wait for it to catch up
+    app_logging._listener.queue.join()
+    with open(app_logging.os.path.join(app_logging.LOG_DIR, app_logging.LOG_FILE)) as log_file:
+        records = [json.loads(line) for line in log_file if request_id in line]
+    assert {record['logger'] for record in records} >= {'app.routes', 'app.requests', 'app.fetch_reddit_data'}
+    request_record = next(record for record in records if record['logger'] == 'app.requests')
+    assert request_record['status'] == 200 and {'db_read', 'fetch'} <= set(request_record['stages_ms'])
+    assert app_logging.current_request_id() is None
+
+    # Stage totals shared by the request's threads lose no updates
+    from concurrent.futures import ThreadPoolExecutor
+    from app.metrics import StageTotals
+    totals = StageTotals()
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        for _ in range(8):
+            executor.submit(lambda: [totals.add('fetch', 1.0) for _ in range(10000)])
+    assert totals.snapshot() == {'fetch': 80000.0}
+
+    sampler = app_logging.RequestContextFilter(debug_sample_rate=0)
+    assert not sampler.filter(logging.makeLogRecord({'levelno': logging.DEBUG}))
+    assert sampler.filter(logging.makeLogRecord({'levelno': logging.INFO}))